@@ -13,9 +13,10 @@ Features:
 - JWT authentication
 - Real-time dashboard statistics
 """
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Header
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -25,7 +26,14 @@ import os
 import io
 import time
 import uuid
-from PIL import Image, ImageOps
+import copy
+import json
+import asyncio
+import tarfile
+import zipfile
+import mimetypes
+from dataclasses import dataclass, field
+from PIL import Image
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 import cv2
@@ -34,7 +42,7 @@ import base64
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import bcrypt
 # Add these imports at the top if not already present
 from pydantic import BaseModel, EmailStr, Field
@@ -45,11 +53,24 @@ import bcrypt
 load_dotenv()
 
 # Import local modules
-from services.yolo_service import predict_pil_image, init_model
-from services import storage
+from services.yolo_service import (
+    init_model,
+    resolve_weights,
+    class_names,
+    detections_to_dicts,
+    detections_to_boxes,
+    model_version,
+    serving_backend,
+    request_model_version,
+    capture_activations,
+    request_activation,
+    config_tag as yolo_cam_tag,
+    ActivationMap,
+    scheduler as inference_scheduler
+)
+from services import storage, metrics, pipeline, model_workers, result_cache, tiling, cascade, uploads, explain_jobs, detect_jobs, artifacts, encoding, decoding, admission, write_behind, occlusion_shap
 from services.explainability_services import (
     generate_gradcam_heatmap, 
-    generate_shap_explanation,
     generate_combined_explanation
 )
 from db import pg
@@ -59,6 +80,9 @@ from auth import (
     authenticate_user, 
     create_access_token, 
     get_current_active_user,
+    get_user_from_token,
+    require_admin,
+    require_metrics_access,
     UserLogin, 
     Token,
     ACCESS_TOKEN_EXPIRE_MINUTES
@@ -97,6 +121,11 @@ class UserResponse(BaseModel):
     email: str
     role: str
     is_active: bool
+
+class ModelSwapRequest(BaseModel):
+    """Hot-swap request: weights file to load and warm-up inferences to run first"""
+    weights: str = Field(..., min_length=1)
+    warmup_runs: int = Field(3, ge=0, le=20)
 # ============================================================================
 # APPLICATION LIFECYCLE
 # ============================================================================
@@ -118,12 +147,28 @@ async def lifespan(app: FastAPI):
     if os.getenv("POSTGRES_DSN"):
         await pg.init_pool()
         print("✅ Database connected: IUProjectLocal")
+        if result_cache.RESULT_CACHE_PERSIST:
+            await pg.ensure_detection_cache_table()
+        if write_behind.enabled():
+            await write_behind.buffer.start()
     else:
         print("⚠️  POSTGRES_DSN not set - Database will not be used!")
     
-    # Initialize YOLO model
-    init_model()
-    print(f"✅ YOLO model loaded: {os.getenv('YOLO_WEIGHTS', 'models/best.pt')}")
+    # Initialize YOLO model (in-process, or one copy per worker process)
+    pipeline.start()
+    worker_pool = None
+    if model_workers.INFERENCE_WORKERS > 0:
+        # export once here so worker processes never race on the ONNX/OpenVINO export
+        worker_pool = model_workers.start_pool(resolve_weights(), model_version())
+    if worker_pool is None:
+        init_model()
+        print(f"✅ YOLO model loaded: {os.getenv('YOLO_WEIGHTS', 'models/best.pt')} ({'/'.join(serving_backend())})")
+    await inference_scheduler.start(executor=pipeline.cpu_executor(), worker_pool=worker_pool)
+    if explain_jobs.deferred_enabled():
+        await explain_jobs.queue.start()
+    else:
+        print(f"ℹ️  Explainability runs inline (EXPLAIN_MODE={explain_jobs.EXPLAIN_MODE}, needs Postgres + S3 to defer)")
+    await detect_jobs.queue.start(run_detection_job)
     
     # Check S3
     if os.getenv("S3_BUCKET_NAME"):
@@ -137,6 +182,14 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("\n🧹 Shutting down...")
+    await detect_jobs.queue.stop()
+    # before the scheduler: it would fail the jobs' queued SHAP variants
+    await explain_jobs.queue.stop()
+    await inference_scheduler.stop()
+    await write_behind.buffer.stop()
+    await uploads.drain()
+    model_workers.stop_pool()
+    pipeline.shutdown()
     if os.getenv("POSTGRES_DSN"):
         await pg.close_pool()
     print("👋 Goodbye!\n")
@@ -161,20 +214,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(admission.Rejected)
+async def admission_rejected(request, exc: admission.Rejected):
+    """Shed load: 429 (queue full) / 503 (waited too long) with Retry-After"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={'detail': exc.detail},
+        headers={'Retry-After': str(exc.retry_after)}
+    )
+
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
-def pil_from_bytes(b: bytes):
-    """Convert bytes to PIL Image"""
-    img = Image.open(io.BytesIO(b))
-    return ImageOps.exif_transpose(img).convert("RGB")
+NON_DAMAGE_CLASSES = ['no_damage', 'none', 'normal', 'good', 'clean', 'undamaged']
 
-def image_to_base64(image_array):
-    """Convert numpy array to base64 data URL"""
-    _, buffer = cv2.imencode('.jpg', image_array, [cv2.IMWRITE_JPEG_QUALITY, 90])
-    img_str = base64.b64encode(buffer).decode()
-    return f"data:image/jpeg;base64,{img_str}"
+def damage_mask(detections, names):
+    """Boolean mask of detections that are actual damage (not 'undamaged' etc.)"""
+    non_damage_ids = [cid for cid, name in names.items() if name.lower() in NON_DAMAGE_CLASSES]
+    return ~np.isin(detections['cls'], non_damage_ids)
 
 def get_severity_and_color(confidence: float):
     """Determine severity based on confidence"""
@@ -205,50 +263,58 @@ def calculate_iou(bbox1, bbox2):
     
     return inter_area / union_area if union_area > 0 else 0.0
 
-def group_overlapping_detections(predictions, iou_threshold=0.5):
-    """Group overlapping detections for multi-label"""
-    if len(predictions) == 0:
+def pairwise_iou(xyxy: np.ndarray) -> np.ndarray:
+    """IoU matrix for an (N, 4) array of boxes"""
+    x1, y1, x2, y2 = [xyxy[:, k] for k in range(4)]
+    inter_w = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    inter = inter_w * inter_h
+    area = (x2 - x1) * (y2 - y1)
+    union = area[:, None] + area[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter, dtype=np.float64), where=union > 0)
+
+def group_overlapping_detections(detections, iou_threshold=0.5):
+    """
+    Group overlapping detections for multi-label
+
+    Takes a DETECTION_DTYPE array and returns a list of index arrays, one
+    per group, with the group's anchor detection first.
+    """
+    n = len(detections)
+    if n == 0:
         return []
     
+    overlaps = pairwise_iou(detections['xyxy'].astype(np.float64)) > iou_threshold
+    used = np.zeros(n, dtype=bool)
+    later = np.triu(np.ones((n, n), dtype=bool), k=1)
     groups = []
-    used = set()
     
-    for i, pred1 in enumerate(predictions):
-        if i in used:
+    for i in range(n):
+        if used[i]:
             continue
-        
-        group = [pred1]
-        bbox1 = pred1['bbox']
-        
-        for j, pred2 in enumerate(predictions):
-            if i >= j or j in used:
-                continue
-            
-            bbox2 = pred2['bbox']
-            iou = calculate_iou(bbox1, bbox2)
-            
-            if iou > iou_threshold:
-                group.append(pred2)
-                used.add(j)
-        
-        groups.append(group)
-        used.add(i)
+        members = np.flatnonzero(overlaps[i] & later[i] & ~used)
+        used[members] = True
+        used[i] = True
+        groups.append(np.concatenate(([i], members)))
     
     return groups
 
-def draw_detections_on_image(img_array, predictions):
-    """Draw bounding boxes with multi-label support"""
+def draw_detections_on_image(img_array, detections, names=None):
+    """Draw bounding boxes with multi-label support (DETECTION_DTYPE array)"""
     annotated = img_array.copy()
-    grouped_preds = group_overlapping_detections(predictions)
+    names = names if names is not None else class_names()
+    grouped = group_overlapping_detections(detections)
+    boxes = detections['xyxy'].astype(int)
+    scores = detections['conf']
+    labels = [names.get(c, str(c)) for c in detections['cls'].tolist()]
     
-    for group in grouped_preds:
+    for group in grouped:
         if len(group) == 0:
             continue
         
-        bbox = group[0]['bbox']
-        x1, y1, x2, y2 = [int(v) for v in bbox]
+        x1, y1, x2, y2 = boxes[group[0]].tolist()
         
-        max_conf = max(p['score'] for p in group)
+        max_conf = float(scores[group].max())
         severity, hex_color, bgr_color = get_severity_and_color(max_conf)
         
         # Draw rectangle
@@ -256,10 +322,10 @@ def draw_detections_on_image(img_array, predictions):
         
         # Create label
         if len(group) == 1:
-            label = f"{group[0]['class_name']} {group[0]['score']*100:.1f}%"
+            label = f"{labels[group[0]]} {scores[group[0]]*100:.1f}%"
         else:
-            damage_names = [p['class_name'] for p in group]
-            avg_conf = sum(p['score'] for p in group) / len(group)
+            damage_names = [labels[k] for k in group]
+            avg_conf = float(scores[group].mean())
             label = f"{' & '.join(damage_names)} {avg_conf*100:.1f}%"
         
         # Draw label background and text
@@ -278,6 +344,22 @@ def draw_detections_on_image(img_array, predictions):
     
     return annotated
 
+def draw_clean_package(img_array):
+    """Draw the green verification border for undamaged packages"""
+    annotated = img_array.copy()
+    h, w = annotated.shape[:2]
+    # Draw green border around entire image
+    cv2.rectangle(annotated, (10, 10), (w-10, h-10), (136, 255, 0), 8)
+    # Add "UNDAMAGED" text
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    text = "UNDAMAGED"
+    (text_width, text_height), _ = cv2.getTextSize(text, font, 1.0, 2)
+    x = (w - text_width) // 2
+    y = text_height + 30
+    cv2.rectangle(annotated, (x-15, y-text_height-10), (x+text_width+15, y+8), (136, 255, 0), -1)
+    cv2.putText(annotated, text, (x, y), font, 1.0, (0, 0, 0), 2)
+    return annotated
+
 # ============================================================================
 # AUTHENTICATION SETUP
 # ===============================================-=============================
@@ -397,352 +479,1060 @@ async def get_current_user_info(current_user: dict = Depends(get_current_active_
 # DETECTION ENDPOINT
 # ============================================================================
 
-@app.post("/api/detect")
-async def detect(
-    file: UploadFile = File(...), 
-    tracking_code: str = None,
-    current_user: dict = Depends(get_current_active_user)
-):
-    """
-    Complete damage detection with explainability
-    
-    Process:
-    1. Upload original image to S3
-    2. Run YOLO detection
-    3. Save package to PostgreSQL
-    4. Save image record with S3 URLs
-    5. Upload crops to S3
-    6. Save predictions to PostgreSQL
-    7. Generate annotated image → S3
-    8. Generate GradCAM → S3
-    9. Generate SHAP → S3
-    10. Return all results
-    """
-    
-    print("\n" + "="*80)
-    print(f"🚀 NEW DETECTION REQUEST - {datetime.utcnow().isoformat()}")
-    print("="*80)
-    print(f"👤 User: {current_user.get('username', 'Unknown')} (ID: {current_user.get('user_id', 'N/A')})")
-    print(f"📁 File: {file.filename}")
-    print(f"📏 Size: {file.size if hasattr(file, 'size') else 'Unknown'}")
-    print(f"🎨 Content-Type: {file.content_type}")
-    
-    if not file.content_type.startswith("image/"):
-        
-        raise HTTPException(status_code=400, detail="File must be an image")
+# S3 artifacts of a detect response: upload name -> (url field, key field)
+ARTIFACT_FIELDS = {
+    'original': ('original_s3_url', 'original_s3_key'),
+    'annotated': ('annotated_s3_url', 'annotated_s3_key'),
+    'gradcam': ('gradcam_s3_url', 'gradcam_s3_key'),
+    'shap': ('shap_s3_url', 'shap_s3_key'),
+}
 
-    # Read image
-    content = await file.read()
-    img = pil_from_bytes(content)
-    img_array = np.array(img)
-    w, h = img.size
-    t0 = time.time()
+# /api/detect/batch limits
+BATCH_DETECT_MAX_ITEMS = int(os.getenv("BATCH_DETECT_MAX_ITEMS", 200))
+BATCH_DETECT_CHUNK = int(os.getenv("BATCH_DETECT_CHUNK", inference_scheduler.max_batch_size))
+# uncompressed bytes: per image and for the whole batch (archives are checked before inflating)
+BATCH_DETECT_MAX_IMAGE_BYTES = int(os.getenv("BATCH_DETECT_MAX_IMAGE_BYTES", 50 * 1024 * 1024))
+BATCH_DETECT_MAX_BYTES = int(os.getenv("BATCH_DETECT_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
 
-    # Generate tracking code
-    if not tracking_code:
-        date_str = datetime.utcnow().strftime('%Y%m%d')
-        unique_id = str(uuid.uuid4())[:8].upper()
-        tracking_code = f"PKG-{date_str}-{unique_id}"
-    
-    print(f"📦 Tracking Code: {tracking_code}")
+# How annotated/GradCAM/SHAP images are returned:
+#   inline    - base64 data URLs in the JSON (default, original behaviour)
+#   url       - short-lived signed /api/artifacts URLs (see services/artifacts.py)
+#   multipart - multipart/mixed: JSON part + one image/jpeg part per image
+IMAGE_MODES = ('inline', 'url', 'multipart')
+DETECT_IMAGE_MODE = os.getenv("DETECT_IMAGE_MODE", "inline").lower()
+IMAGE_FIELDS = {'annotated_image_url': 'annotated', 'gradcam_url': 'gradcam', 'shap_url': 'shap'}
 
-    # STEP 1: Upload original to S3
-    orig_s3_url = None
-    orig_s3_key = None
-    
-    if os.getenv("S3_BUCKET_NAME"):
-        try:
-            orig_s3_key = storage.generate_s3_key(os.getenv("S3_BUCKET_NAME"),'uploads',file.filename)
-            orig_s3_url = storage.upload_bytes_to_s3(orig_s3_key, content, file.content_type)
-            print(f"☁️  Original uploaded to S3: {orig_s3_key}")
-        except Exception as e:
-            print(f"⚠️  S3 upload failed: {e}")
+@dataclass
+class Inspection:
+    """Everything the detect pipeline produces for one image before it is returned"""
+    tracking_code: str
+    filename: str
+    content_type: str
+    img: Image.Image
+    img_array: np.ndarray
+    cache_key: str
+    image_mode: str = 'inline'
+    decode_scale: int = 1
+    original_size: Optional[Tuple[int, int]] = None  # (width, height) of the uploaded photo
+    timer: metrics.StageTimer = field(default_factory=metrics.StageTimer)
+    started: float = field(default_factory=time.time)
+    uploads: uploads.UploadBatch = field(default_factory=uploads.UploadBatch)
+    dets: Optional[np.ndarray] = None
+    activation: Optional[ActivationMap] = None  # EigenCAM of the detection pass, if captured
+    cascade_stage: Optional[str] = None
+    model_version: Optional[str] = None
+    damage_dets: Optional[np.ndarray] = None
+    damage_preds: List[Dict] = field(default_factory=list)
+    status: str = "passed"
+    severity: str = "secondary"
+    damage_type_str: str = "None"
+    max_confidence: float = 0.0
+    processed_preds: List[Dict] = field(default_factory=list)
+    annotated_url: Optional[str] = None
+    gradcam_url: Optional[str] = None
+    shap_url: Optional[str] = None
+    explanation_status: Optional[str] = None
+    artifacts: Dict = field(default_factory=dict)
+    uploads_pending: bool = False
+    package_id: Optional[int] = None
+    image_id: Optional[int] = None
+    prediction_ids: List[Optional[int]] = field(default_factory=list)
+    persisted: Optional[asyncio.Future] = None  # write-behind: resolves once the rows are committed
 
-    # STEP 2: Run YOLO detection
-    print("\n🤖 Running YOLO detection...")
-    preds = predict_pil_image(
-        img, 
-        imgsz=int(os.getenv("IMG_SZ", 640)), 
-        conf=float(os.getenv("CONF_THRESH", 0.25))
+def new_tracking_code() -> str:
+    date_str = datetime.utcnow().strftime('%Y%m%d')
+    unique_id = str(uuid.uuid4())[:8].upper()
+    return f"PKG-{date_str}-{unique_id}"
+
+def detection_settings():
+    """(imgsz, conf_thresh) used for every detection"""
+    return int(os.getenv("IMG_SZ", 640)), float(os.getenv("CONF_THRESH", 0.25))
+
+def resolve_image_mode(image_mode: Optional[str]) -> str:
+    image_mode = (image_mode or DETECT_IMAGE_MODE).lower()
+    if image_mode not in IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"image_mode must be one of {', '.join(IMAGE_MODES)}")
+    return image_mode
+
+async def cached_detection(content: bytes, username: str, image_mode: str = 'inline'):
+    """Result-cache lookup for an upload -> (cache_key, cached response or None)"""
+    request_started = time.time()
+    imgsz, conf_thresh = detection_settings()
+    digest = await pipeline.run_cpu(result_cache.content_hash, content)
+    # url and multipart responses share the signed-URL form
+    images = 'inline' if image_mode == 'inline' else 'ref'
+    cache_key = result_cache.cache_key(digest, f"{model_version()}|{tiling.config_tag()}|{cascade.config_tag()}|{decoding.config_tag()}|{yolo_cam_tag()}|{occlusion_shap.config_tag()}|images={images}", conf_thresh, imgsz)
+    cached = await result_cache.get(cache_key)
+    if cached is not None and images == 'ref':
+        # signed URLs of a cached result expire; issue fresh ones
+        for url_field in IMAGE_FIELDS:
+            if cached.get(url_field):
+                cached[url_field] = artifacts.resign(cached[url_field])
+                if cached[url_field] is None:
+                    cached = None
+                    break
+    if cached is not None:
+        print(f"⚡ Result cache hit ({digest[:12]}) - skipping inference and uploads")
+        cached.update({
+            'cached': True,
+            'inference_time_ms': int((time.time() - request_started) * 1000),
+            'timestamp': datetime.utcnow().isoformat(),
+            'inspector': username
+        })
+    return cache_key, cached
+
+async def start_inspection(content: bytes, filename: str, content_type: str, cache_key: str,
+                           tracking_code: str = None, image_mode: str = 'inline') -> Inspection:
+    """Decode an upload and start uploading the original"""
+    started = time.time()
+    timer = metrics.StageTimer()
+    # decoded straight to the smallest size inference and artifacts need
+    with timer.stage('decode'):
+        img, img_array, decode_scale, original_size = await pipeline.run_cpu(decoding.decode, content)
+    insp = Inspection(
+        tracking_code or new_tracking_code(), filename, content_type, img, img_array, cache_key,
+        image_mode, decode_scale, original_size, timer, started
     )
-    print(f"✅ Found {len(preds)} detections")
+    print(f"📦 Tracking Code: {insp.tracking_code}")
+    if os.getenv("S3_BUCKET_NAME"):
+        insp.uploads.add('original', 'uploads', filename, content, content_type)
+        print("☁️  Original upload started")
+    return insp
 
-    # Determine status - only count actual damage detections
-    damage_preds = [p for p in preds if p['class_name'].lower() not in ['no_damage', 'none', 'normal', 'good', 'clean', 'undamaged']]
-    
-    package_status = "passed"
-    primary_severity = "secondary"
-    primary_damage_type = "None"
-    max_confidence = 0.0
+async def run_inference(insp: Inspection, explain: bool = True):
+    """
+    Cascade / tiled / plain inference for one inspection.
+    explain keeps an EigenCAM map of the detection pass for the GradCAM
+    artifact (in-process torch models; tiled images fall back to boxes).
+    """
+    imgsz, conf_thresh = detection_settings()
+    w, h = insp.img.size
+    # high-resolution photo: sliced inference keeps small tears visible
+    full_stage = inference_scheduler.submit_tiled if tiling.should_tile(w, h) else inference_scheduler.submit
+    with insp.timer.stage('inference'), capture_activations(explain):
+        if cascade.CASCADE_ENABLED:
+            # low-res gate clears obviously clean packages; the rest escalate
+            insp.dets, insp.cascade_stage = await cascade.run(
+                inference_scheduler, insp.img, imgsz, conf_thresh,
+                damage_mask=lambda d: damage_mask(d, class_names()),
+                full_stage=full_stage
+            )
+            print(f"🚦 Cascade resolved at stage: {insp.cascade_stage}")
+        else:
+            insp.dets = await full_stage(
+                insp.img, 
+                imgsz=imgsz, 
+                conf=conf_thresh
+            )
+    # a hot-swap may land mid-request; record the model that actually ran
+    insp.model_version = request_model_version()
+    insp.activation = request_activation() if explain else None
+    print(f"✅ Found {len(insp.dets)} detections")
+
+def summarize_detections(insp: Inspection, names: Dict[int, str]):
+    """Package status/severity from the damage detections (not 'undamaged' etc.)"""
+    insp.damage_dets = insp.dets[damage_mask(insp.dets, names)]
     
-    if len(damage_preds) > 0:
-        top_pred = max(damage_preds, key=lambda p: p['score'])
-        max_confidence = top_pred['score']
-        primary_damage_type = top_pred['class_name']
+    if len(insp.damage_dets) > 0:
+        top = int(insp.damage_dets['conf'].argmax())
+        insp.max_confidence = float(insp.damage_dets['conf'][top])
         
-        if max_confidence >= 0.4:
-            package_status = "damaged"
+        if insp.max_confidence >= 0.4:
+            insp.status = "damaged"
         
-        primary_severity, _, _ = get_severity_and_color(max_confidence)
+        insp.severity, _, _ = get_severity_and_color(insp.max_confidence)
 
-    all_damage_types = list(set(p['class_name'] for p in damage_preds)) if damage_preds else ["None"]
-    damage_type_str = ", ".join(all_damage_types)
+    # per-box dicts are only needed for the response and DB rows; they use
+    # original-photo pixels (damage_dets stay in decoded pixels for rendering)
+    insp.damage_preds = detections_to_dicts(insp.damage_dets, names)
+    if insp.decode_scale > 1:
+        # reduced decodes round up, so scaled boxes can overshoot the photo by a few pixels
+        w, h = insp.original_size
+        for p in insp.damage_preds:
+            x1, y1, x2, y2 = [v * insp.decode_scale for v in p['bbox']]
+            p['bbox'] = [min(x1, w), min(y1, h), min(x2, w), min(y2, h)]
+    all_damage_types = list(set(p['class_name'] for p in insp.damage_preds)) if insp.damage_preds else ["None"]
+    insp.damage_type_str = ", ".join(all_damage_types)
 
     print(f"\n📊 Analysis:")
-    print(f"   Status: {package_status}")
-    print(f"   Severity: {primary_severity}")
-    print(f"   Damages: {damage_type_str}")
-    print(f"   Confidence: {max_confidence*100:.1f}%")
+    print(f"   Status: {insp.status}")
+    print(f"   Severity: {insp.severity}")
+    print(f"   Damages: {insp.damage_type_str}")
+    print(f"   Confidence: {insp.max_confidence*100:.1f}%")
 
-    # STEP 3 & 4: Save to database
-    package_id = None
-    image_id = None
+async def publish_image(insp: Inspection, name: str, image_array: np.ndarray, prefix: str, stem: str) -> str:
+    """
+    Encode a rendered image once (services/encoding.py) and share the
+    buffer: S3 upload plus the response value, a data URL in inline mode
+    or a signed artifact URL otherwise.
+    """
+    enc = await pipeline.run_cpu(encoding.encode, name, image_array)
     
-    if os.getenv("POSTGRES_DSN"):
-        try:
-            print("\n💾 Saving to database...")
-            
-            package_id = await pg.insert_package(
-                tracking_code, 
-                package_status, 
-                primary_severity, 
-                damage_type_str,
-                max_confidence,
-                datetime.utcnow(),
-                None,  # inspector_id
-                f"Detected by {current_user['username']}"
-            )
-            print(f"✅ Package saved (ID: {package_id})")
-            
-            # Save image (we'll update with other URLs later)
-            image_id = await pg.insert_image(
-                package_id, 
-                orig_s3_url,
-                orig_s3_key
-            )
-            print(f"✅ Image saved (ID: {image_id})")
-            
-        except Exception as e:
-            print(f"❌ Database error: {e}")
-            import traceback
-            traceback.print_exc()
-    else:
-        print("\n⚠️  Skipping database save - POSTGRES_DSN not configured")
+    key = None
+    if os.getenv("S3_BUCKET_NAME"):
+        key = insp.uploads.add(name, prefix, f"{stem}{enc.ext}", enc.data, enc.content_type)
+        print(f"☁️  {name.capitalize()} upload started")
+    if insp.image_mode == 'inline':
+        return enc.data_url()
+    return artifacts.store(enc.data, key, enc.content_type)
 
-    # STEP 5: Process predictions and upload crops - only process actual damages
-    boxes_for_explainability = []
-    processed_preds = []
+async def render_artifacts(insp: Inspection, names: Dict[int, str], explain: str = 'inline'):
+    """
+    Crops, annotated image and explanations for one inspection.
+
+    Each artifact goes to insp.uploads as soon as it is encoded.
+    explain: 'inline' renders GradCAM/SHAP now, 'later' leaves them to a
+    deferred job queued once the inspection is saved (queue_explanations).
+    """
+    s3_enabled = bool(os.getenv("S3_BUCKET_NAME"))
+    img_array = insp.img_array
     
+    # Crops - only actual damages
     print("\n🎯 Processing predictions...")
-    
-    for i, p in enumerate(damage_preds):
+    for i, p in enumerate(insp.damage_preds):
         x1, y1, x2, y2 = [int(v) for v in p['bbox']]
         score = p['score']
         class_name = p['class_name']
-        class_id = p.get('class_id', 0)
         
         severity, hex_color, bgr_color = get_severity_and_color(score)
-        boxes_for_explainability.append([x1, y1, x2, y2, score])
-        
-        # Upload crop to S3
-        crop_s3_url = None
-        crop_s3_key = None
         
-        if os.getenv("S3_BUCKET_NAME"):
+        # Start crop upload to S3
+        if s3_enabled:
             try:
-                crop_img = img_array[y1:y2, x1:x2]
-                _, crop_buffer = cv2.imencode('.jpg', crop_img)
-                
-                crop_filename = f"{class_name}_{i+1}.jpg"
-                crop_s3_key = storage.generate_s3_key(os.getenv("S3_BUCKET_NAME"), 'crops', f"{tracking_code}_{crop_filename}")
-                crop_s3_url = storage.upload_bytes_to_s3(
-                    crop_s3_key, 
-                    crop_buffer.tobytes(), 
-                    "image/jpeg"
-                )
+                # crop in decoded pixels (the stored bbox is in original pixels)
+                cx1, cy1, cx2, cy2 = [int(v) for v in insp.damage_dets['xyxy'][i]]
+                with insp.timer.stage('crop_encode'):
+                    crop = await pipeline.run_cpu(encoding.encode, 'crop', img_array[cy1:cy2, cx1:cx2])
+                crop_filename = f"{class_name}_{i+1}{crop.ext}"
+                insp.uploads.add(f"crop_{i}", 'crops', f"{insp.tracking_code}_{crop_filename}", crop.data, crop.content_type)
                 print(f"   ☁️  Crop {i+1}: {class_name}")
             except Exception as e:
-                print(f"   ⚠️  Crop upload failed: {e}")
-
-        # Save prediction to database
-        if os.getenv("POSTGRES_DSN") and image_id:
-            try:
-                pred_id = f"PRED-{tracking_code}-{i+1:03d}"
-                damage_detected = class_name.lower() not in ['no_damage', 'none', 'normal', 'good']
-                
-                # Direct insert with all fields
-                pool = await pg.init_pool()
-                prediction_id = await pool.fetchval("""
-                    INSERT INTO predictions (
-                        image_id, pred_id, class_id, class_name, 
-                        score, confidence, x1, y1, x2, y2, 
-                        crop_s3_url, crop_s3_key, 
-                        damage_detected, damage_type, created_at
-                    )
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, NOW())
-                    RETURNING id
-                """, 
-                    image_id, pred_id, class_id, class_name,
-                    score, score, x1, y1, x2, y2,
-                    crop_s3_url, crop_s3_key,
-                    damage_detected, class_name
-                )
-                
-                print(f"   ✅ DB SAVED - ID: {prediction_id} | {class_name} ({score*100:.1f}%)")
-                
-            except Exception as e:
-                print(f"   ❌ DB ERROR: {e}")
-                import traceback
-                traceback.print_exc()
+                print(f"   ⚠️  Crop encode failed: {e}")
         
-        processed_preds.append({
+        insp.processed_preds.append({
             'id': i + 1,
+            'class_id': p['class_id'],
             'class_name': class_name,
             'score': score,
             'bbox': [x1, y1, x2, y2],
             'severity': severity,
             'color': hex_color,
             'dimensions': f"{x2-x1}x{y2-y1}px",
-            'crop_url': crop_s3_url
+            'crop_url': None,
+            'crop_s3_key': None
         })
 
-    # STEP 6: Generate annotated image
+    # Annotated image
     print("\n🎨 Generating visualizations...")
-    if len(damage_preds) > 0:
-        annotated = draw_detections_on_image(img_array, processed_preds)
-    else:
-        # For clean packages, draw a green verification box
-        annotated = img_array.copy()
-        h, w = annotated.shape[:2]
-        # Draw green border around entire image
-        cv2.rectangle(annotated, (10, 10), (w-10, h-10), (136, 255, 0), 8)
-        # Add "UNDAMAGED" text
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        text = "UNDAMAGED"
-        (text_width, text_height), _ = cv2.getTextSize(text, font, 1.0, 2)
-        x = (w - text_width) // 2
-        y = text_height + 30
-        cv2.rectangle(annotated, (x-15, y-text_height-10), (x+text_width+15, y+8), (136, 255, 0), -1)
-        cv2.putText(annotated, text, (x, y), font, 1.0, (0, 0, 0), 2)
-    
-    annotated_base64 = image_to_base64(annotated)
-
-    # Upload annotated to S3
-    annotated_s3_url = None
-    annotated_s3_key = None
-    
-    if os.getenv("S3_BUCKET_NAME"):
+    with insp.timer.stage('annotate'):
+        if len(insp.damage_preds) > 0:
+            annotated = await pipeline.run_cpu(draw_detections_on_image, img_array, insp.damage_dets, names)
+        else:
+            # For clean packages, draw a green verification box
+            annotated = await pipeline.run_cpu(draw_clean_package, img_array)
+        
         try:
-            _, ann_buffer = cv2.imencode('.jpg', annotated)
-            annotated_s3_key = storage.generate_s3_key(os.getenv("S3_BUCKET_NAME"),
-    'annotated',
-    f"{tracking_code}_annotated.jpg")
-            annotated_s3_url = storage.upload_bytes_to_s3(
-                annotated_s3_key, 
-                ann_buffer.tobytes(), 
-                "image/jpeg"
-            )
-            print(f"☁️  Annotated uploaded")
+            insp.annotated_url = await publish_image(insp, 'annotated', annotated, 'annotated', f"{insp.tracking_code}_annotated")
         except Exception as e:
-            print(f"⚠️  Annotated upload failed: {e}")
+            print(f"⚠️  Annotated encode failed: {e}")
 
-    # STEP 7 & 8: Generate explainability (GradCAM + SHAP)
-    gradcam_url = None
-    gradcam_s3_url = None
-    gradcam_s3_key = None
-    shap_url = None
-    shap_s3_url = None
-    shap_s3_key = None
+    # Explainability (GradCAM + SHAP)
+    boxes_for_explainability = detections_to_boxes(insp.damage_dets)
+    if len(boxes_for_explainability) == 0 or explain == 'later':
+        return
     
-    if len(boxes_for_explainability) > 0:
-        try:
-            print("🧠 Generating explainability AI...")
-            
-            # Generate GradCAM
-            gradcam_img = generate_gradcam_heatmap(img_array, np.array(boxes_for_explainability))
-            gradcam_url = image_to_base64(gradcam_img)
-            
-            # Upload GradCAM to S3
-            if os.getenv("S3_BUCKET_NAME"):
-                _, grad_buffer = cv2.imencode('.jpg', gradcam_img)
-                gradcam_s3_key = storage.generate_s3_key( os.getenv("S3_BUCKET_NAME"),
-    'explainability',  # Use explainability folder
-    f"{tracking_code}_gradcam.jpg")
-                gradcam_s3_url = storage.upload_bytes_to_s3(
-                    gradcam_s3_key, 
-                    grad_buffer.tobytes(), 
-                    "image/jpeg"
-                )
-                print("☁️  GradCAM uploaded")
-            
-            # Generate SHAP
-            shap_img = generate_shap_explanation(img_array, np.array(boxes_for_explainability))
-            shap_url = image_to_base64(shap_img)
-            
-            # Upload SHAP to S3
-            if os.getenv("S3_BUCKET_NAME"):
-                _, shap_buffer = cv2.imencode('.jpg', shap_img)
-                shap_s3_key = storage.generate_s3_key( os.getenv("S3_BUCKET_NAME"),
-    'explainability',  # Use explainability folder
-    f"{tracking_code}_shap.jpg")
-                shap_s3_url = storage.upload_bytes_to_s3(
-                    shap_s3_key, 
-                    shap_buffer.tobytes(), 
-                    "image/jpeg"
-                )
-                print("☁️  SHAP uploaded")
-            
-            print("✅ Explainability AI complete")
-            
-        except Exception as e:
-            print(f"⚠️  Explainability error: {e}")
-
-    # Update database with all URLs
-    if image_id:
-        try:
-            await pg.update_image_urls(
-                image_id,
-                annotated_s3_url, annotated_s3_key,
-                gradcam_s3_url, gradcam_s3_key,
-                shap_s3_url, shap_s3_key
+    try:
+        print("🧠 Generating explainability AI...")
+        
+        # Generate GradCAM
+        with insp.timer.stage('gradcam'):
+            gradcam_img = await pipeline.run_cpu(generate_gradcam_heatmap, img_array, boxes_for_explainability, insp.activation)
+            insp.gradcam_url = await publish_image(insp, 'gradcam', gradcam_img, 'explainability', f"{insp.tracking_code}_gradcam")
+        
+        # Generate SHAP
+        with insp.timer.stage('shap'):
+            shap_img = await occlusion_shap.render(
+                img_array, boxes_for_explainability, insp.model_version or model_version(), occlusion_shap.SHAP_INLINE_MAX_EVALS
             )
-            print("✅ Database updated with all URLs")
-        except Exception as e:
-            print(f"⚠️  URL update failed: {e}")
+            insp.shap_url = await publish_image(insp, 'shap', shap_img, 'explainability', f"{insp.tracking_code}_shap")
+        
+        print("✅ Explainability AI complete")
+        insp.explanation_status = 'done'
+        
+    except Exception as e:
+        print(f"⚠️  Explainability error: {e}")
 
-    inference_time = int((time.time() - t0) * 1000)
+async def collect_uploads(insp: Inspection, background: bool = False):
+    """Wait for the uploads, or (background) take the planned keys and backfill later"""
+    if background:
+        insp.artifacts = {name: insp.uploads.planned(name) for name in insp.uploads.keys}
+        insp.uploads_pending = True
+    else:
+        insp.artifacts = await insp.uploads.wait()
+        for name, ms in insp.uploads.timings.items():
+            insp.timer.record(f"s3_{name}", ms, 's3_crop' if name.startswith('crop_') else f"s3_{name}")
+        print(f"☁️  {sum(1 for url, _ in insp.artifacts.values() if url)}/{len(insp.artifacts)} uploads complete")
 
-    # Severity counts
-    severity_counts = {
-        'severe': sum(1 for p in processed_preds if p['severity'] == 'danger'),
-        'moderate': sum(1 for p in processed_preds if p['severity'] == 'warning'),
-        'minor': sum(1 for p in processed_preds if p['severity'] == 'secondary')
-    }
+def explanations_deferred() -> bool:
+    """GradCAM/SHAP go to the explanation job queue (needs the DB for the job rows)"""
+    return explain_jobs.deferred_enabled() and explain_jobs.queue.running and bool(os.getenv("POSTGRES_DSN"))
 
-    print(f"\n⏱️  Total time: {inference_time}ms")
-    print("="*80 + "\n")
+async def queue_explanations(insp: Inspection):
+    """Submit the deferred GradCAM/SHAP job of a saved inspection"""
+    boxes_for_explainability = detections_to_boxes(insp.damage_dets)
+    if not insp.image_id or len(boxes_for_explainability) == 0:
+        return
+    if insp.persisted is not None:
+        # the rows only exist after the next write-behind flush
+        insp.explanation_status = 'queued'
+        uploads.run_in_background(submit_explanation_job(insp, boxes_for_explainability))
+    else:
+        await submit_explanation_job(insp, boxes_for_explainability)
 
+async def submit_explanation_job(insp: Inspection, boxes_for_explainability: np.ndarray):
+    try:
+        if insp.persisted is not None:
+            await insp.persisted
+        # clients fetch /api/packages/{tracking_code}/explanations
+        job_id = await explain_jobs.queue.submit(
+            insp.package_id, insp.image_id, insp.tracking_code, boxes_for_explainability,
+            insp.artifacts.get('original', (None, None))[1], image_array=insp.img_array,
+            activation=insp.activation, model_version=insp.model_version
+        )
+        insp.explanation_status = 'queued'
+        print(f"🧠 Explainability deferred (job {job_id})")
+    except Exception as e:
+        print(f"⚠️  Could not queue explainability job for {insp.tracking_code}: {e}")
+
+def prediction_rows(insp: Inspection, with_crops: bool = True) -> List[tuple]:
+    """predictions rows: (pred_id, class_id, class_name, score, x1, y1, x2, y2, crop url, crop key, damage_detected, damage_type, model_version)"""
+    rows = []
+    for i, p in enumerate(insp.damage_preds):
+        x1, y1, x2, y2 = [int(v) for v in p['bbox']]
+        class_name = p['class_name']
+        crop_s3_url, crop_s3_key = insp.artifacts.get(f"crop_{i}", (None, None)) if with_crops else (None, None)
+        damage_detected = class_name.lower() not in ['no_damage', 'none', 'normal', 'good']
+        rows.append((
+            f"PRED-{insp.tracking_code}-{i+1:03d}", p.get('class_id', 0), class_name, p['score'],
+            x1, y1, x2, y2, crop_s3_url, crop_s3_key,
+            damage_detected, class_name, insp.model_version
+        ))
+    return rows
+
+def inspection_record(insp: Inspection, username: str, with_artifacts: bool = True) -> Dict:
+    """
+    One item for pg.save_inspection / pg.save_inspections_bulk.
+    with_artifacts=False leaves the S3 columns empty for backfill_uploads.
+    """
+    none = (None, None)
+    artifact_keys = insp.artifacts if with_artifacts else {}
     return {
+        'package': (
+            insp.tracking_code, insp.status, insp.severity, insp.damage_type_str,
+            insp.max_confidence, datetime.utcnow(), None, f"Detected by {username}"
+        ),
+        'image': (
+            *artifact_keys.get('original', none),
+            *artifact_keys.get('annotated', none),
+            *artifact_keys.get('gradcam', none),
+            *artifact_keys.get('shap', none),
+        ),
+        'predictions': prediction_rows(insp, with_crops=with_artifacts),
+    }
+
+async def save_record(record: Dict) -> tuple:
+    """
+    Save package, image and predictions: one transaction, or the
+    write-behind buffer when it runs (ids are known right away, the rows
+    land with the next flush and the returned future resolves)
+    -> ({package_id, image_id, prediction_ids}, persisted future or None)
+    """
+    if write_behind.buffer.running:
+        return await write_behind.buffer.add(record)
+    return await pg.save_inspection(record), None
+
+async def persist_inspection(insp: Inspection, username: str, with_artifacts: bool = True):
+    """Save one inspection (see save_record)"""
+    saved, insp.persisted = await save_record(inspection_record(insp, username, with_artifacts))
+    insp.package_id, insp.image_id, insp.prediction_ids = saved['package_id'], saved['image_id'], saved['prediction_ids']
+
+def inspection_response(insp: Inspection, username: str) -> Dict:
+    """The /api/detect response body"""
+    severity_counts = {
+        'severe': sum(1 for p in insp.processed_preds if p['severity'] == 'danger'),
+        'moderate': sum(1 for p in insp.processed_preds if p['severity'] == 'warning'),
+        'minor': sum(1 for p in insp.processed_preds if p['severity'] == 'secondary')
+    }
+    # boxes are in original-photo pixels, and so are the reported dimensions
+    w, h = insp.original_size or insp.img.size
+    response = {
         'success': True,
-        'package_id': package_id,
-        'tracking_code': tracking_code,
-        'status': package_status,
-        'detections': processed_preds,
-        'total_damages': len(damage_preds),
+        'package_id': insp.package_id,
+        'tracking_code': insp.tracking_code,
+        'status': insp.status,
+        'detections': insp.processed_preds,
+        'total_damages': len(insp.damage_preds),
         'severity_counts': severity_counts,
-        'annotated_image_url': annotated_base64,
-        'original_s3_url': orig_s3_url,
-        'annotated_s3_url': annotated_s3_url,
-        'gradcam_url': gradcam_url,
-        'gradcam_s3_url': gradcam_s3_url,
-        'shap_url': shap_url,
-        'shap_s3_url': shap_s3_url,
+        'annotated_image_url': insp.annotated_url,
+        'gradcam_url': insp.gradcam_url,
+        'shap_url': insp.shap_url,
+        'explanation_status': insp.explanation_status,
+        'explanations_url': f"/api/packages/{insp.tracking_code}/explanations" if insp.explanation_status else None,
         'image_width': w,
         'image_height': h,
-        'inference_time_ms': inference_time,
+        'decode_scale': insp.decode_scale,
+        'inference_time_ms': int((time.time() - insp.started) * 1000),
+        'cascade_stage': insp.cascade_stage,
+        'model_version': insp.model_version,
         'timestamp': datetime.utcnow().isoformat(),
-        'inspector': current_user['username']
+        'inspector': username,
+        'cached': False,
+        'uploads_pending': insp.uploads_pending
     }
+    return apply_artifact_urls(response, insp.artifacts)
+
+def apply_artifact_urls(response: dict, artifacts: dict) -> dict:
+    """Fill the S3 url/key fields (and per-detection crop URLs) of a detect response"""
+    for name, (url_field, key_field) in ARTIFACT_FIELDS.items():
+        response[url_field], response[key_field] = artifacts.get(name, (None, None))
+    for i, pred in enumerate(response['detections']):
+        pred['crop_url'], pred['crop_s3_key'] = artifacts.get(f"crop_{i}", (None, None))
+    return response
+
+def cached_inspection_record(cached: Dict, tracking_code: str, username: str) -> Dict:
+    """inspection_record for a result-cache hit: the cached detections and S3 artifacts under a new tracking code"""
+    detections = cached.get('detections') or []
+    max_confidence = max((d['score'] for d in detections), default=0.0)
+    severity = get_severity_and_color(max_confidence)[0] if detections else "secondary"
+    damage_types = list(set(d['class_name'] for d in detections)) if detections else ["None"]
+    rows = []
+    for i, d in enumerate(detections):
+        x1, y1, x2, y2 = [int(v) for v in d['bbox']]
+        class_name = d['class_name']
+        rows.append((
+            f"PRED-{tracking_code}-{i+1:03d}", d.get('class_id', 0), class_name, d['score'],
+            x1, y1, x2, y2, d.get('crop_url'), d.get('crop_s3_key'),
+            class_name.lower() not in ['no_damage', 'none', 'normal', 'good'], class_name, cached.get('model_version')
+        ))
+    return {
+        'package': (
+            tracking_code, cached['status'], severity, ", ".join(damage_types),
+            max_confidence, datetime.utcnow(), None, f"Detected by {username}"
+        ),
+        # same column order as inspection_record: original, annotated, gradcam, shap
+        'image': tuple(
+            value
+            for url_field, key_field in ARTIFACT_FIELDS.values()
+            for value in (cached.get(url_field), cached.get(key_field))
+        ),
+        'predictions': rows,
+    }
+
+async def record_cached_detection(cached: Dict, username: str, tracking_code: str = None) -> Dict:
+    """
+    A result-cache hit is a new inspection of a (byte-identical) photo:
+    give it its own tracking code and package/image/prediction rows,
+    reusing the cached detections and S3 artifacts.
+    """
+    tracking_code = tracking_code or new_tracking_code()
+    response = {**cached, 'package_id': None, 'tracking_code': tracking_code, 'explanations_url': None}
+    if cached.get('explanation_status') != 'done':
+        response['explanation_status'] = None  # a pending job belongs to the earlier inspection
+    if not os.getenv("POSTGRES_DSN"):
+        return response
+    try:
+        saved, persisted = await save_record(cached_inspection_record(cached, tracking_code, username))
+    except Exception as e:
+        print(f"❌ Database error (cached inspection {tracking_code} not saved): {e}")
+        return response
+    response['package_id'] = saved['package_id']
+    print(f"✅ Recorded cached result as package {saved['package_id']} ({tracking_code})")
+
+    # explanations were still pending when the result was cached: render them for this image too
+    # (jobs work on the decoded image, so boxes go back to decoded pixels)
+    scale = cached.get('decode_scale') or 1
+    boxes = np.array([[*(v / scale for v in d['bbox']), d['score']] for d in cached.get('detections') or []], dtype=np.float32).reshape(-1, 5)
+    if cached.get('explanation_status') == 'queued' and not cached.get('shap_s3_key') and len(boxes) and explanations_deferred():
+        async def queue_job():
+            try:
+                if persisted is not None:
+                    await persisted
+                await explain_jobs.queue.submit(
+                    saved['package_id'], saved['image_id'], tracking_code, boxes, cached.get('original_s3_key'),
+                    model_version=cached.get('model_version')
+                )
+            except Exception as e:
+                print(f"⚠️  Could not queue explainability job for {tracking_code}: {e}")
+        uploads.run_in_background(queue_job())
+        response['explanation_status'] = 'queued'
+        response['explanations_url'] = f"/api/packages/{tracking_code}/explanations"
+    return response
+
+async def save_artifact_urls(image_id: int, artifacts: dict):
+    """Write the S3 URLs/keys of the uploaded artifacts to inspection_images"""
+    none = (None, None)
+    await pg.update_image_urls(
+        image_id,
+        *artifacts.get('annotated', none),
+        *artifacts.get('gradcam', none),
+        *artifacts.get('shap', none),
+        *artifacts.get('original', none)
+    )
+
+async def backfill_uploads(upload_batch, image_id, prediction_ids, cache_key, response, persisted=None):
+    """UPLOAD_MODE=background: record the keys of uploads that landed, then cache the result"""
+    artifacts = await upload_batch.wait()
+    if image_id:
+        try:
+            if persisted is not None:
+                await persisted  # write-behind rows must exist before they are updated
+            await save_artifact_urls(image_id, artifacts)
+            crop_rows = [
+                (prediction_id, *artifacts[f"crop_{i}"])
+                for i, prediction_id in enumerate(prediction_ids)
+                if prediction_id and artifacts.get(f"crop_{i}", (None, None))[0]
+            ]
+            await pg.update_prediction_crops(crop_rows)
+            print(f"✅ Backfilled S3 keys for image {image_id}")
+        except Exception as e:
+            print(f"⚠️  S3 key backfill failed for image {image_id}: {e}")
+
+    # cache only what actually reached S3
+    final = apply_artifact_urls(copy.deepcopy(response), artifacts)
+    final['uploads_pending'] = False
+    await result_cache.put(cache_key, final)
+
+async def run_detection(content: bytes, filename: str, content_type: str, username: str,
+                        tracking_code: str = None, image_mode: str = 'inline', debug: bool = False) -> Dict:
+    """
+    Complete damage detection with explainability for one image
+    
+    Process:
+    1. Upload original image to S3
+    2. Run YOLO detection
+    3. Upload crops and annotated image to S3
+    4. GradCAM + SHAP → S3 (or a deferred explanation job, queued after step 6)
+    5. Wait for the uploads
+    6. Save package, image and predictions to PostgreSQL in one transaction
+    7. Return all results
+    
+    All S3 uploads of the request run concurrently (see services/uploads.py).
+    image_mode 'url'/'multipart' returns signed artifact URLs instead of
+    base64 images (multipart packing happens in the endpoint).
+    debug adds per-stage timings (ms) as response['debug']; they are
+    recorded as detect_stage_*_ms histograms either way.
+    """
+    # Duplicate uploads / client retries skip inference (but still get their own rows)
+    cache_key, cached = await cached_detection(content, username, image_mode)
+    if cached is not None:
+        cached = await record_cached_detection(cached, username, tracking_code)
+        if debug:
+            cached['debug'] = {'timings_ms': {'total': cached['inference_time_ms']}}
+        return cached
+
+    # STEP 1: Decode (CPU executor) and start the original upload
+    insp = await start_inspection(content, filename, content_type, cache_key, tracking_code, image_mode)
+
+    # STEP 2: Run YOLO detection
+    print("\n🤖 Running YOLO detection...")
+    await run_inference(insp)
+    names = class_names()
+    summarize_detections(insp, names)
+
+    # STEP 3 & 4: Crops, annotated image, explainability
+    defer = explanations_deferred()
+    await render_artifacts(insp, names, 'later' if defer else 'inline')
+
+    # STEP 5: Wait for the uploads (or respond now and backfill keys later)
+    background_uploads = uploads.background_enabled() and bool(os.getenv("S3_BUCKET_NAME"))
+    await collect_uploads(insp, background_uploads)
+
+    # STEP 6: Package, image and predictions in one transaction
+    if os.getenv("POSTGRES_DSN"):
+        print("\n💾 Saving to database...")
+        with insp.timer.stage('db'):
+            try:
+                await persist_inspection(insp, username, with_artifacts=not background_uploads)
+                print(f"✅ {'Buffered' if insp.persisted else 'Saved'} package {insp.package_id}, image {insp.image_id}, {len(insp.prediction_ids)} predictions")
+            except Exception as e:
+                print(f"❌ Database error (inspection rolled back): {e}")
+                import traceback
+                traceback.print_exc()
+        if defer:
+            await queue_explanations(insp)
+    else:
+        print("\n⚠️  Skipping database save - POSTGRES_DSN not configured")
+
+    response = inspection_response(insp, username)
+    insp.timer.record('total', response['inference_time_ms'])
+    print(f"\n⏱️  Total time: {response['inference_time_ms']}ms")
+    print("="*80 + "\n")
+
+    if background_uploads:
+        uploads.run_in_background(
+            backfill_uploads(insp.uploads, insp.image_id, insp.prediction_ids, cache_key, response, insp.persisted)
+        )
+    else:
+        await result_cache.put(cache_key, response)
+    if debug:
+        # not part of the cached result
+        response = {**response, 'debug': {'timings_ms': insp.timer.timings}}
+    return response
+
+def multipart_response(response: Dict) -> Response:
+    """
+    multipart/mixed body: the JSON result, then one image/jpeg part per
+    artifact still in the local cache. Their JSON fields become
+    "cid:<name>" references to the parts' Content-ID.
+    """
+    boundary = uuid.uuid4().hex
+    body = dict(response)
+    image_parts = []
+    for url_field, name in IMAGE_FIELDS.items():
+        ref = artifacts.parse(body.get(url_field))
+        item = artifacts.cache.get(ref[0]) if ref else None
+        if item is not None:
+            image_parts.append((name, *item))
+            body[url_field] = f"cid:{name}"
+    
+    chunks = [
+        f"--{boundary}\r\nContent-Type: application/json\r\nContent-ID: <result>\r\n\r\n".encode(),
+        json.dumps(body, default=str).encode(),
+        b"\r\n",
+    ]
+    for name, data, content_type in image_parts:
+        chunks += [
+            f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-ID: <{name}>\r\nContent-Length: {len(data)}\r\n\r\n".encode(),
+            data,
+            b"\r\n",
+        ]
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return Response(content=b"".join(chunks), media_type=f"multipart/mixed; boundary={boundary}")
+
+@app.post("/api/detect")
+async def detect(
+    file: UploadFile = File(...), 
+    tracking_code: str = None,
+    image_mode: str = None,
+    lane: str = 'interactive',
+    debug: bool = False,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Complete damage detection with explainability (see run_detection)
+    
+    image_mode (default DETECT_IMAGE_MODE): inline | url | multipart
+    lane: interactive | bulk - admission priority (services/admission.py);
+    over capacity the request is shed with 429/503 + Retry-After
+    debug: include per-stage timings in the response
+    """
+    
+    print("\n" + "="*80)
+    print(f"🚀 NEW DETECTION REQUEST - {datetime.utcnow().isoformat()}")
+    print("="*80)
+    print(f"👤 User: {current_user.get('username', 'Unknown')} (ID: {current_user.get('user_id', 'N/A')})")
+    print(f"📁 File: {file.filename}")
+    print(f"📏 Size: {file.size if hasattr(file, 'size') else 'Unknown'}")
+    print(f"🎨 Content-Type: {file.content_type}")
+    
+    if not file.content_type.startswith("image/"):
+        
+        raise HTTPException(status_code=400, detail="File must be an image")
+
+    image_mode = resolve_image_mode(image_mode)
+
+    # Wait for a detection slot before the image is read and decoded
+    async with admission.controller.slot(lane):
+        content = await file.read()
+        response = await run_detection(
+            content, file.filename, file.content_type, current_user['username'], tracking_code, image_mode, debug
+        )
+    return multipart_response(response) if image_mode == 'multipart' else response
+
+@app.get("/api/artifacts/{artifact_id}")
+async def serve_artifact(artifact_id: str, expires: int, sig: str, key: str = None):
+    """
+    Serve an image referenced by a signed artifact URL (no JWT needed:
+    the signature is the credential). Falls back to S3 once the bytes
+    have left the local cache.
+    """
+    if not artifacts.verify(artifact_id, key, expires, sig):
+        raise HTTPException(status_code=403, detail="Invalid or expired artifact URL")
+    
+    headers = {"Cache-Control": f"private, max-age={max(0, expires - int(time.time()))}"}
+    item = artifacts.cache.get(artifact_id)
+    if item is not None:
+        artifacts.cache_hits.inc()
+        data, content_type = item
+        return Response(content=data, media_type=content_type, headers=headers)
+    
+    artifacts.cache_misses.inc()
+    if key and os.getenv("S3_BUCKET_NAME"):
+        url = await pipeline.run_io(storage.generate_presigned_url, key, max(60, expires - int(time.time())))
+        if url:
+            return RedirectResponse(url, status_code=307)
+    raise HTTPException(status_code=404, detail="Artifact not found")
+
+# ============================================================================
+# BATCH DETECTION
+# ============================================================================
+
+def is_archive(filename: str, content_type: str) -> bool:
+    name = (filename or '').lower()
+    return (
+        content_type in ('application/zip', 'application/x-zip-compressed', 'application/x-tar', 'application/gzip', 'application/x-gzip')
+        or name.endswith(('.zip', '.tar', '.tar.gz', '.tgz'))
+    )
+
+class BatchTooLarge(Exception):
+    """Batch upload over BATCH_DETECT_MAX_IMAGE_BYTES / BATCH_DETECT_MAX_BYTES (413)"""
+
+def extract_archive_images(data: bytes, limit: int, max_bytes: int = BATCH_DETECT_MAX_BYTES) -> List[tuple]:
+    """
+    (filename, bytes, content_type) for every image in a zip or tar archive.
+
+    Member sizes come from the archive index and are checked before a
+    member is read, so a zip/tar bomb is rejected (BatchTooLarge) without
+    being inflated: no image may exceed BATCH_DETECT_MAX_IMAGE_BYTES and
+    all of them together max_bytes.
+    """
+    items = []
+    total = 0
+    
+    def check_size(name: str, size: int):
+        nonlocal total
+        if size > BATCH_DETECT_MAX_IMAGE_BYTES:
+            raise BatchTooLarge(f"{os.path.basename(name)} is {size} bytes uncompressed (max {BATCH_DETECT_MAX_IMAGE_BYTES})")
+        total += size
+        if total > max_bytes:
+            raise BatchTooLarge(f"Batch exceeds {BATCH_DETECT_MAX_BYTES} bytes uncompressed")
+    
+    def wanted(name: str) -> bool:
+        base = os.path.basename(name)
+        return not base.startswith('.') and '__MACOSX' not in name and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+    
+    if zipfile.is_zipfile(io.BytesIO(data)):
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and wanted(info.filename):
+                    check_size(info.filename, info.file_size)
+                    items.append((os.path.basename(info.filename), zf.read(info), mimetypes.guess_type(info.filename)[0] or 'image/jpeg'))
+                    if len(items) > limit:
+                        break
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as tf:
+            for member in tf:
+                if member.isfile() and wanted(member.name):
+                    check_size(member.name, member.size)
+                    items.append((os.path.basename(member.name), tf.extractfile(member).read(), mimetypes.guess_type(member.name)[0] or 'image/jpeg'))
+                    if len(items) > limit:
+                        break
+    return items
+
+async def read_upload(f: UploadFile, limit: int, error: str) -> bytes:
+    """Read an upload 1 MB at a time; 413 as soon as it passes limit bytes"""
+    data = bytearray()
+    while True:
+        piece = await f.read(1024 * 1024)
+        if not piece:
+            return bytes(data)
+        data += piece
+        if len(data) > limit:
+            raise HTTPException(status_code=413, detail=error)
+
+def batch_error(index: int, filename: str, error: str) -> Dict:
+    return {'index': index, 'filename': filename, 'success': False, 'error': error}
+
+async def detect_batch_chunk(chunk: List[tuple], username: str, image_mode: str = 'inline') -> List[Dict]:
+    """
+    Detect one chunk of (index, (filename, bytes, content_type)) items.
+
+    Inference for the whole chunk lands in the same scheduler batches and
+    all inspections are written with one pg.save_inspections_bulk
+    transaction (one by one if that fails; items that still can't be
+    saved are reported as failed and not cached). Returns the per-item
+    results in input order.
+    """
+    results: Dict[int, Dict] = {}
+
+    async def prepare(index, filename, content, content_type):
+        if not (content_type or '').startswith('image/'):
+            results[index] = batch_error(index, filename, "File must be an image")
+            return None
+        cache_key, cached = await cached_detection(content, username, image_mode)
+        if cached is not None:
+            results[index] = {'index': index, 'filename': filename, **await record_cached_detection(cached, username)}
+            return None
+        return index, await start_inspection(content, filename, content_type, cache_key, image_mode=image_mode)
+
+    prepared = await asyncio.gather(
+        *(prepare(index, *item) for index, item in chunk), return_exceptions=True
+    )
+    pending: List[tuple] = []
+    for (index, (filename, _, _)), outcome in zip(chunk, prepared):
+        if isinstance(outcome, Exception):
+            results[index] = batch_error(index, filename, f"Could not read image: {outcome}")
+        elif outcome is not None:
+            pending.append(outcome)
+
+    if pending:
+        # every image is queued at once so the scheduler batches them together
+        await asyncio.gather(*(run_inference(insp) for _, insp in pending))
+        names = class_names()
+        for _, insp in pending:
+            summarize_detections(insp, names)
+
+        defer = explanations_deferred()
+        await asyncio.gather(*(render_artifacts(insp, names, 'later' if defer else 'inline') for _, insp in pending))
+        await asyncio.gather(*(collect_uploads(insp) for _, insp in pending))
+
+        save_errors: Dict[int, Exception] = {}
+        if os.getenv("POSTGRES_DSN"):
+            db_started = time.perf_counter()
+            records = [inspection_record(insp, username) for _, insp in pending]
+            try:
+                saved = await pg.save_inspections_bulk(records)
+                print(f"💾 Saved {len(saved)} inspections in one transaction")
+            except Exception as e:
+                # one bad item (e.g. a duplicate tracking code) must not sink the chunk
+                print(f"⚠️  Batch database error, saving one by one: {e}")
+                saved = []
+                for (index, insp), record in zip(pending, records):
+                    try:
+                        saved.append(await pg.save_inspection(record))
+                    except Exception as item_error:
+                        print(f"❌ Could not save {insp.tracking_code}: {item_error}")
+                        save_errors[index] = item_error
+                        saved.append(None)
+            for (_, insp), ids in zip(pending, saved):
+                if ids is not None:
+                    insp.package_id, insp.image_id, insp.prediction_ids = ids['package_id'], ids['image_id'], ids['prediction_ids']
+            metrics.stage_histogram('db_bulk').observe((time.perf_counter() - db_started) * 1000)
+
+        for index, insp in pending:
+            if index in save_errors:
+                # not cached either: a retry of the same image must be saved
+                results[index] = batch_error(index, insp.filename, f"Could not save inspection: {save_errors[index]}")
+                continue
+            if defer:
+                await queue_explanations(insp)
+            response = inspection_response(insp, username)
+            await result_cache.put(insp.cache_key, response)
+            results[index] = {'index': index, 'filename': insp.filename, **response}
+
+    return [results[index] for index, _ in chunk]
+
+async def stream_batch_results(items: List[tuple], username: str, image_mode: str = 'inline'):
+    """NDJSON lines: one result per item (chunk by chunk), then a summary line"""
+    started = time.time()
+    succeeded = 0
+    chunk_size = max(1, BATCH_DETECT_CHUNK)
+    for start in range(0, len(items), chunk_size):
+        chunk = list(enumerate(items[start:start + chunk_size], start))
+        try:
+            # bulk lane, bounded queue; one slot per image of the chunk
+            async with admission.controller.slot('bulk', weight=len(chunk)):
+                chunk_results = await detect_batch_chunk(chunk, username, image_mode)
+        except admission.Rejected as e:
+            # shed mid-stream: the rest of the batch is reported as not processed
+            print(f"⚠️  Batch shed at item {start}: {e.detail}")
+            for index, item in enumerate(items[start:], start):
+                yield json.dumps({**batch_error(index, item[0], e.detail), 'retry_after': e.retry_after}) + "\n"
+            break
+        except Exception as e:
+            print(f"❌ Batch chunk failed: {e}")
+            chunk_results = [batch_error(index, item[0], str(e)) for index, item in chunk]
+        for result in chunk_results:
+            succeeded += 1 if result.get('success') else 0
+            yield json.dumps(result, default=str) + "\n"
+    yield json.dumps({
+        'done': True,
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': len(items) - succeeded,
+        'elapsed_ms': int((time.time() - started) * 1000)
+    }) + "\n"
+
+@app.post("/api/detect/batch")
+async def detect_batch(
+    files: List[UploadFile] = File(...),
+    image_mode: str = None,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Detect many images in one call: several files, or a zip/tar archive.
+    
+    Results stream back as NDJSON (application/x-ndjson), one line per
+    image in upload order as soon as its chunk of BATCH_DETECT_CHUNK images
+    is done, followed by a {"done": true, ...} summary line. Each chunk is
+    inferred as one batch and persisted in a single transaction; artifact
+    uploads are always awaited here (UPLOAD_MODE=background does not apply).
+    image_mode is inline or url (multipart does not mix with NDJSON).
+    The item and byte limits are checked while the files are read, so an
+    oversized batch gets 413 without being buffered first.
+    Admission: bulk lane with its bounded queue, one slot per image of a
+    chunk; with the bulk queue full the request gets 429 up front (no
+    waiting), and a chunk shed mid-stream reports the remaining items
+    failed with retry_after.
+    """
+    image_mode = resolve_image_mode(image_mode)
+    if image_mode == 'multipart':
+        raise HTTPException(status_code=400, detail="image_mode=multipart is not supported for batches")
+    if len(files) > BATCH_DETECT_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_DETECT_MAX_ITEMS} images per batch")
+    items = []
+    total_bytes = 0
+    for f in files:
+        # byte limits are enforced while reading, never after buffering the whole batch
+        remaining = BATCH_DETECT_MAX_BYTES - total_bytes
+        if is_archive(f.filename, f.content_type):
+            data = await read_upload(f, remaining, f"Batch exceeds {BATCH_DETECT_MAX_BYTES} bytes")
+            try:
+                extracted = await pipeline.run_cpu(
+                    extract_archive_images, data, BATCH_DETECT_MAX_ITEMS, BATCH_DETECT_MAX_BYTES - total_bytes
+                )
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise HTTPException(status_code=400, detail=f"Could not read archive {f.filename}: {e}")
+            except BatchTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            items.extend(extracted)
+            total_bytes += sum(len(content) for _, content, _ in extracted)
+        else:
+            if remaining < BATCH_DETECT_MAX_IMAGE_BYTES:
+                data = await read_upload(f, remaining, f"Batch exceeds {BATCH_DETECT_MAX_BYTES} bytes uncompressed")
+            else:
+                data = await read_upload(f, BATCH_DETECT_MAX_IMAGE_BYTES, f"{f.filename} is larger than {BATCH_DETECT_MAX_IMAGE_BYTES} bytes")
+            items.append((f.filename, data, f.content_type))
+            total_bytes += len(data)
+        if total_bytes > BATCH_DETECT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_DETECT_MAX_BYTES} bytes uncompressed")
+        if len(items) > BATCH_DETECT_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {BATCH_DETECT_MAX_ITEMS} images per batch")
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No images in upload")
+    
+    # Shed before the stream starts (429 + Retry-After) if the bulk lane could not
+    # even queue the first chunk; no slot is held here, each chunk takes its own
+    # slots inside stream_batch_results
+    admission.controller.check('bulk', weight=min(len(items), max(1, BATCH_DETECT_CHUNK)))
+    
+    print(f"\n📦 Batch detection: {len(items)} images from {current_user['username']}")
+    return StreamingResponse(
+        stream_batch_results(items, current_user['username'], image_mode),
+        media_type="application/x-ndjson"
+    )
+
+# ============================================================================
+# ASYNCHRONOUS DETECTION JOBS
+# ============================================================================
+
+async def run_detection_job(content: bytes, filename: str, content_type: str, username: str,
+                            tracking_code: str = None) -> Dict:
+    """
+    Detection job handler: bulk admission lane, queued rather than shed (durable job).
+    Images come back as signed artifact URLs (re-signed when the job is
+    read), so no base64 ends up in the stored job result.
+    """
+    async with admission.controller.slot('bulk', wait=True):
+        return await run_detection(content, filename, content_type, username, tracking_code, image_mode='url')
+
+def job_payload(job: Dict) -> Dict:
+    """Job with fresh expiries on the signed image URLs of its result"""
+    result = job.get('result')
+    if isinstance(result, dict):
+        result = dict(result)
+        for url_field in IMAGE_FIELDS:
+            if result.get(url_field):
+                result[url_field] = artifacts.resign(result[url_field])
+        job = {**job, 'result': result}
+    return job
+
+def job_visible(job: Dict, user: dict) -> bool:
+    """Jobs are visible to the user who submitted them and to admins"""
+    return job['username'] == user['username'] or user.get('role') == 'admin'
+
+def job_links(job_id: str) -> Dict:
+    return {
+        'status_url': f"/api/jobs/{job_id}",
+        'events_url': f"/api/jobs/{job_id}/events",
+    }
+
+@app.post("/api/jobs/detect", status_code=status.HTTP_202_ACCEPTED)
+async def submit_detection_job(
+    file: UploadFile = File(...),
+    tracking_code: str = None,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Queue a detection and return right away (202).
+    
+    The finished job carries the payload /api/detect returns with
+    image_mode=url (signed image URLs, refreshed on every read). Follow
+    it with GET /api/jobs/{job_id}/events (Server-Sent Events) or poll
+    GET /api/jobs/{job_id}.
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if not detect_jobs.queue.running:
+        raise HTTPException(status_code=503, detail="Detection job queue not running")
+    
+    content = await file.read()
+    try:
+        job = await detect_jobs.queue.submit(
+            content, file.filename, file.content_type, current_user['username'], tracking_code
+        )
+    except detect_jobs.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    
+    print(f"📥 Detection job {job['job_id']} queued by {current_user['username']} ({file.filename})")
+    return {**job, **job_links(job['job_id'])}
+
+@app.get("/api/jobs/{job_id}")
+async def get_detection_job(job_id: str, current_user: dict = Depends(get_current_active_user)):
+    """Poll a detection job; 'result' is set once status is 'done'"""
+    job = await detect_jobs.queue.get(job_id)
+    if job is None or not job_visible(job, current_user):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job_payload(job), **job_links(job_id)}
+
+@app.get("/api/jobs/{job_id}/events")
+async def detection_job_events(
+    job_id: str,
+    token: str = None,
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Server-Sent Events for one detection job.
+    
+    Sends a 'status' event on every state change and ends with 'done'
+    (full detect payload in data.result) or 'failed'. EventSource cannot
+    set headers, so the JWT may also be passed as ?token=.
+    """
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        raise HTTPException(status_code=401, detail="Token required")
+    current_user = await get_user_from_token(token)
+    
+    job = await detect_jobs.queue.get(job_id)
+    if job is None or not job_visible(job, current_user):
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for update in detect_jobs.queue.updates(job_id):
+            if update is None:
+                yield ": keepalive\n\n"
+                continue
+            event = update['status'] if update['status'] in detect_jobs.FINISHED else 'status'
+            yield f"event: {event}\ndata: {json.dumps(job_payload(update), default=str)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ============================================================================
 # DASHBOARD ENDPOINTS
@@ -884,6 +1674,63 @@ async def get_package(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/packages/{tracking_code}/explanations")
+async def get_package_explanations(
+    tracking_code: str,
+    inline: bool = False,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    GradCAM / SHAP for a package: the finished artifacts or the job status.
+
+    status is queued | running | done | failed (deferred jobs) or
+    not_available when nothing was explained. Finished images come back
+    as signed /api/artifacts URLs (usable in <img src>, no Bearer header),
+    or with inline=true as base64 data URLs like /api/detect returns.
+    """
+    if not os.getenv("POSTGRES_DSN"):
+        raise HTTPException(status_code=503, detail="Database not configured")
+    
+    package = await pg.get_package_by_tracking_code(tracking_code)
+    if not package:
+        raise HTTPException(status_code=404, detail="Package not found")
+    
+    job = await pg.get_latest_explanation_job(tracking_code)
+    if job:
+        explanation_status = job['status']
+        gradcam_s3_key, shap_s3_key = job['gradcam_s3_key'], job['shap_s3_key']
+    else:
+        # rendered inline by /api/detect (or no damage to explain)
+        pool = await pg.init_pool()
+        image = await pool.fetchrow("""
+            SELECT gradcam_s3_key, shap_s3_key FROM inspection_images
+            WHERE package_id = $1 ORDER BY image_id DESC LIMIT 1
+        """, package['package_id'])
+        gradcam_s3_key = image['gradcam_s3_key'] if image else None
+        shap_s3_key = image['shap_s3_key'] if image else None
+        explanation_status = 'done' if gradcam_s3_key else 'not_available'
+    
+    response = {
+        'tracking_code': tracking_code,
+        'status': explanation_status,
+        'job_id': job['job_id'] if job else None,
+        'attempts': job['attempts'] if job else 0,
+        'error': job['error'] if job else None,
+        'gradcam_s3_key': gradcam_s3_key,
+        'shap_s3_key': shap_s3_key,
+        'gradcam_url': artifacts.sign_s3(gradcam_s3_key) if gradcam_s3_key else None,
+        'shap_url': artifacts.sign_s3(shap_s3_key) if shap_s3_key else None,
+    }
+    
+    if inline and explanation_status == 'done':
+        bucket = os.getenv("S3_BUCKET_NAME")
+        for url_field, key in (('gradcam_url', gradcam_s3_key), ('shap_url', shap_s3_key)):
+            if key:
+                data = await pipeline.run_io(storage.download_from_s3, bucket, key)
+                response[url_field] = f"data:{encoding.content_type_for(key)};base64,{base64.b64encode(data).decode()}"
+    
+    return response
+
 @app.get("/api/images/{s3_key:path}")
 async def serve_image(s3_key: str, token: str = None):
     """Serve images from S3 with token authentication"""
@@ -907,13 +1754,11 @@ async def serve_image(s3_key: str, token: str = None):
         if not bucket_name:
             raise HTTPException(status_code=503, detail="S3 not configured")
         
-        image_data = storage.download_from_s3(bucket_name, s3_key)
+        image_data = await pipeline.run_io(storage.download_from_s3, bucket_name, s3_key)
         
         # Determine content type
-        content_type = "image/jpeg"
-        if s3_key.lower().endswith('.png'):
-            content_type = "image/png"
-        elif s3_key.lower().endswith('.gif'):
+        content_type = encoding.content_type_for(s3_key)
+        if s3_key.lower().endswith('.gif'):
             content_type = "image/gif"
         
         from fastapi.responses import Response
@@ -923,6 +1768,117 @@ async def serve_image(s3_key: str, token: str = None):
         print(f"❌ Failed to serve image {s3_key}: {e}")
         raise HTTPException(status_code=404, detail="Image not found")
 
+@app.get("/api/inference/stats")
+async def get_inference_stats(current_user: dict = Depends(get_current_active_user)):
+    """Batch-size and queue-wait histograms for tuning the batch scheduler"""
+    return {
+        'batch_max_size': inference_scheduler.max_batch_size,
+        'batch_max_wait_ms': inference_scheduler.max_wait_ms,
+        'scheduler_running': inference_scheduler.running,
+        'worker_pool': model_workers.pool.stats() if model_workers.pool else None,
+        'result_cache': result_cache.stats(),
+        'cascade': cascade.stats(),
+        'explanations': explain_jobs.queue.stats(),
+        'detection_jobs': detect_jobs.queue.stats(),
+        'artifact_cache': artifacts.cache.stats(),
+        'admission': admission.controller.stats(),
+        'write_behind': write_behind.buffer.stats(),
+        'occlusion_shap': occlusion_shap.stats(),
+        'model_version': model_version(),
+        'metrics': metrics.snapshot_all()
+    }
+
+def scrape_gauges() -> List[tuple]:
+    """(name, labels, value, help) samples read at scrape time for /metrics"""
+    samples = [
+        ('model_info', {'version': model_version(), 'backend': serving_backend()[0]}, 1, 'Model currently served'),
+        ('inference_scheduler_queue_depth', {}, inference_scheduler.queue_depth(), 'Images waiting for a batch'),
+        ('inference_scheduler_running', {}, int(inference_scheduler.running), 'Batch scheduler loop alive'),
+        ('inference_batch_max_size', {}, inference_scheduler.max_batch_size, 'Configured max batch size'),
+        ('explanation_jobs_pending', {}, explain_jobs.queue.pending(), 'Deferred explanation jobs waiting'),
+        ('detection_jobs_pending', {}, detect_jobs.queue.pending(), 'Async detection jobs waiting'),
+        ('artifact_cache_bytes', {}, artifacts.cache.bytes, 'Bytes held by the artifact cache'),
+    ]
+    if model_workers.pool:
+        workers = model_workers.pool.stats()['workers']
+        samples.append(('inference_workers_alive', {}, sum(1 for w in workers if w['alive']), 'Live model worker processes'))
+        samples.append(('inference_workers_ready', {}, sum(1 for w in workers if w['ready']), 'Model workers accepting batches'))
+    db_pool = pg.pool_stats()
+    if db_pool:
+        samples += [
+            ('db_pool_size', {}, db_pool['size'], 'Open Postgres connections'),
+            ('db_pool_idle', {}, db_pool['idle'], 'Idle Postgres connections'),
+            ('db_pool_max_size', {}, db_pool['max_size'], 'Postgres pool limit'),
+        ]
+    return samples
+
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+async def prometheus_metrics():
+    """
+    Prometheus text exposition: every registered histogram/counter/gauge
+    (including the detect_stage_*_ms per-stage latencies) plus model,
+    scheduler and DB pool state.
+
+    Needs METRICS_TOKEN (scrape config: authorization / bearer token) or an
+    admin JWT; METRICS_PUBLIC=1 opens it up for scrapers on a private network.
+    """
+    return Response(
+        content=metrics.render_prometheus(scrape_gauges()),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+# ============================================================================
+# MODEL MANAGEMENT
+# ============================================================================
+
+model_swap_state = {
+    'status': 'idle',  # idle | loading | swapped | failed
+    'weights': None,
+    'version': None,
+    'error': None,
+    'started_at': None,
+    'finished_at': None,
+}
+_model_swap_task = None
+
+async def _run_model_swap(weights: str, warmup_runs: int):
+    """Background task: load + warm up new weights, then swap them in"""
+    try:
+        version = await inference_scheduler.swap_model(weights, warmup_runs=warmup_runs)
+        model_swap_state.update(status='swapped', version=version)
+        print(f"🔄 Model hot-swapped to {version}")
+    except Exception as e:
+        model_swap_state.update(status='failed', error=str(e))
+        print(f"❌ Model hot-swap failed, still serving {model_version()}: {e}")
+    finally:
+        model_swap_state['finished_at'] = datetime.utcnow().isoformat()
+
+@app.post("/api/admin/model/swap", status_code=status.HTTP_202_ACCEPTED)
+async def swap_model(request: ModelSwapRequest, current_user: dict = Depends(require_admin)):
+    """Load new weights in the background and swap them in without downtime"""
+    global _model_swap_task
+    if _model_swap_task is not None and not _model_swap_task.done():
+        raise HTTPException(status_code=409, detail="A model swap is already in progress")
+    if not os.path.exists(request.weights):
+        raise HTTPException(status_code=400, detail=f"Weights not found: {request.weights}")
+
+    model_swap_state.update(
+        status='loading',
+        weights=request.weights,
+        version=None,
+        error=None,
+        started_at=datetime.utcnow().isoformat(),
+        finished_at=None,
+    )
+    _model_swap_task = asyncio.create_task(_run_model_swap(request.weights, request.warmup_runs))
+    print(f"🔄 Model hot-swap to {request.weights} requested by {current_user['username']}")
+    return {'serving': model_version(), 'swap': model_swap_state}
+
+@app.get("/api/admin/model")
+async def get_model_status(current_user: dict = Depends(require_admin)):
+    """Currently served model version and the state of the last hot-swap"""
+    return {'serving': model_version(), 'swap': model_swap_state}
+
 @app.get("/api/health")
 def health_check():
     """Health check endpoint"""
@@ -5,6 +5,7 @@ Date: 2025-11-16 11:11:12 UTC
 """
 
 import os
+import hmac
 import hashlib
 from datetime import datetime, timedelta
 from typing import Optional
@@ -18,8 +19,11 @@ from db import pg
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")                  # static bearer token for Prometheus scrapers
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"   # opt-in: /metrics without auth
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 # Pydantic models
 class Token(BaseModel):
@@ -73,8 +77,8 @@ async def authenticate_user(username: str, password: str):
     
     return user
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current authenticated user from JWT token"""
+async def get_user_from_token(token: str):
+    """Resolve a JWT to its user (raises 401); also used where no Authorization header can be sent"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -82,7 +86,6 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     )
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         
@@ -101,6 +104,33 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current authenticated user from JWT token"""
+    return await get_user_from_token(credentials.credentials)
+
 async def get_current_active_user(current_user: dict = Depends(get_current_user)):
     """Get current active user"""
-    return current_user
\ No newline at end of file
+    return current_user
+
+async def require_admin(current_user: dict = Depends(get_current_active_user)):
+    """Only allow users with the admin role"""
+    if current_user.get('role') != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin role required",
+        )
+    return current_user
+
+async def require_metrics_access(credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """/metrics: METRICS_TOKEN or an admin JWT as bearer token, unless METRICS_PUBLIC=1"""
+    if METRICS_PUBLIC:
+        return
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return
+    await require_admin(await get_user_from_token(credentials.credentials))
@@ -6,7 +6,8 @@ Date: 2025-11-16 10:59:22 UTC
 
 import os
 import asyncpg
-from typing import Optional, Dict, List
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
 
 POSTGRES_DSN = os.getenv("POSTGRES_DSN")
 
@@ -30,6 +31,17 @@ async def close_pool():
         _pool = None
         print("🔒 Database pool closed")
 
+def pool_stats() -> Optional[Dict]:
+    """Connection pool usage, None before the pool exists"""
+    if _pool is None:
+        return None
+    return {
+        'size': _pool.get_size(),
+        'idle': _pool.get_idle_size(),
+        'min_size': _pool.get_min_size(),
+        'max_size': _pool.get_max_size(),
+    }
+
 # ============================================================================
 # USER OPERATIONS
 # ============================================================================
@@ -157,7 +169,9 @@ async def update_image_urls(
     gradcam_s3_url: str = None,
     gradcam_s3_key: str = None,
     shap_s3_url: str = None,
-    shap_s3_key: str = None
+    shap_s3_key: str = None,
+    original_s3_url: str = None,
+    original_s3_key: str = None
 ):
     """Update image with additional URLs"""
     pool = await init_pool()
@@ -166,6 +180,14 @@ async def update_image_urls(
     values = []
     param_num = 1
     
+    if original_s3_url:
+        updates.append(f"original_image_url = ${param_num}")
+        values.append(original_s3_url)
+        param_num += 1
+        updates.append(f"original_s3_key = ${param_num}")
+        values.append(original_s3_key)
+        param_num += 1
+    
     if annotated_s3_url:
         updates.append(f"annotated_image_url = ${param_num}")
         values.append(annotated_s3_url)
@@ -207,7 +229,8 @@ async def insert_prediction(
     score: float, 
     x1: int, y1: int, x2: int, y2: int, 
     crop_s3_url: str = None,
-    crop_s3_key: str = None
+    crop_s3_key: str = None,
+    model_version: str = None
 ):
     """Insert prediction record"""
     try:
@@ -223,9 +246,9 @@ async def insert_prediction(
             image_id, pred_id, class_id, class_name, score, 
             confidence, x1, y1, x2, y2, 
             crop_s3_url, crop_s3_key,
-            damage_detected, damage_type, created_at
+            damage_detected, damage_type, model_version, created_at
         )
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, NOW())
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, NOW())
         RETURNING id;
         """
         
@@ -234,7 +257,7 @@ async def insert_prediction(
         row = await pool.fetchrow(
             q, image_id, pred_id, class_id, class_name, score,
             score, x1, y1, x2, y2, crop_s3_url, crop_s3_key,
-            damage_detected, class_name
+            damage_detected, class_name, model_version
         )
         
         pred_id = row['id']
@@ -246,7 +269,429 @@ async def insert_prediction(
         import traceback
         traceback.print_exc()
         raise
+
+async def update_prediction_crops(rows):
+    """Backfill crop URLs/keys: rows of (prediction id, crop_s3_url, crop_s3_key)"""
+    if not rows:
+        return
+    pool = await init_pool()
+    await pool.executemany(
+        "UPDATE predictions SET crop_s3_url = $2, crop_s3_key = $3 WHERE id = $1",
+        rows
+    )
     
+# ============================================================================
+# BULK INSPECTION OPERATIONS
+# ============================================================================
+
+async def _allocate_ids(conn, table: str, column: str, count: int) -> List[int]:
+    """Reserve ``count`` ids from a SERIAL column's sequence in one round trip"""
+    if count == 0:
+        return []
+    rows = await conn.fetch(
+        "SELECT nextval(pg_get_serial_sequence($1, $2)) AS id FROM generate_series(1, $3)",
+        table, column, count
+    )
+    return [r['id'] for r in rows]
+
+async def save_inspections_bulk(inspections: List[Dict]) -> List[Dict]:
+    """
+    Write many inspections (package + image + predictions) in one transaction.
+
+    Each item is a dict with:
+      package:     (tracking_code, status, severity, damage_type, confidence,
+                    inspected_at, inspector_id, notes)
+      image:       (original_url, original_key, annotated_url, annotated_key,
+                    gradcam_url, gradcam_key, shap_url, shap_key)
+      predictions: [(pred_id, class_id, class_name, score, x1, y1, x2, y2,
+                     crop_url, crop_key, damage_detected, damage_type,
+                     model_version), ...]
+
+    Ids are reserved up front so every table is written with a single
+    executemany. Returns {package_id, image_id, prediction_ids} per item,
+    in input order; nothing is written if any statement fails.
+    """
+    if not inspections:
+        return []
+    pool = await init_pool()
+    n_preds = sum(len(item['predictions']) for item in inspections)
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            package_ids = await _allocate_ids(conn, 'packages', 'package_id', len(inspections))
+            image_ids = await _allocate_ids(conn, 'inspection_images', 'image_id', len(inspections))
+            pred_ids = iter(await _allocate_ids(conn, 'predictions', 'id', n_preds))
+
+            await conn.executemany("""
+                INSERT INTO packages (
+                    package_id, tracking_code, status, severity, damage_type, confidence,
+                    timestamp, inspector_id, notes
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, COALESCE($7, NOW() AT TIME ZONE 'UTC'), $8, $9)
+            """, [(pid, *item['package']) for pid, item in zip(package_ids, inspections)])
+
+            await conn.executemany("""
+                INSERT INTO inspection_images (
+                    image_id, package_id,
+                    original_image_url, original_s3_key,
+                    annotated_image_url, annotated_s3_key,
+                    gradcam_s3_url, gradcam_s3_key,
+                    shap_s3_url, shap_s3_key,
+                    uploaded_at
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, NOW())
+            """, [(iid, pid, *item['image']) for iid, pid, item in zip(image_ids, package_ids, inspections)])
+
+            results = []
+            pred_rows = []
+            for package_id, image_id, item in zip(package_ids, image_ids, inspections):
+                ids = []
+                for pred in item['predictions']:
+                    pred_row_id = next(pred_ids)
+                    ids.append(pred_row_id)
+                    pred_rows.append((pred_row_id, image_id, *pred))
+                results.append({'package_id': package_id, 'image_id': image_id, 'prediction_ids': ids})
+
+            if pred_rows:
+                await conn.executemany("""
+                    INSERT INTO predictions (
+                        id, image_id, pred_id, class_id, class_name,
+                        score, confidence, x1, y1, x2, y2,
+                        crop_s3_url, crop_s3_key,
+                        damage_detected, damage_type, model_version, created_at
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, NOW())
+                """, pred_rows)
+
+    return results
+
+async def save_inspection(inspection: Dict) -> Dict:
+    """
+    Write one inspection (same shape as a save_inspections_bulk item) in a
+    single transaction: one statement inserts the package and image and
+    reserves the prediction ids, one executemany inserts the predictions.
+
+    Returns {package_id, image_id, prediction_ids}. Any failure rolls the
+    whole inspection back, so no package is left without its image or
+    predictions.
+    """
+    pool = await init_pool()
+    predictions = inspection['predictions']
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow("""
+                WITH pkg AS (
+                    INSERT INTO packages (
+                        tracking_code, status, severity, damage_type, confidence,
+                        timestamp, inspector_id, notes
+                    )
+                    VALUES ($1, $2, $3, $4, $5, COALESCE($6, NOW() AT TIME ZONE 'UTC'), $7, $8)
+                    RETURNING package_id
+                ), img AS (
+                    INSERT INTO inspection_images (
+                        package_id,
+                        original_image_url, original_s3_key,
+                        annotated_image_url, annotated_s3_key,
+                        gradcam_s3_url, gradcam_s3_key,
+                        shap_s3_url, shap_s3_key,
+                        uploaded_at
+                    )
+                    SELECT package_id, $9, $10, $11, $12, $13, $14, $15, $16, NOW() FROM pkg
+                    RETURNING package_id, image_id
+                )
+                SELECT package_id, image_id,
+                       ARRAY(
+                           SELECT nextval(pg_get_serial_sequence('predictions', 'id'))
+                           FROM generate_series(1, $17::int)
+                       ) AS prediction_ids
+                FROM img
+            """, *inspection['package'], *inspection['image'], len(predictions))
+
+            prediction_ids = list(row['prediction_ids'])
+            if predictions:
+                await conn.executemany("""
+                    INSERT INTO predictions (
+                        id, image_id, pred_id, class_id, class_name,
+                        score, confidence, x1, y1, x2, y2,
+                        crop_s3_url, crop_s3_key,
+                        damage_detected, damage_type, model_version, created_at
+                    )
+                    VALUES ($1, $2, $3, $4, $5, $6, $6, $7, $8, $9, $10, $11, $12, $13, $14, $15, NOW())
+                """, [(pred_row_id, row['image_id'], *pred) for pred_row_id, pred in zip(prediction_ids, predictions)])
+
+    return {'package_id': row['package_id'], 'image_id': row['image_id'], 'prediction_ids': prediction_ids}
+
+async def reserve_ids(table: str, column: str, count: int) -> List[int]:
+    """Reserve a block of ids from a SERIAL column (write-behind buffer)"""
+    pool = await init_pool()
+    async with pool.acquire() as conn:
+        return await _allocate_ids(conn, table, column, count)
+
+async def copy_inspections(items: List[Tuple[Dict, Dict]]):
+    """
+    COPY inspections whose ids were reserved up front into packages,
+    inspection_images and predictions in one transaction.
+
+    items: ({package_id, image_id, prediction_ids}, save_inspection item)
+    """
+    packages, images, predictions = [], [], []
+    for ids, item in items:
+        tracking_code, status, severity, damage_type, confidence, inspected_at, inspector_id, notes = item['package']
+        packages.append((
+            ids['package_id'], tracking_code, status, severity, damage_type, confidence,
+            inspected_at or datetime.utcnow(), inspector_id, notes
+        ))
+        images.append((ids['image_id'], ids['package_id'], *item['image']))
+        for pred_row_id, (pred_id, class_id, class_name, score, *rest) in zip(ids['prediction_ids'], item['predictions']):
+            predictions.append((pred_row_id, ids['image_id'], pred_id, class_id, class_name, score, score, *rest))
+
+    pool = await init_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.copy_records_to_table('packages', records=packages, columns=[
+                'package_id', 'tracking_code', 'status', 'severity', 'damage_type', 'confidence',
+                'timestamp', 'inspector_id', 'notes'
+            ])
+            await conn.copy_records_to_table('inspection_images', records=images, columns=[
+                'image_id', 'package_id',
+                'original_image_url', 'original_s3_key',
+                'annotated_image_url', 'annotated_s3_key',
+                'gradcam_s3_url', 'gradcam_s3_key',
+                'shap_s3_url', 'shap_s3_key'
+            ])
+            if predictions:
+                await conn.copy_records_to_table('predictions', records=predictions, columns=[
+                    'id', 'image_id', 'pred_id', 'class_id', 'class_name',
+                    'score', 'confidence', 'x1', 'y1', 'x2', 'y2',
+                    'crop_s3_url', 'crop_s3_key',
+                    'damage_detected', 'damage_type', 'model_version'
+                ])
+
+# ============================================================================
+# RESULT CACHE OPERATIONS
+# ============================================================================
+
+async def ensure_detection_cache_table():
+    """Create the persistent result-cache table if missing"""
+    pool = await init_pool()
+    await pool.execute("""
+        CREATE TABLE IF NOT EXISTS detection_cache (
+            cache_key TEXT PRIMARY KEY,
+            payload JSONB NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await pool.execute("CREATE INDEX IF NOT EXISTS idx_detection_cache_created_at ON detection_cache (created_at)")
+
+async def get_cached_detection(cache_key: str, ttl_hours: float) -> Optional[str]:
+    """Get a cached detect payload (JSON text) by key, unless it is older than ttl_hours"""
+    pool = await init_pool()
+    return await pool.fetchval("""
+        SELECT payload::text FROM detection_cache
+        WHERE cache_key = $1 AND created_at > NOW() - $2 * INTERVAL '1 hour'
+    """, cache_key, float(ttl_hours))
+
+async def prune_detection_cache(ttl_hours: float) -> int:
+    """Delete cached payloads older than ttl_hours; returns the number removed"""
+    pool = await init_pool()
+    status = await pool.execute(
+        "DELETE FROM detection_cache WHERE created_at <= NOW() - $1 * INTERVAL '1 hour'",
+        float(ttl_hours)
+    )
+    return int(status.split()[-1])
+
+async def put_cached_detection(cache_key: str, payload: str):
+    """Insert or refresh a cached detect payload"""
+    pool = await init_pool()
+    await pool.execute("""
+        INSERT INTO detection_cache (cache_key, payload, created_at)
+        VALUES ($1, $2::jsonb, NOW())
+        ON CONFLICT (cache_key) DO UPDATE
+        SET payload = EXCLUDED.payload, created_at = NOW()
+    """, cache_key, payload)
+
+# ============================================================================
+# EXPLANATION JOB OPERATIONS
+# ============================================================================
+
+async def ensure_explanation_jobs_table():
+    """Create the deferred-explainability job table if missing"""
+    pool = await init_pool()
+    await pool.execute("""
+        CREATE TABLE IF NOT EXISTS explanation_jobs (
+            job_id SERIAL PRIMARY KEY,
+            package_id INTEGER REFERENCES packages(package_id) ON DELETE CASCADE,
+            image_id INTEGER REFERENCES inspection_images(image_id) ON DELETE CASCADE,
+            tracking_code VARCHAR(100) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            boxes JSONB NOT NULL,
+            original_s3_key TEXT,
+            model_version VARCHAR(100),
+            gradcam_s3_key TEXT,
+            shap_s3_key TEXT,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    # tables created before jobs recorded the model that produced their boxes
+    await pool.execute("ALTER TABLE explanation_jobs ADD COLUMN IF NOT EXISTS model_version VARCHAR(100)")
+    await pool.execute(
+        "CREATE INDEX IF NOT EXISTS idx_explanation_jobs_tracking_code ON explanation_jobs(tracking_code)"
+    )
+    await pool.execute(
+        "CREATE INDEX IF NOT EXISTS idx_explanation_jobs_status ON explanation_jobs(status)"
+    )
+
+async def insert_explanation_job(
+    package_id: int,
+    image_id: int,
+    tracking_code: str,
+    boxes_json: str,
+    original_s3_key: str = None,
+    model_version: str = None
+) -> int:
+    """Queue an explanation job; boxes_json is [[x1, y1, x2, y2, conf], ...] from model_version"""
+    pool = await init_pool()
+    return await pool.fetchval("""
+        INSERT INTO explanation_jobs (package_id, image_id, tracking_code, boxes, original_s3_key, model_version)
+        VALUES ($1, $2, $3, $4::jsonb, $5, $6)
+        RETURNING job_id
+    """, package_id, image_id, tracking_code, boxes_json, original_s3_key, model_version)
+
+async def update_explanation_job(
+    job_id: int,
+    status: str,
+    error: str = None,
+    gradcam_s3_key: str = None,
+    shap_s3_key: str = None,
+    increment_attempts: bool = False
+):
+    """Move a job to a new status (keys are only written when given)"""
+    pool = await init_pool()
+    await pool.execute("""
+        UPDATE explanation_jobs
+        SET status = $2,
+            error = $3,
+            gradcam_s3_key = COALESCE($4, gradcam_s3_key),
+            shap_s3_key = COALESCE($5, shap_s3_key),
+            attempts = attempts + $6,
+            updated_at = NOW()
+        WHERE job_id = $1
+    """, job_id, status, error, gradcam_s3_key, shap_s3_key, 1 if increment_attempts else 0)
+
+async def get_explanation_job(job_id: int):
+    """Get one explanation job by id (boxes as JSON text)"""
+    pool = await init_pool()
+    return await pool.fetchrow(
+        "SELECT *, boxes::text AS boxes_json FROM explanation_jobs WHERE job_id = $1",
+        job_id
+    )
+
+async def get_latest_explanation_job(tracking_code: str):
+    """Most recent explanation job of a package"""
+    pool = await init_pool()
+    return await pool.fetchrow("""
+        SELECT * FROM explanation_jobs
+        WHERE tracking_code = $1
+        ORDER BY created_at DESC, job_id DESC
+        LIMIT 1
+    """, tracking_code)
+
+async def get_unfinished_explanation_jobs() -> List[int]:
+    """Ids of jobs that were queued or running when the API last stopped"""
+    pool = await init_pool()
+    rows = await pool.fetch("""
+        SELECT job_id FROM explanation_jobs
+        WHERE status IN ('queued', 'running')
+        ORDER BY created_at
+    """)
+    return [r['job_id'] for r in rows]
+
+# ============================================================================
+# DETECTION JOB OPERATIONS
+# ============================================================================
+
+async def ensure_detection_jobs_table():
+    """Create the asynchronous detection job table if missing"""
+    pool = await init_pool()
+    await pool.execute("""
+        CREATE TABLE IF NOT EXISTS detection_jobs (
+            job_id VARCHAR(64) PRIMARY KEY,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            username VARCHAR(100),
+            filename TEXT,
+            content_type VARCHAR(100),
+            tracking_code VARCHAR(100),
+            image BYTEA,
+            result JSONB,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT NOW(),
+            updated_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+    await pool.execute(
+        "CREATE INDEX IF NOT EXISTS idx_detection_jobs_status ON detection_jobs(status)"
+    )
+
+async def insert_detection_job(
+    job_id: str,
+    username: str,
+    filename: str,
+    content_type: str,
+    image: bytes,
+    tracking_code: str = None
+):
+    """Queue a detection job together with the uploaded image bytes"""
+    pool = await init_pool()
+    await pool.execute("""
+        INSERT INTO detection_jobs (job_id, username, filename, content_type, image, tracking_code)
+        VALUES ($1, $2, $3, $4, $5, $6)
+    """, job_id, username, filename, content_type, image, tracking_code)
+
+async def update_detection_job(
+    job_id: str,
+    status: str,
+    result_json: str = None,
+    error: str = None,
+    increment_attempts: bool = False
+):
+    """Move a job to a new status; the image is dropped once the job is finished"""
+    pool = await init_pool()
+    await pool.execute("""
+        UPDATE detection_jobs
+        SET status = $2,
+            result = COALESCE($3::jsonb, result),
+            error = $4,
+            attempts = attempts + $5,
+            image = CASE WHEN $2 IN ('done', 'failed') THEN NULL ELSE image END,
+            updated_at = NOW()
+        WHERE job_id = $1
+    """, job_id, status, result_json, error, 1 if increment_attempts else 0)
+
+async def get_detection_job(job_id: str, with_image: bool = False):
+    """Get one detection job by id (result as JSON text)"""
+    pool = await init_pool()
+    image = "image" if with_image else "NULL::bytea AS image"
+    return await pool.fetchrow(f"""
+        SELECT job_id, status, username, filename, content_type, tracking_code,
+               {image}, result::text AS result_json, error, attempts, created_at, updated_at
+        FROM detection_jobs WHERE job_id = $1
+    """, job_id)
+
+async def get_unfinished_detection_jobs() -> List[str]:
+    """Ids of jobs that were queued or running when the API last stopped"""
+    pool = await init_pool()
+    rows = await pool.fetch("""
+        SELECT job_id FROM detection_jobs
+        WHERE status IN ('queued', 'running')
+        ORDER BY created_at
+    """)
+    return [r['job_id'] for r in rows]
+
 # ============================================================================
 # ANALYTICS OPERATIONS
 # ============================================================================
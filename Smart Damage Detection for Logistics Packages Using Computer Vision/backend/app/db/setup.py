@@ -139,6 +139,7 @@ async def setup_database():
                 y2 INTEGER,
                 crop_s3_url TEXT,
                 crop_s3_key TEXT,
+                model_version VARCHAR(255),
                 created_at TIMESTAMP DEFAULT NOW(),
                 CONSTRAINT fk_image 
                     FOREIGN KEY (image_id) 
@@ -158,6 +159,7 @@ async def setup_database():
             "CREATE INDEX idx_images_package_id ON inspection_images(package_id)",
             "CREATE INDEX idx_predictions_image_id ON predictions(image_id)",
             "CREATE INDEX idx_predictions_class_name ON predictions(class_name)",
+            "CREATE INDEX idx_predictions_model_version ON predictions(model_version)",
             "CREATE INDEX idx_users_username ON users(username)",
         ]
         for idx in indexes:
@@ -0,0 +1,45 @@
+"""
+Add model_version Column to Predictions
+Records which weights/backend/precision produced each prediction so
+results stay traceable across model hot-swaps.
+"""
+
+import os
+import asyncio
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+async def add_model_version():
+    print("="*70)
+    print("🔧 ADDING model_version TO PREDICTIONS TABLE")
+    print("="*70)
+
+    conn = await asyncpg.connect(os.getenv("POSTGRES_DSN"))
+
+    try:
+        print("\n1️⃣ Adding column...")
+        await conn.execute("ALTER TABLE predictions ADD COLUMN IF NOT EXISTS model_version VARCHAR(255);")
+        print("   ✅ Column present")
+
+        print("\n2️⃣ Creating index...")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_model_version ON predictions(model_version);")
+        print("   ✅ Index present")
+
+        untagged = await conn.fetchval("SELECT COUNT(*) FROM predictions WHERE model_version IS NULL")
+        print(f"\n   ℹ️  {untagged} existing predictions have no model version (made before this migration)")
+
+        print("\n" + "="*70)
+        print("✨ PREDICTIONS TABLE UPDATED SUCCESSFULLY!")
+        print("="*70)
+
+    except Exception as e:
+        print(f"\n❌ ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(add_model_version())
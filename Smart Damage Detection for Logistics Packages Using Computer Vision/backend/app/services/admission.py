@@ -0,0 +1,210 @@
+# backend/app/services/admission.py
+"""
+Admission control for detection requests
+
+At most ADMISSION_MAX_INFLIGHT detections run at once. Further requests
+wait in a bounded per-lane queue (ADMISSION_MAX_QUEUE); when that is full
+they are rejected right away with 429, and a request that waits longer
+than ADMISSION_QUEUE_TIMEOUT seconds gets 503. Both carry Retry-After.
+This keeps an upload spike from piling decoded images up in memory.
+
+Lanes: 'interactive' (UI uploads) and 'bulk' (batch endpoint, async
+jobs, backfills). With ADMISSION_PRIORITY=1 a freed slot always goes to a
+waiting interactive request first, and an interactive request only queues
+behind other interactive ones (never behind bulk waiters); otherwise both
+lanes are served in arrival order. Bulk callers that must not be rejected (durable job
+workers) wait without a queue limit or timeout; the HTTP batch endpoint
+uses the bounded bulk queue like any other request.
+
+A request can take several slots at once (weight): a batch chunk holds
+one slot per image, so ADMISSION_MAX_INFLIGHT bounds the decoded images
+in memory and not just the number of requests.
+"""
+
+import os
+import time
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Tuple
+
+from services import metrics
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", 16))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))          # per lane
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+ADMISSION_PRIORITY = os.getenv("ADMISSION_PRIORITY", "1") == "1"
+
+LANES = ("interactive", "bulk")
+
+inflight_gauge = metrics.gauge("admission_inflight", "Detections currently running")
+queue_wait_hist = metrics.histogram("admission_queue_wait_ms", metrics.LATENCY_MS_BUCKETS, "Time a detection waited for a slot")
+queue_gauges = {lane: metrics.gauge(f"admission_queue_depth_{lane}", f"{lane.capitalize()} detections waiting for a slot") for lane in LANES}
+admitted = {lane: metrics.counter(f"admission_admitted_{lane}", f"{lane.capitalize()} detections admitted") for lane in LANES}
+rejected_full = {lane: metrics.counter(f"admission_rejected_queue_full_{lane}", f"{lane.capitalize()} detections rejected, queue full (429)") for lane in LANES}
+rejected_timeout = {lane: metrics.counter(f"admission_rejected_timeout_{lane}", f"{lane.capitalize()} detections rejected after waiting too long (503)") for lane in LANES}
+
+
+class Rejected(Exception):
+    """Request not admitted; status_code is 429 (queue full) or 503 (waited too long)"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = ADMISSION_RETRY_AFTER):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Counting semaphore with bounded, prioritised wait queues"""
+
+    def __init__(self, max_inflight: int = ADMISSION_MAX_INFLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT, priority: bool = ADMISSION_PRIORITY):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.priority = priority
+        self.inflight = 0
+        self._arrival = itertools.count()
+        self._waiters: Dict[str, Deque[Tuple[int, asyncio.Future, int]]] = {lane: deque() for lane in LANES}
+
+    def _update_gauges(self):
+        inflight_gauge.set(self.inflight)
+        for lane, waiters in self._waiters.items():
+            queue_gauges[lane].set(len(waiters))
+
+    def _next_waiter(self):
+        """Deque holding the waiter that gets the next free slot"""
+        queues = [q for q in (self._waiters[lane] for lane in LANES) if q]
+        if not queues:
+            return None
+        if self.priority:
+            return queues[0]  # LANES is in priority order
+        return min(queues, key=lambda q: q[0][0])
+
+    def _ahead(self, lane: str) -> bool:
+        """Whether someone queued in front of a new request of this lane"""
+        if self.priority:
+            # only lanes of the same or higher priority are in front
+            return any(self._waiters[other] for other in LANES[:LANES.index(lane) + 1])
+        return any(self._waiters.values())
+
+    def _can_admit(self, lane: str, weight: int) -> bool:
+        return self.inflight + weight <= self.max_inflight and not self._ahead(lane)
+
+    def _weight(self, weight: int) -> int:
+        # more than the whole capacity would never be admitted
+        return min(max(1, weight), self.max_inflight)
+
+    def _wake(self):
+        while True:
+            queue = self._next_waiter()
+            if queue is None:
+                break
+            _, fut, weight = queue[0]
+            if fut.done():  # cancelled while waiting
+                queue.popleft()
+                continue
+            if self.inflight + weight > self.max_inflight:
+                break  # first in line waits for enough slots; nobody overtakes it
+            queue.popleft()
+            self.inflight += weight
+            fut.set_result(True)
+        self._update_gauges()
+
+    async def acquire(self, lane: str = "interactive", wait: bool = False, weight: int = 1):
+        """
+        Take `weight` slots or raise Rejected.
+
+        wait=True queues without limit or timeout (callers that must not
+        be shed, e.g. durable job workers).
+        """
+        lane = lane if lane in LANES else "interactive"
+        weight = self._weight(weight)
+        if self._can_admit(lane, weight):
+            self.inflight += weight
+            admitted[lane].inc()
+            self._update_gauges()
+            return
+
+        waiters = self._waiters[lane]
+        if not wait and len(waiters) >= self.max_queue:
+            rejected_full[lane].inc()
+            raise Rejected(429, f"Too many queued {lane} detections, retry later")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (next(self._arrival), fut, weight)
+        waiters.append(entry)
+        self._wake()  # slots may be free with only lower-priority waiters blocked
+        started = time.perf_counter()
+        try:
+            if wait:
+                await fut
+            else:
+                await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiters, entry, fut, weight)
+            rejected_timeout[lane].inc()
+            raise Rejected(503, f"Server busy: no detection slot within {self.queue_timeout:.0f}s")
+        except asyncio.CancelledError:
+            self._abandon(waiters, entry, fut, weight)
+            raise
+        queue_wait_hist.observe((time.perf_counter() - started) * 1000)
+        admitted[lane].inc()
+
+    def check(self, lane: str = "interactive", weight: int = 1):
+        """Raise Rejected(429) if acquire() would shed this request right now; never waits"""
+        if not ADMISSION_ENABLED:
+            return
+        lane = lane if lane in LANES else "interactive"
+        if not self._can_admit(lane, self._weight(weight)) and len(self._waiters[lane]) >= self.max_queue:
+            rejected_full[lane].inc()
+            raise Rejected(429, f"Too many queued {lane} detections, retry later")
+
+    def _abandon(self, waiters, entry, fut, weight: int = 1):
+        if fut.done() and not fut.cancelled():
+            # the slots were granted just as we gave up; hand them on
+            self.release(weight)
+        else:
+            fut.cancel()
+            try:
+                waiters.remove(entry)
+            except ValueError:
+                pass
+            self._wake()  # a heavy waiter may have been holding up lighter ones
+        self._update_gauges()
+
+    def release(self, weight: int = 1):
+        self.inflight = max(0, self.inflight - self._weight(weight))
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = "interactive", wait: bool = False, weight: int = 1):
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        await self.acquire(lane, wait, weight)
+        try:
+            yield
+        finally:
+            self.release(weight)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": ADMISSION_ENABLED,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "priority_lanes": self.priority,
+            "inflight": self.inflight,
+            "queued": {lane: len(w) for lane, w in self._waiters.items()},
+            "admitted": {lane: admitted[lane].value for lane in LANES},
+            "rejected_queue_full": {lane: rejected_full[lane].value for lane in LANES},
+            "rejected_timeout": {lane: rejected_timeout[lane].value for lane in LANES},
+        }
+
+
+controller = AdmissionController()
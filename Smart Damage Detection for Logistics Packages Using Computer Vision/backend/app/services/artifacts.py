@@ -0,0 +1,135 @@
+# backend/app/services/artifacts.py
+"""
+Short-lived artifact URLs for slim detect responses
+
+With image_mode=url (or multipart) the annotated / GradCAM / SHAP images
+are not inlined as base64 data URLs. Their JPEG bytes go into a bounded
+in-memory cache and the response carries a signed path instead:
+
+    /api/artifacts/{artifact_id}?key=<s3 key>&expires=<unix ts>&sig=<hmac>
+
+The HMAC (SECRET_KEY) covers id, S3 key and expiry, so the URL itself is
+the credential and works in <img src>. GET /api/artifacts serves the
+bytes from the cache; once they are evicted it redirects to a presigned
+S3 URL for the key.
+"""
+
+import os
+import hmac
+import time
+import uuid
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from services import metrics
+
+ARTIFACT_URL_TTL = int(os.getenv("ARTIFACT_URL_TTL", 300))  # seconds a signed URL stays valid
+ARTIFACT_CACHE_MB = int(os.getenv("ARTIFACT_CACHE_MB", 256))
+ARTIFACT_PATH = "/api/artifacts"
+
+_SECRET = os.getenv("SECRET_KEY", "your-secret-key-change-this").encode()
+
+cache_hits = metrics.counter("artifact_cache_hits", "Artifact requests served from memory")
+cache_misses = metrics.counter("artifact_cache_misses", "Artifact requests that fell back to S3")
+
+
+class ArtifactCache:
+    """LRU of artifact bytes bounded by total size; entries expire with their URLs"""
+
+    def __init__(self, max_bytes: int = ARTIFACT_CACHE_MB * 1024 * 1024, ttl: int = ARTIFACT_URL_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._items: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+
+    def put(self, data: bytes, content_type: str = "image/jpeg") -> str:
+        artifact_id = uuid.uuid4().hex
+        if len(data) <= self.max_bytes:
+            self._items[artifact_id] = (data, content_type, time.time() + self.ttl)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, (old, _, _) = self._items.popitem(last=False)
+                self.bytes -= len(old)
+        return artifact_id
+
+    def get(self, artifact_id: str) -> Optional[Tuple[bytes, str]]:
+        item = self._items.get(artifact_id)
+        if item is None:
+            return None
+        data, content_type, expires_at = item
+        if expires_at < time.time():
+            del self._items[artifact_id]
+            self.bytes -= len(data)
+            return None
+        self._items.move_to_end(artifact_id)
+        return data, content_type
+
+    def touch(self, artifact_id: str) -> bool:
+        """Keep an entry alive for another ttl; False if it is gone"""
+        item = self.get(artifact_id)
+        if item is None:
+            return False
+        self._items[artifact_id] = (*item, time.time() + self.ttl)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._items),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": cache_hits.value,
+            "misses": cache_misses.value,
+        }
+
+
+cache = ArtifactCache()
+
+
+def _signature(artifact_id: str, s3_key: str, expires: int) -> str:
+    msg = f"{artifact_id}|{s3_key or ''}|{expires}".encode()
+    return hmac.new(_SECRET, msg, hashlib.sha256).hexdigest()[:32]
+
+
+def sign(artifact_id: str, s3_key: str = None, ttl: int = None) -> str:
+    """Signed, expiring path for an artifact"""
+    expires = int(time.time()) + (ttl or ARTIFACT_URL_TTL)
+    params = {"expires": expires, "sig": _signature(artifact_id, s3_key, expires)}
+    if s3_key:
+        params["key"] = s3_key
+    return f"{ARTIFACT_PATH}/{artifact_id}?{urlencode(params)}"
+
+
+def sign_s3(s3_key: str, ttl: int = None) -> str:
+    """Signed path for an object that only exists in S3 (served as a redirect to a presigned URL)"""
+    return sign(hashlib.sha256(s3_key.encode()).hexdigest()[:32], s3_key, ttl)
+
+
+def verify(artifact_id: str, s3_key: Optional[str], expires: int, sig: str) -> bool:
+    return expires >= time.time() and hmac.compare_digest(_signature(artifact_id, s3_key, expires), sig or "")
+
+
+def store(data: bytes, s3_key: str = None, content_type: str = "image/jpeg") -> str:
+    """Cache artifact bytes and return their signed URL"""
+    return sign(cache.put(data, content_type), s3_key)
+
+
+def parse(url: str) -> Optional[Tuple[str, Optional[str]]]:
+    """(artifact_id, s3_key) of a signed artifact URL, None for anything else"""
+    if not url or not url.startswith(ARTIFACT_PATH + "/"):
+        return None
+    parsed = urlparse(url)
+    key = parse_qs(parsed.query).get("key", [None])[0]
+    return parsed.path[len(ARTIFACT_PATH) + 1:], key
+
+
+def resign(url: str) -> Optional[str]:
+    """Fresh expiry for a signed URL (result-cache hits); None if the artifact is gone"""
+    ref = parse(url)
+    if ref is None:
+        return url
+    artifact_id, s3_key = ref
+    if not cache.touch(artifact_id) and s3_key is None:
+        return None
+    return sign(artifact_id, s3_key)
@@ -0,0 +1,77 @@
+# backend/app/services/cascade.py
+"""
+Two-stage detection cascade
+
+Stage 1 runs the detector at a low resolution (CASCADE_GATE_IMGSZ) with a
+permissive confidence. If it finds no damage candidate above
+CASCADE_CLEAR_BELOW the package is cleared on the gate result alone;
+otherwise (uncertain or damaged) it escalates to the full-resolution
+detector. Escalation rate and per-stage latency are recorded in metrics.
+"""
+
+import os
+import time
+from typing import Callable, Tuple
+
+import numpy as np
+
+from services import metrics
+
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "0") == "1"
+CASCADE_GATE_IMGSZ = int(os.getenv("CASCADE_GATE_IMGSZ", 320))
+CASCADE_GATE_CONF = float(os.getenv("CASCADE_GATE_CONF", 0.05))     # candidates the gate reports
+CASCADE_CLEAR_BELOW = float(os.getenv("CASCADE_CLEAR_BELOW", 0.15))  # max damage score that still clears
+
+gate_latency_hist = metrics.histogram("cascade_gate_latency_ms", metrics.LATENCY_MS_BUCKETS, "Stage-1 gate inference latency")
+full_latency_hist = metrics.histogram("cascade_full_latency_ms", metrics.LATENCY_MS_BUCKETS, "Stage-2 full-resolution inference latency")
+gate_cleared = metrics.counter("cascade_cleared", "Packages cleared by the stage-1 gate")
+gate_escalated = metrics.counter("cascade_escalated", "Packages escalated to the full detector")
+
+
+def config_tag() -> str:
+    """Settings that change cascade results (part of the result-cache key)"""
+    if not CASCADE_ENABLED:
+        return "cascade=off"
+    return f"cascade={CASCADE_GATE_IMGSZ}/{CASCADE_GATE_CONF}/{CASCADE_CLEAR_BELOW}"
+
+
+async def run(scheduler, img, imgsz: int, conf: float,
+              damage_mask: Callable[[np.ndarray], np.ndarray],
+              full_stage: Callable = None) -> Tuple[np.ndarray, str]:
+    """
+    Run the gate and, if needed, the full detector.
+
+    full_stage: coroutine function (img, imgsz, conf) for stage 2; defaults
+    to scheduler.submit (pass scheduler.submit_tiled for large images).
+    Returns (detections, stage) where stage is 'gate' or 'full'.
+    """
+    t0 = time.perf_counter()
+    gate = await scheduler.submit(img, imgsz=CASCADE_GATE_IMGSZ, conf=min(conf, CASCADE_GATE_CONF))
+    gate_latency_hist.observe((time.perf_counter() - t0) * 1000)
+
+    damage = gate[damage_mask(gate)]
+    max_damage = float(damage["conf"].max()) if len(damage) else 0.0
+    if max_damage < CASCADE_CLEAR_BELOW:
+        gate_cleared.inc()
+        # report only what the full detector's threshold would have kept
+        return gate[gate["conf"] >= conf], "gate"
+
+    gate_escalated.inc()
+    t1 = time.perf_counter()
+    full_stage = full_stage or scheduler.submit
+    dets = await full_stage(img, imgsz=imgsz, conf=conf)
+    full_latency_hist.observe((time.perf_counter() - t1) * 1000)
+    return dets, "full"
+
+
+def stats() -> dict:
+    total = gate_cleared.value + gate_escalated.value
+    return {
+        "enabled": CASCADE_ENABLED,
+        "gate_imgsz": CASCADE_GATE_IMGSZ,
+        "gate_conf": CASCADE_GATE_CONF,
+        "clear_below": CASCADE_CLEAR_BELOW,
+        "cleared": gate_cleared.value,
+        "escalated": gate_escalated.value,
+        "escalation_rate": round(gate_escalated.value / total, 4) if total else None,
+    }
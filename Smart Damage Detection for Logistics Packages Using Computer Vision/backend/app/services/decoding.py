@@ -0,0 +1,109 @@
+# backend/app/services/decoding.py
+"""
+Upload decoding at the smallest sufficient resolution
+
+The detector only sees IMG_SZ pixels and the rendered artifacts don't
+need more than DECODE_MIN_SIDE on the long side, so a 12MP phone photo
+does not have to be decoded at full size. The image header is read
+first (no pixel decode) and the largest power-of-two reduction that keeps
+the long side >= max(IMG_SZ, DECODE_MIN_SIDE) is handed to
+cv2.imdecode(IMREAD_REDUCED_COLOR_*), which lets libjpeg decode straight
+to the smaller size and applies the EXIF orientation.
+
+The BGR buffer is converted to RGB in place and wrapped in the PIL image
+the scheduler needs, instead of the previous decode -> exif_transpose
+copy -> convert copy -> np.array copy chain.
+
+Images that will be tiled (services/tiling.py) are always decoded at full
+resolution, and anything OpenCV can't read falls back to Pillow.
+"""
+
+import io
+import os
+from typing import Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from services import tiling
+
+DECODE_REDUCED = os.getenv("DECODE_REDUCED", "1") == "1"
+DECODE_MIN_SIDE = int(os.getenv("DECODE_MIN_SIDE", 1280))
+
+_REDUCED_FLAGS = {
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    1: cv2.IMREAD_COLOR,
+}
+
+
+def min_side() -> int:
+    return max(int(os.getenv("IMG_SZ", 640)), DECODE_MIN_SIDE)
+
+
+def reduction_factor(width: int, height: int) -> int:
+    """Largest 1/2/4/8 reduction that keeps the long side >= min_side()"""
+    if not DECODE_REDUCED or tiling.should_tile(width, height):
+        return 1
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if long_side // factor >= min_side():
+            return factor
+    return 1
+
+
+def config_tag() -> str:
+    """Settings that change the decoded size (part of the result-cache key)"""
+    return f"decode={min_side()}" if DECODE_REDUCED else "decode=full"
+
+
+def _decode_pil(data: bytes) -> Tuple[Image.Image, np.ndarray]:
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return img, np.array(img)
+
+
+def _header_size(data: bytes) -> Tuple[int, int]:
+    """(width, height) of the upright original, from the header only; (0, 0) if unreadable"""
+    try:
+        header = Image.open(io.BytesIO(data))
+        width, height = header.size
+        if header.getexif().get(0x0112) in (5, 6, 7, 8):  # EXIF orientation turns it by 90 degrees
+            width, height = height, width
+        return width, height
+    except Exception:
+        return 0, 0
+
+
+def decode(data: bytes) -> Tuple[Image.Image, np.ndarray, int, Tuple[int, int]]:
+    """
+    Decode upload bytes -> (PIL RGB image, RGB array, reduction factor,
+    original (width, height)).
+
+    Box coordinates refer to the decoded size; multiply by the factor to
+    map them onto the original photo (app.summarize_detections does this
+    for everything returned or stored, so predictions rows always match
+    the full-resolution original in S3). A reduced decode rounds odd
+    sizes up, so decoded size x factor can exceed the original size:
+    clamp to the size returned here.
+    """
+    width, height = _header_size(data)
+    factor = reduction_factor(width, height)
+
+    array = cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED_FLAGS[factor])
+    if array is None:
+        img, array = _decode_pil(data)
+        if not width:
+            width, height = img.size
+        if factor > 1:
+            img = img.reduce(factor)
+            array = np.array(img)
+        return img, array, factor, (width, height)
+
+    cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array)
+    if not width:
+        height, width = array.shape[:2]
+    return Image.fromarray(array), array, factor, (width, height)
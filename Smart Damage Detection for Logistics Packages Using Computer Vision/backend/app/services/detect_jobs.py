@@ -0,0 +1,265 @@
+# backend/app/services/detect_jobs.py
+"""
+Asynchronous detection jobs (POST /api/jobs/detect)
+
+A submitted image is stored with its job and acknowledged right away; a
+fixed number of asyncio workers (DETECT_JOB_WORKERS) run it through the
+normal detect pipeline. Ingestion bursts therefore wait in the queue
+instead of holding HTTP requests open until they time out.
+
+Backends (DETECT_JOB_BACKEND):
+  postgres - jobs and their image bytes live in the detection_jobs table;
+             queued/running jobs are picked up again after a restart
+  memory   - jobs live in this process only (lost on restart)
+  auto     - postgres when POSTGRES_DSN is set, else memory
+
+Every status change is announced to subscribers (SSE endpoint) through a
+per-job asyncio.Event; GET /api/jobs/{id} polls the same state.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from services import metrics
+
+DETECT_JOB_BACKEND = os.getenv("DETECT_JOB_BACKEND", "auto").lower()  # auto | postgres | memory
+DETECT_JOB_WORKERS = int(os.getenv("DETECT_JOB_WORKERS", 4))
+DETECT_JOB_MAX_PENDING = int(os.getenv("DETECT_JOB_MAX_PENDING", 1000))
+DETECT_JOB_MAX_ATTEMPTS = int(os.getenv("DETECT_JOB_MAX_ATTEMPTS", 3))
+DETECT_JOB_RETAIN = int(os.getenv("DETECT_JOB_RETAIN", 1000))  # finished jobs kept by the memory backend
+
+FINISHED = ('done', 'failed')
+
+jobs_submitted = metrics.counter("detection_jobs_submitted", "Asynchronous detection jobs accepted")
+jobs_completed = metrics.counter("detection_jobs_completed", "Asynchronous detection jobs finished")
+jobs_failed = metrics.counter("detection_jobs_failed", "Asynchronous detection jobs that gave up")
+job_wait_hist = metrics.histogram("detection_job_queue_wait_ms", metrics.LATENCY_MS_BUCKETS, "Time a detection job waited for a worker")
+
+# (content, filename, content_type, username, tracking_code) -> detect response
+Handler = Callable[[bytes, str, str, str, Optional[str]], Awaitable[Dict]]
+
+
+class QueueFull(Exception):
+    """More than DETECT_JOB_MAX_PENDING jobs are waiting"""
+
+
+def backend() -> str:
+    if DETECT_JOB_BACKEND == "auto":
+        return "postgres" if os.getenv("POSTGRES_DSN") else "memory"
+    return DETECT_JOB_BACKEND
+
+
+class DetectionJobQueue:
+    """Durable job store plus a bounded pool of asyncio workers"""
+
+    def __init__(self, workers: int = DETECT_JOB_WORKERS, max_pending: int = DETECT_JOB_MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.backend = backend()
+        self._handler: Optional[Handler] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()  # memory backend
+        self._images: Dict[str, bytes] = {}                    # memory backend, until finished
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, handler: Handler):
+        """Start the workers; the postgres backend also requeues unfinished jobs"""
+        if self.running:
+            return
+        self._handler = handler
+        self._queue = asyncio.Queue()
+        unfinished = []
+        if self.backend == "postgres":
+            from db import pg
+            await pg.ensure_detection_jobs_table()
+            unfinished = await pg.get_unfinished_detection_jobs()
+            for job_id in unfinished:
+                self._queue.put_nowait((job_id, None))
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        print(f"✅ Detection job queue started ({self.backend}, {self.workers} workers, {len(unfinished)} job(s) requeued)")
+
+    async def stop(self):
+        """Stop the workers; postgres jobs stay queued/running and resume on the next start"""
+        if not self.running:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for event in self._changed.values():
+            event.set()
+        print("🔒 Detection job queue stopped")
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, content: bytes, filename: str, content_type: str,
+                     username: str, tracking_code: str = None) -> Dict:
+        """Store a job and hand it to the workers; returns its public view"""
+        if self.pending() >= self.max_pending:
+            raise QueueFull(f"{self.pending()} detection jobs already waiting")
+        job_id = uuid.uuid4().hex
+        if self.backend == "postgres":
+            from db import pg
+            await pg.insert_detection_job(job_id, username, filename, content_type, content, tracking_code)
+        else:
+            now = datetime.utcnow()
+            self._jobs[job_id] = {
+                'job_id': job_id, 'status': 'queued', 'username': username,
+                'filename': filename, 'content_type': content_type,
+                'tracking_code': tracking_code, 'result': None, 'error': None,
+                'attempts': 0, 'created_at': now, 'updated_at': now,
+            }
+            self._images[job_id] = content
+        self._queue.put_nowait((job_id, asyncio.get_running_loop().time()))
+        jobs_submitted.inc()
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Public view of a job (result only once it is done)"""
+        if self.backend == "postgres":
+            from db import pg
+            row = await pg.get_detection_job(job_id)
+            if row is None:
+                return None
+            job = dict(row)
+            job.pop('image', None)
+            result_json = job.pop('result_json', None)
+            job['result'] = json.loads(result_json) if result_json else None
+        else:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        for ts in ('created_at', 'updated_at'):
+            if isinstance(job.get(ts), datetime):
+                job[ts] = job[ts].isoformat()
+        return job
+
+    async def updates(self, job_id: str, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """
+        Yield the job's state now and after every change until it finishes.
+
+        Yields None when nothing changed for ``keepalive`` seconds so the
+        caller can keep the connection open.
+        """
+        last = None
+        while True:
+            # take the event before reading so a change in between is not missed
+            event = self._changed.setdefault(job_id, asyncio.Event())
+            job = await self.get(job_id)
+            if job is None:
+                self._changed.pop(job_id, None)
+                return
+            state = (job['status'], job['attempts'])
+            if state != last:
+                last = state
+                yield job
+            if job['status'] in FINISHED or not self.running:
+                return
+            try:
+                await asyncio.wait_for(event.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def _update(self, job_id: str, status: str, result: Dict = None,
+                      error: str = None, increment_attempts: bool = False):
+        if self.backend == "postgres":
+            from db import pg
+            result_json = json.dumps(result, default=str) if result is not None else None
+            await pg.update_detection_job(job_id, status, result_json, error, increment_attempts)
+        else:
+            job = self._jobs[job_id]
+            job.update(status=status, error=error, updated_at=datetime.utcnow())
+            if result is not None:
+                job['result'] = result
+            if increment_attempts:
+                job['attempts'] += 1
+            if status in FINISHED:
+                self._images.pop(job_id, None)
+                self._forget_old_jobs()
+
+        event = self._changed.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in FINISHED]
+        for job_id in finished[:max(0, len(finished) - DETECT_JOB_RETAIN)]:
+            del self._jobs[job_id]
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id, queued_at = await self._queue.get()
+            try:
+                if queued_at is not None:
+                    job_wait_hist.observe((asyncio.get_running_loop().time() - queued_at) * 1000)
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Detection job worker {worker_id}: job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _load(self, job_id: str):
+        """(job, image bytes) or (None, None)"""
+        if self.backend == "postgres":
+            from db import pg
+            row = await pg.get_detection_job(job_id, with_image=True)
+            return (dict(row), row['image']) if row is not None else (None, None)
+        job = self._jobs.get(job_id)
+        return job, self._images.get(job_id)
+
+    async def _run_job(self, job_id: str):
+        job, content = await self._load(job_id)
+        if job is None or job['status'] in FINISHED:
+            return
+        if content is None:
+            await self._update(job_id, 'failed', error="image no longer available")
+            jobs_failed.inc()
+            return
+
+        attempts = job['attempts'] + 1
+        await self._update(job_id, 'running', increment_attempts=True)
+        try:
+            result = await self._handler(
+                bytes(content), job['filename'], job['content_type'], job['username'], job['tracking_code']
+            )
+            await self._update(job_id, 'done', result=result)
+            jobs_completed.inc()
+            print(f"✅ Detection job {job_id} done ({result.get('tracking_code')})")
+        except Exception as e:
+            if attempts < DETECT_JOB_MAX_ATTEMPTS:
+                await self._update(job_id, 'queued', error=str(e))
+                self._queue.put_nowait((job_id, None))
+                print(f"⚠️  Detection job {job_id} failed, retrying: {e}")
+            else:
+                await self._update(job_id, 'failed', error=str(e))
+                jobs_failed.inc()
+                print(f"❌ Detection job {job_id} failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "running": self.running,
+            "workers": self.workers,
+            "pending": self.pending(),
+            "max_pending": self.max_pending,
+            "submitted": jobs_submitted.value,
+            "completed": jobs_completed.value,
+            "failed": jobs_failed.value,
+        }
+
+
+queue = DetectionJobQueue()
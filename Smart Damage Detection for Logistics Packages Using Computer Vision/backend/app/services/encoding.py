@@ -0,0 +1,74 @@
+# backend/app/services/encoding.py
+"""
+Single encoding stage for rendered artifacts
+
+Every artifact (annotated image, GradCAM, SHAP, crops) is encoded exactly
+once; the resulting buffer is shared by the inline data URL, the S3
+upload, the artifact cache and multipart responses. Format and quality
+are set per artifact type:
+
+    <KIND>_FORMAT   jpeg | webp | png   (KIND = ANNOTATED, GRADCAM, SHAP, CROP)
+    <KIND>_QUALITY  1-100 (jpeg/webp; ignored for png)
+
+ARTIFACT_FORMAT / ARTIFACT_QUALITY set the default for all types.
+"""
+
+import os
+import base64
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+ARTIFACT_KINDS = ("annotated", "gradcam", "shap", "crop")
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "jpeg").lower()
+ARTIFACT_QUALITY = int(os.getenv("ARTIFACT_QUALITY", 90))
+
+# format -> (cv2 extension, content type, quality flag)
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    "png": (".png", "image/png", None),
+}
+
+
+def _settings(kind: str) -> Tuple[str, int]:
+    fmt = os.getenv(f"{kind.upper()}_FORMAT", ARTIFACT_FORMAT).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"{kind.upper()}_FORMAT must be one of {', '.join(FORMATS)}")
+    return fmt, int(os.getenv(f"{kind.upper()}_QUALITY", ARTIFACT_QUALITY))
+
+
+SETTINGS: Dict[str, Tuple[str, int]] = {kind: _settings(kind) for kind in ARTIFACT_KINDS}
+
+
+@dataclass(frozen=True)
+class Encoded:
+    """One encoded artifact"""
+    data: bytes
+    content_type: str
+    ext: str
+
+    def data_url(self) -> str:
+        return f"data:{self.content_type};base64,{base64.b64encode(self.data).decode()}"
+
+
+def encode(kind: str, image_array: np.ndarray) -> Encoded:
+    """Encode a BGR image with the format/quality configured for its kind"""
+    fmt, quality = SETTINGS.get(kind, (ARTIFACT_FORMAT, ARTIFACT_QUALITY))
+    ext, content_type, quality_flag = FORMATS[fmt]
+    params = [quality_flag, quality] if quality_flag is not None else []
+    ok, buffer = cv2.imencode(ext, image_array, params)
+    if not ok:
+        raise RuntimeError(f"{fmt} encode failed for {kind}")
+    return Encoded(buffer.tobytes(), content_type, ext)
+
+
+def content_type_for(filename: str) -> str:
+    """Content type from an artifact file name"""
+    ext = os.path.splitext(filename)[1].lower()
+    for fmt_ext, content_type, _ in FORMATS.values():
+        if ext == fmt_ext or (ext == ".jpeg" and fmt_ext == ".jpg"):
+            return content_type
+    return "image/jpeg"
@@ -0,0 +1,199 @@
+# backend/app/services/explain_jobs.py
+"""
+Deferred GradCAM / SHAP explanations
+
+With EXPLAIN_MODE=deferred (opt-in), /api/detect only queues an
+explanation job and returns; clients poll
+/api/packages/{tracking_code}/explanations for the images. A fixed number of asyncio workers (EXPLAIN_WORKERS) render the
+heatmaps on the pipeline CPU executor, upload them to S3 and write the
+keys to inspection_images. Job state lives in the Postgres
+explanation_jobs table, so jobs that were queued or running when the API
+stopped are picked up again on the next start.
+
+The decoded image of a freshly queued job is kept in memory (for at most
+EXPLAIN_MEMORY_JOBS jobs) so the worker doesn't need to download the
+original again; requeued jobs fetch it from S3. The same goes for the
+EigenCAM map of the detection pass: jobs that lost it (requeued after a
+restart) render the box heatmap instead. SHAP images come from
+services/occlusion_shap.py, whose masked variants go through the batch
+scheduler like any other inference. Each job records the model version
+that produced its boxes; if a different model is serving by the time it
+runs, the SHAP image is the box map.
+"""
+
+import os
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services import decoding, encoding, metrics, occlusion_shap, pipeline, storage, uploads
+from services.explainability_services import generate_gradcam_heatmap
+
+# inline by default: the upload page only shows explanations that come back with /api/detect
+EXPLAIN_MODE = os.getenv("EXPLAIN_MODE", "inline").lower()  # inline | deferred
+EXPLAIN_WORKERS = int(os.getenv("EXPLAIN_WORKERS", 2))
+EXPLAIN_MEMORY_JOBS = int(os.getenv("EXPLAIN_MEMORY_JOBS", 32))
+EXPLAIN_MAX_ATTEMPTS = int(os.getenv("EXPLAIN_MAX_ATTEMPTS", 3))
+
+jobs_completed = metrics.counter("explanation_jobs_completed", "Deferred explanation jobs finished")
+jobs_failed = metrics.counter("explanation_jobs_failed", "Deferred explanation jobs that gave up")
+job_latency_hist = metrics.histogram("explanation_job_latency_ms", metrics.LATENCY_MS_BUCKETS, "Render + upload time of one explanation job")
+
+
+def deferred_enabled() -> bool:
+    """Deferred jobs need Postgres for state and S3 for the artifacts"""
+    return (
+        EXPLAIN_MODE == "deferred"
+        and bool(os.getenv("POSTGRES_DSN"))
+        and bool(os.getenv("S3_BUCKET_NAME"))
+    )
+
+
+def _decode_original(data: bytes) -> np.ndarray:
+    # same decode as the detect request, so the stored boxes line up
+    return decoding.decode(data)[1]
+
+
+class ExplanationQueue:
+    """Bounded pool of asyncio workers consuming explanation job ids"""
+
+    def __init__(self, workers: int = EXPLAIN_WORKERS, memory_jobs: int = EXPLAIN_MEMORY_JOBS):
+        self.workers = max(1, workers)
+        self.memory_jobs = max(0, memory_jobs)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._images: "OrderedDict[int, Tuple[np.ndarray, object]]" = OrderedDict()  # (image, activation)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Create the table, start the workers and requeue unfinished jobs"""
+        if self.running:
+            return
+        from db import pg
+        await pg.ensure_explanation_jobs_table()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+        unfinished = await pg.get_unfinished_explanation_jobs()
+        for job_id in unfinished:
+            self._queue.put_nowait(job_id)
+        print(f"✅ Explanation queue started ({self.workers} workers, {len(unfinished)} job(s) requeued)")
+
+    async def stop(self):
+        """Stop the workers; unfinished jobs stay queued/running in Postgres"""
+        if not self.running:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._images.clear()
+        print("🔒 Explanation queue stopped")
+
+    async def submit(self, package_id: int, image_id: int, tracking_code: str,
+                     boxes: np.ndarray, original_s3_key: str,
+                     image_array: np.ndarray = None, activation=None, model_version: str = None) -> int:
+        """Persist a job and hand it to the workers; returns the job id"""
+        from db import pg
+        boxes_json = json.dumps(np.asarray(boxes, dtype=float).tolist())
+        job_id = await pg.insert_explanation_job(
+            package_id, image_id, tracking_code, boxes_json, original_s3_key, model_version
+        )
+        if image_array is not None and self.memory_jobs:
+            self._images[job_id] = (image_array, activation)
+            while len(self._images) > self.memory_jobs:
+                # oldest job falls back to downloading its original
+                self._images.popitem(last=False)
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Explanation worker {worker_id}: job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: int):
+        from db import pg
+        from services.yolo_service import model_version
+        job = await pg.get_explanation_job(job_id)
+        if job is None or job['status'] == 'done':
+            self._images.pop(job_id, None)
+            return
+
+        await pg.update_explanation_job(job_id, 'running', increment_attempts=True)
+        started = asyncio.get_running_loop().time()
+        try:
+            image_array, activation = self._images.get(job_id, (None, None))
+            if image_array is None:
+                data = await pipeline.run_io(storage.download_from_s3, storage.S3_BUCKET, job['original_s3_key'])
+                image_array = await pipeline.run_cpu(_decode_original, data)
+            boxes = np.asarray(json.loads(job['boxes_json']), dtype=np.float32).reshape(-1, 5)
+
+            gradcam_img = await pipeline.run_cpu(generate_gradcam_heatmap, image_array, boxes, activation)
+            grad = await pipeline.run_cpu(encoding.encode, 'gradcam', gradcam_img)
+            # explain the model that found the boxes: once it has been swapped out,
+            # occlusion would query a different one, so fall back to the box map
+            version = job.get('model_version') or model_version()
+            budget = occlusion_shap.SHAP_MAX_EVALS if version == model_version() else 0
+            shap_img = await occlusion_shap.render(image_array, boxes, version, budget)
+            shap = await pipeline.run_cpu(encoding.encode, 'shap', shap_img)
+
+            batch = uploads.UploadBatch()
+            batch.add('gradcam', 'explainability', f"{job['tracking_code']}_gradcam{grad.ext}", grad.data, grad.content_type)
+            batch.add('shap', 'explainability', f"{job['tracking_code']}_shap{shap.ext}", shap.data, shap.content_type)
+            artifacts = await batch.wait()
+            (gradcam_url, gradcam_key), (shap_url, shap_key) = artifacts['gradcam'], artifacts['shap']
+            if not gradcam_key or not shap_key:
+                raise RuntimeError("explanation upload failed")
+
+            await pg.update_image_urls(
+                job['image_id'],
+                gradcam_s3_url=gradcam_url, gradcam_s3_key=gradcam_key,
+                shap_s3_url=shap_url, shap_s3_key=shap_key
+            )
+            await pg.update_explanation_job(job_id, 'done', gradcam_s3_key=gradcam_key, shap_s3_key=shap_key)
+            self._images.pop(job_id, None)
+            jobs_completed.inc()
+            print(f"🧠 Explanations ready for {job['tracking_code']} (job {job_id})")
+        except Exception as e:
+            if job['attempts'] + 1 < EXPLAIN_MAX_ATTEMPTS:
+                await pg.update_explanation_job(job_id, 'queued', error=str(e))
+                self._queue.put_nowait(job_id)
+                print(f"⚠️  Explanation job {job_id} failed, retrying: {e}")
+            else:
+                await pg.update_explanation_job(job_id, 'failed', error=str(e))
+                self._images.pop(job_id, None)
+                jobs_failed.inc()
+                print(f"❌ Explanation job {job_id} failed: {e}")
+        finally:
+            job_latency_hist.observe((asyncio.get_running_loop().time() - started) * 1000)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": EXPLAIN_MODE,
+            "deferred": deferred_enabled(),
+            "workers": self.workers,
+            "pending": self.pending(),
+            "in_memory_images": len(self._images),
+            "completed": jobs_completed.value,
+            "failed": jobs_failed.value,
+        }
+
+
+queue = ExplanationQueue()
@@ -4,27 +4,69 @@ Author: RakshaRajkumar14
 Date: 2025-11-16 11:11:12 UTC
 """
 
+import os
 import cv2
 import numpy as np
+from functools import lru_cache
 from typing import List, Tuple
 
-def generate_gradcam_heatmap(image_array: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+GRADCAM_GRID_MAX = int(os.getenv("GRADCAM_GRID_MAX", 320))          # heatmap grid cells on the long side
+GRADCAM_WINDOW_SIGMAS = float(os.getenv("GRADCAM_WINDOW_SIGMAS", 3.5))  # Gaussian support per box
+
+SHAP_BORDER = 20
+# weight of the i-th row/column of the SHAP edge fade (i = 0 at the box edge)
+SHAP_FADE = (0.3 * (1.0 - np.arange(SHAP_BORDER) / SHAP_BORDER)).astype(np.float32)
+
+def _as_boxes(boxes: np.ndarray) -> np.ndarray:
+    """Accept [[x1, y1, x2, y2, conf], ...] or a yolo_service DETECTION_DTYPE array"""
+    boxes = np.asarray(boxes)
+    if boxes.dtype.names:
+        return np.column_stack([boxes['xyxy'], boxes['conf']]) if len(boxes) else np.empty((0, 5), np.float32)
+    return boxes
+
+def _gradcam_grid(h: int, w: int, min_sigma: float) -> Tuple[int, int]:
     """
-    Generate GradCAM-style heatmap visualization
-    
-    GradCAM (Gradient-weighted Class Activation Mapping) shows which regions
-    the model focused on when making predictions.
-    
-    Args:
-        image_array: Original image as numpy array (H, W, 3)
-        boxes: Detection boxes [[x1, y1, x2, y2, confidence], ...]
-    
-    Returns:
-        Heatmap overlayed on original image
+    (rows, cols) of the grid the heatmap is computed on: at most
+    GRADCAM_GRID_MAX cells on the long side, but never coarser than the
+    narrowest Gaussian so small boxes keep their peak
     """
-    h, w = image_array.shape[:2]
-    heatmap = np.zeros((h, w), dtype=np.float32)
+    scale = max(1.0, min(max(h, w) / max(1, GRADCAM_GRID_MAX), min_sigma))
+    return max(1, int(np.ceil(h / scale))), max(1, int(np.ceil(w / scale)))
+
+def _gaussian_1d(center: float, sigma: float, full: int, cells: int) -> Tuple[int, np.ndarray]:
+    """
+    Gaussian along one axis, sampled at the grid cell centres within
+    GRADCAM_WINDOW_SIGMAS of the centre: (first cell, values)
+    """
+    step = full / cells
+    reach = GRADCAM_WINDOW_SIGMAS * sigma
+    lo = max(0, int(np.floor((center - reach + 0.5) / step - 0.5)))
+    hi = min(cells, int(np.ceil((center + reach + 0.5) / step - 0.5)) + 1)
+    coords = (np.arange(lo, hi, dtype=np.float32) + 0.5) * step - 0.5
+    coords -= center
+    coords *= coords
+    coords *= -1.0 / (2 * sigma ** 2)
+    return lo, np.exp(coords, out=coords)
+
+def activation_heatmap(activation, h: int, w: int) -> np.ndarray:
+    """
+    Map an EigenCAM grid (yolo_service.ActivationMap, covering the
+    letterboxed network input) onto the h x w image: float32 in [0, 1]
+    """
+    in_h, in_w = activation.input_hw
+    r = min(in_h / h, in_w / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    # same centred padding as the ultralytics letterbox
+    top, left = int(round((in_h - new_h) / 2 - 0.1)), int(round((in_w - new_w) / 2 - 0.1))
+    cam = cv2.resize(activation.cam, (in_w, in_h), interpolation=cv2.INTER_LINEAR)
+    cam = cam[top:top + new_h, left:left + new_w]
+    return cv2.resize(cam, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def _box_heatmap(h: int, w: int, boxes: np.ndarray) -> np.ndarray:
+    """Confidence-weighted Gaussians around the boxes, uint8 (h, w)"""
+    boxes = _as_boxes(boxes)
     
+    gaussians = []
     for box in boxes:
         x1, y1, x2, y2, conf = box[:5]
         x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
@@ -34,30 +76,67 @@ def generate_gradcam_heatmap(image_array: np.ndarray, boxes: np.ndarray) -> np.n
         x2 = max(0, min(x2, w))
         y1 = max(0, min(y1, h))
         y2 = max(0, min(y2, h))
-            # Skip invalid boxes
+        # Skip invalid boxes
         if x2 <= x1 or y2 <= y1:
             continue
-        # Create gaussian distribution centered on detection
+        # Gaussian centered on detection, weighted by confidence (added below)
         cy, cx = (y1 + y2) // 2, (x1 + x2) // 2
         sigma_x = max((x2 - x1) / 4, 1)
         sigma_y = max((y2 - y1) / 4, 1)
-        
-        # Generate gaussian mask
-        y_coords, x_coords = np.ogrid[0:h, 0:w]
-        gaussian = np.exp(
-            -((x_coords - cx)**2 / (2 * sigma_x**2) + 
-              (y_coords - cy)**2 / (2 * sigma_y**2))
-        )
-        
-        # Add weighted by confidence
-        heatmap += gaussian * conf
+        gaussians.append((cx, cy, sigma_x, sigma_y, float(conf)))
+    
+    gh, gw = _gradcam_grid(h, w, min((min(g[2], g[3]) for g in gaussians), default=np.inf))
+    heatmap = np.zeros((gh, gw), dtype=np.float32)
+    for cx, cy, sigma_x, sigma_y, conf in gaussians:
+        col, gx = _gaussian_1d(cx, sigma_x, w, gw)
+        row, gy = _gaussian_1d(cy, sigma_y, h, gh)
+        if len(gx) and len(gy):
+            gy *= conf
+            heatmap[row:row + len(gy), col:col + len(gx)] += np.outer(gy, gx)
+    
+    # Normalize heatmap to [0, 255], then upscale once
+    hmin, hmax = float(heatmap.min()), float(heatmap.max())
+    if hmax > hmin:
+        heatmap -= hmin
+        heatmap *= 255.0 / (hmax - hmin)
+    heatmap = heatmap.astype(np.uint8)
+    if heatmap.shape != (h, w):
+        heatmap = cv2.resize(heatmap, (w, h), interpolation=cv2.INTER_LINEAR)
+    return heatmap
+
+def generate_gradcam_heatmap(image_array: np.ndarray, boxes: np.ndarray, activation=None) -> np.ndarray:
+    """
+    Generate GradCAM-style heatmap visualization
     
-    # Normalize heatmap to [0, 1]
-    if heatmap.max() > 0:
-        heatmap = (heatmap - heatmap.min()) / (heatmap.max() - heatmap.min())
+    GradCAM (Gradient-weighted Class Activation Mapping) shows which regions
+    the model focused on when making predictions.
+    
+    With an activation (EigenCAM captured from the detection forward pass,
+    see yolo_service.capture_activations) the heatmap is the model's own
+    attention. Without one it falls back to Gaussians around the boxes:
+    the Gaussians are evaluated on a grid of at most GRADCAM_GRID_MAX
+    cells per side, only within GRADCAM_WINDOW_SIGMAS of each box centre
+    (as the outer product of two 1-D Gaussians), and the map is upscaled
+    once before the colormap.
+    
+    Args:
+        image_array: Original image as numpy array (H, W, 3)
+        boxes: Detection boxes [[x1, y1, x2, y2, confidence], ...]
+        activation: Optional yolo_service.ActivationMap for this image
+    
+    Returns:
+        Heatmap overlayed on original image
+    """
+    h, w = image_array.shape[:2]
+    if activation is not None:
+        heatmap = (activation_heatmap(activation, h, w) * 255).astype(np.uint8)
+        title = 'EigenCAM - Model Attention Map'
+    else:
+        heatmap = _box_heatmap(h, w, boxes)
+        title = 'GradCAM - AI Attention Map'
     
     # Apply JET colormap (red = high attention, blue = low attention)
-    heatmap_colored = cv2.applyColorMap((heatmap * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    heatmap_colored = cv2.applyColorMap(heatmap, cv2.COLORMAP_JET)
     
       # CRITICAL FIX: Ensure heatmap_colored matches image dimensions
     if heatmap_colored.shape[:2] != (h, w):
@@ -78,16 +157,25 @@ def generate_gradcam_heatmap(image_array: np.ndarray, boxes: np.ndarray) -> np.n
         overlayed = image_array.copy()
     
     # Add legend
-    overlayed = add_gradcam_legend(overlayed)
+    overlayed = add_gradcam_legend(overlayed, title)
     
     return overlayed
 
-def add_gradcam_legend(image: np.ndarray) -> np.ndarray:
+@lru_cache(maxsize=8)
+def _gradcam_legend_bar(bar_height: int, bar_width: int) -> np.ndarray:
+    """JET gradient bar, built once per size"""
+    gradient = np.linspace(0, 255, bar_width).astype(np.uint8)
+    gradient = np.repeat(gradient[np.newaxis, :], bar_height, axis=0)
+    bar = cv2.applyColorMap(gradient, cv2.COLORMAP_JET)
+    bar.flags.writeable = False
+    return bar
+
+def add_gradcam_legend(image: np.ndarray, title: str = 'GradCAM - AI Attention Map') -> np.ndarray:
     """Add legend to GradCAM visualization"""
     h, w = image.shape[:2]
     
     # Add text header
-    cv2.putText(image, 'GradCAM - AI Attention Map', (10, 30), 
+    cv2.putText(image, title, (10, 30), 
                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
     
     # Add color bar
@@ -98,13 +186,8 @@ def add_gradcam_legend(image: np.ndarray) -> np.ndarray:
     
     if bar_x < 0 or bar_y + bar_height > h:
         return image
-    # Create gradient bar
-    gradient = np.linspace(0, 255, bar_width).astype(np.uint8)
-    gradient = np.repeat(gradient[np.newaxis, :], bar_height, axis=0)
-    gradient_colored = cv2.applyColorMap(gradient, cv2.COLORMAP_JET)
-    
     # Place gradient bar
-    image[bar_y:bar_y+bar_height, bar_x:bar_x+bar_width] = gradient_colored
+    image[bar_y:bar_y+bar_height, bar_x:bar_x+bar_width] = _gradcam_legend_bar(bar_height, bar_width)
     
     # Add labels
     cv2.putText(image, 'Low', (bar_x - 5, bar_y + bar_height + 15), 
@@ -114,6 +197,33 @@ def add_gradcam_legend(image: np.ndarray) -> np.ndarray:
     
     return image
 
+def _fade_profile(start: int, step: int, size: int) -> Tuple[int, np.ndarray]:
+    """
+    Fade strip positions start, start+step, ... (SHAP_BORDER of them),
+    clamped to [0, size): (first index, summed weight per index). Weights
+    of positions clamped onto the image edge add up there.
+    """
+    positions = np.clip(start + step * np.arange(SHAP_BORDER), 0, size - 1)
+    lo = int(positions.min())
+    return lo, np.bincount(positions - lo, weights=SHAP_FADE).astype(np.float32)
+
+def _add_edge_fade(importance_map: np.ndarray, x1: int, y1: int, x2: int, y2: int, conf: float):
+    """
+    Add the fade strips above, below, left and right of a box: row y1 - i
+    (top), y2 + i (bottom), column x1 - i (left) and x2 + i (right) get
+    conf * SHAP_FADE[i] along the box's extent
+    """
+    h, w = importance_map.shape
+    conf = np.float32(conf)
+    for start, step in ((y1, -1), (y2, 1)):
+        lo, profile = _fade_profile(start, step, h)
+        profile *= conf
+        importance_map[lo:lo + len(profile), x1:x2] += profile[:, None]
+    for start, step in ((x1, -1), (x2, 1)):
+        lo, profile = _fade_profile(start, step, w)
+        profile *= conf
+        importance_map[y1:y2, lo:lo + len(profile)] += profile[None, :]
+
 def generate_shap_explanation(image_array: np.ndarray, boxes: np.ndarray) -> np.ndarray:
     """
     Generate SHAP-style feature importance visualization
@@ -129,6 +239,7 @@ def generate_shap_explanation(image_array: np.ndarray, boxes: np.ndarray) -> np.
         SHAP visualization overlayed on original image
     """
     h, w = image_array.shape[:2]
+    boxes = _as_boxes(boxes)
     importance_map = np.zeros((h, w), dtype=np.float32)
     
     for box in boxes:
@@ -147,46 +258,13 @@ def generate_shap_explanation(image_array: np.ndarray, boxes: np.ndarray) -> np.
         # Mark detected region with high importance
         importance_map[y1:y2, x1:x2] += conf
         
-        # Add gradient fade around edges
-        border_size = 20
-        for i in range(border_size):
-            fade = 1.0 - (i / border_size)
-            
-                       # Top border
-            y_top = max(0, y1 - i)
-            if y_top < h and y_top >= 0:
-                x_start = max(0, x1)
-                x_end = min(w, x2)
-                if x_end > x_start:
-                    importance_map[y_top, x_start:x_end] += conf * fade * 0.3
-            
-            # Bottom border
-            y_bottom = min(h - 1, y2 + i)
-            if y_bottom >= 0 and y_bottom < h:
-                x_start = max(0, x1)
-                x_end = min(w, x2)
-                if x_end > x_start:
-                    importance_map[y_bottom, x_start:x_end] += conf * fade * 0.3
-            
-            # Left border
-            x_left = max(0, x1 - i)
-            if x_left < w and x_left >= 0:
-                y_start = max(0, y1)
-                y_end = min(h, y2)
-                if y_end > y_start:
-                    importance_map[y_start:y_end, x_left] += conf * fade * 0.3
-            
-            # Right border
-            x_right = min(w - 1, x2 + i)
-            if x_right >= 0 and x_right < w:
-                y_start = max(0, y1)
-                y_end = min(h, y2)
-                if y_end > y_start:
-                    importance_map[y_start:y_end, x_right] += conf * fade * 0.3
+        # Gradient fade around edges
+        _add_edge_fade(importance_map, x1, y1, x2, y2, conf)
     
     # Normalize
-    if importance_map.max() > 0:
-        importance_map = importance_map / importance_map.max()
+    max_importance = importance_map.max()
+    if max_importance > 0:
+        importance_map /= max_importance
     
     # Create SHAP-style red-blue colormap
     colored_map = np.zeros_like(image_array, dtype=np.uint8)
@@ -213,7 +291,51 @@ def generate_shap_explanation(image_array: np.ndarray, boxes: np.ndarray) -> np.
     blended = add_shap_legend(blended, importance_map)
     
     return blended
-    
+
+def render_shap_values(image_array: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Overlay per-cell SHAP values (see services/occlusion_shap.py)
+
+    Args:
+        image_array: Original image as numpy array
+        values: (rows, cols) attributions, positive = supports the detections
+
+    Returns:
+        SHAP visualization overlayed on original image; red cells support
+        the detections, blue cells work against them
+    """
+    h, w = image_array.shape[:2]
+    values = np.asarray(values, dtype=np.float32)
+
+    # Signed values -> [0, 1] with 0.5 = no contribution, same scale as the legend bar
+    scale = np.abs(values).max()
+    if scale > 0:
+        values = values / scale
+    importance_map = cv2.resize((values + 1) / 2, (w, h), interpolation=cv2.INTER_LINEAR)
+    np.clip(importance_map, 0, 1, out=importance_map)
+
+    colored_map = np.zeros_like(image_array, dtype=np.uint8)
+    colored_map[:, :, 2] = (importance_map * 255).astype(np.uint8)
+    colored_map[:, :, 0] = ((1 - importance_map) * 100).astype(np.uint8)
+
+    blended = cv2.addWeighted(image_array, 0.5, colored_map, 0.5, 0)
+    return add_shap_legend(blended, importance_map)
+
+@lru_cache(maxsize=8)
+def _shap_legend_bar(bar_height: int, bar_width: int) -> np.ndarray:
+    """
+    Red-blue importance bar (high at the top), built once per size; same
+    pixels as filling one rectangle per row, bottom edge included
+    """
+    gradient = np.linspace(1, 0, bar_height).astype(np.float32)
+    rows = np.zeros((bar_height + 1, 3), dtype=np.uint8)
+    rows[:bar_height, 2] = (gradient * 255).astype(np.uint8)        # red
+    rows[:bar_height, 0] = ((1 - gradient) * 100).astype(np.uint8)  # blue
+    rows[bar_height] = rows[bar_height - 1]
+    bar = np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (bar_height + 1, bar_width + 1, 3)))
+    bar.flags.writeable = False
+    return bar
+
 def add_shap_legend(image: np.ndarray, importance_map: np.ndarray) -> np.ndarray:
     """Add legend to SHAP visualization"""
     h, w = image.shape[:2]
@@ -232,21 +354,9 @@ def add_shap_legend(image: np.ndarray, importance_map: np.ndarray) -> np.ndarray
     if bar_x < 0 or bar_y + bar_height > h:
         return image
     
-    # Create gradient bar
-    gradient = np.linspace(1, 0, bar_height).astype(np.float32)
-    
-    for i in range(bar_height):
-        importance_val = gradient[i]
-        
-        # Red-blue gradient
-        r = int(importance_val * 255)
-        b = int((1 - importance_val) * 100)
-        g = 0
-        
-        cv2.rectangle(image, 
-                     (bar_x, bar_y + i), 
-                     (bar_x + bar_width, bar_y + i + 1), 
-                     (b, g, r), -1)
+    # Gradient bar (its bottom/right edge row is clipped at the image border)
+    bar = _shap_legend_bar(bar_height, bar_width)[:h - bar_y, :w - bar_x]
+    image[bar_y:bar_y + bar.shape[0], bar_x:bar_x + bar.shape[1]] = bar
     
     # Add border
     cv2.rectangle(image, (bar_x, bar_y), (bar_x + bar_width, bar_y + bar_height), 
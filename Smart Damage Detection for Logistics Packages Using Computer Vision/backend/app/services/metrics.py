@@ -0,0 +1,259 @@
+# backend/app/services/metrics.py
+"""
+In-process metrics for the inference pipeline
+
+Histograms, counters and gauges are kept in a small module-level registry so any
+service can record values and the API can return a JSON snapshot of them
+(/api/inference/stats) or the Prometheus text exposition (/metrics).
+"""
+
+import re
+import bisect
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default bucket layouts (upper bounds, inclusive)
+LATENCY_MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64]
+
+
+class Histogram:
+    """Fixed-bucket histogram with approximate quantiles"""
+
+    def __init__(self, name: str, buckets: Sequence[float], description: str = ""):
+        self.name = name
+        self.description = description
+        self.buckets: List[float] = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile"""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+        target = q * total
+        running = 0
+        for i, c in enumerate(counts):
+            running += c
+            if running >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+
+        cumulative = {}
+        running = 0
+        for bound, c in zip(self.buckets + ["+Inf"], counts):
+            running += c
+            cumulative[str(bound)] = running
+
+        return {
+            "description": self.description,
+            "count": total,
+            "sum": round(total_sum, 3),
+            "mean": round(total_sum / total, 3) if total else None,
+            "p50": self.quantile(0.50),
+            "p90": self.quantile(0.90),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+
+class Counter:
+    """Monotonic counter"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {"description": self.description, "value": self._value}
+
+
+class Gauge:
+    """Value that goes up and down (queue depth, in-flight requests)"""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {"description": self.description, "value": self._value}
+
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name: str, buckets: Sequence[float] = LATENCY_MS_BUCKETS, description: str = "") -> Histogram:
+    """Get or create a histogram by name"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = Histogram(name, buckets, description)
+            _registry[name] = metric
+        return metric
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Get or create a counter by name"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = Counter(name, description)
+            _registry[name] = metric
+        return metric
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    """Get or create a gauge by name"""
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = Gauge(name, description)
+            _registry[name] = metric
+        return metric
+
+
+def snapshot_all() -> Dict[str, Dict]:
+    """JSON-friendly snapshot of every registered metric"""
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: metric.snapshot() for name, metric in items}
+
+
+def stage_histogram(stage: str) -> Histogram:
+    """Latency histogram of one detect pipeline stage"""
+    return histogram(f"detect_stage_{stage}_ms", LATENCY_MS_BUCKETS, f"Detect pipeline stage latency: {stage}")
+
+
+class StageTimer:
+    """
+    Per-request stage timings (ms). Every recorded stage also feeds its
+    detect_stage_<stage>_ms histogram. Stages that run concurrently
+    (S3 uploads) overlap, so the timings don't add up to the total.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    def record(self, name: str, ms: float, stage: str = None):
+        """Add ms to a timing; stage groups names into one histogram (e.g. s3_crop_0 -> s3_crop)"""
+        self.timings[name] = round(self.timings.get(name, 0.0) + ms, 2)
+        stage_histogram(stage or name).observe(ms)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+
+def _prom_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def render_prometheus(gauges: Iterable[Tuple[str, Dict[str, str], float, str]] = ()) -> str:
+    """
+    Prometheus text exposition (format 0.0.4) of every registered metric.
+
+    gauges: extra (name, labels, value, help) samples read at scrape time,
+    e.g. DB pool and model state.
+    """
+    with _registry_lock:
+        items = sorted(_registry.items())
+
+    lines: List[str] = []
+    for name, metric in items:
+        name = _prom_name(name)
+        if isinstance(metric, Counter):
+            name += "_total"
+        if metric.description:
+            lines.append(f"# HELP {name} {metric.description}")
+        if isinstance(metric, Histogram):
+            with metric._lock:
+                counts = list(metric._counts)
+                total, total_sum = metric._count, metric._sum
+            lines.append(f"# TYPE {name} histogram")
+            running = 0
+            for bound, c in zip(metric.buckets + ["+Inf"], counts):
+                running += c
+                lines.append(f'{name}_bucket{{le="{bound}"}} {running}')
+            lines.append(f"{name}_sum {total_sum}")
+            lines.append(f"{name}_count {total}")
+        elif isinstance(metric, Counter):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {metric.value}")
+        else:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {metric.value}")
+
+    seen = set()
+    for name, labels, value, help_text in gauges:
+        name = _prom_name(name)
+        if name not in seen:
+            seen.add(name)
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name}{_prom_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
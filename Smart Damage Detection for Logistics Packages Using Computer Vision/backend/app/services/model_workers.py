@@ -0,0 +1,483 @@
+# backend/app/services/model_workers.py
+"""
+Process-pool inference workers
+
+Each worker process holds its own YOLO instance so inference is not pinned
+to one interpreter and its GIL. Decoded images are handed over through
+multiprocessing.shared_memory: the API process writes the pixels once into
+a shared block and only the block name/shape travels over the queue.
+
+A supervisor thread collects results and watches the worker processes.
+When a worker dies its in-flight jobs are re-dispatched to another worker
+(once) and a replacement process is spawned, so a crash never takes the
+API down. A worker that fails to load the model reports it and exits;
+repeated failures are respawned with exponential backoff, and after
+INFERENCE_WORKER_RESPAWN_LIMIT of them in a row the worker is given up
+(its jobs fail instead of waiting for a model that never loads).
+
+Model hot-swaps roll through the pool one worker at a time: the worker
+being reloaded stops receiving new batches while the others keep serving,
+and every result carries the version of the model that produced it.
+"""
+
+import os
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services import metrics, yolo_service
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))  # 0 = in-process inference
+WORKER_MAX_ATTEMPTS = 2
+WORKER_RESPAWN_LIMIT = int(os.getenv("INFERENCE_WORKER_RESPAWN_LIMIT", 5))          # failures in a row before giving up
+WORKER_RESPAWN_BACKOFF = float(os.getenv("INFERENCE_WORKER_RESPAWN_BACKOFF", 1.0))  # seconds, doubled per failure
+WORKER_RESPAWN_MAX_DELAY = 60.0
+
+worker_restarts = metrics.counter("inference_worker_restarts", "Worker processes respawned after a crash")
+
+
+def _worker_main(worker_id: int, weights: str, version: str, requests, responses):
+    """Entry point of one inference worker process"""
+    # keep torch from oversubscribing cores across workers
+    try:
+        import torch
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS)))
+    except Exception:
+        pass
+
+    try:
+        yolo_service.install_model(yolo_service.load_detector(weights), weights, version=version)
+    except Exception as e:
+        # the parent decides whether (and when) to respawn
+        responses.put(("load_failed", worker_id, None, repr(e)))
+        return
+    responses.put(("ready", worker_id, None, None))
+
+    while True:
+        msg = requests.get()
+        if msg is None:
+            break
+        if msg[0] == "swap":
+            _, weights, version, warmup_runs = msg
+            try:
+                model = yolo_service.load_detector(weights)
+                yolo_service.warm_up(model, warmup_runs)
+                yolo_service.install_model(model, weights, version=version)
+                responses.put(("swapped", worker_id, None, version))
+            except Exception as e:
+                # keep serving the previous model
+                responses.put(("swap_failed", worker_id, None, repr(e)))
+            continue
+        _, job_id, descriptors, imgsz, conf = msg
+
+        blocks = []
+        try:
+            images = []
+            for name, shape, dtype in descriptors:
+                shm = shared_memory.SharedMemory(name=name)
+                blocks.append(shm)
+                images.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf))
+            # structured arrays pickle compactly; names let the parent build dicts
+            dets, version = yolo_service.predict_batch(images, imgsz=imgsz, conf=conf)
+            responses.put(("result", worker_id, job_id, (dets, yolo_service.class_names(), version)))
+        except Exception as e:
+            responses.put(("error", worker_id, job_id, repr(e)))
+        finally:
+            images = None
+            for shm in blocks:
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+
+
+@dataclass(eq=False)  # compared by identity (pending list)
+class _Job:
+    job_id: str
+    descriptors: list
+    imgsz: int
+    conf: float
+    future: asyncio.Future
+    loop: asyncio.AbstractEventLoop
+    blocks: List[shared_memory.SharedMemory] = field(default_factory=list)
+    worker_id: Optional[int] = None
+    attempts: int = 0
+    abandoned: bool = False  # caller gone while a worker may still read the blocks
+
+
+class _Worker:
+    def __init__(self, worker_id: int, process, requests):
+        self.worker_id = worker_id
+        self.process = process
+        self.requests = requests
+        self.in_flight: Dict[str, _Job] = {}
+        self.ready = False
+        self.failures = 0                        # crashes / load failures since it was last ready
+        self.respawn_at: Optional[float] = None  # set while dead and waiting to be respawned
+        self.load_error: Optional[str] = None
+
+
+class WorkerPool:
+    """Pool of YOLO worker processes fed through shared memory"""
+
+    def __init__(self, size: int, weights: str, version: str = None):
+        self.size = size
+        self.weights = weights
+        self.version = version or yolo_service.weights_version(weights)
+        self._ctx = mp.get_context("spawn")
+        self._responses = None
+        self._workers: Dict[int, _Worker] = {}
+        self._lock = threading.Lock()
+        self._supervisor: Optional[threading.Thread] = None
+        self._stopping = False
+        self._swap_waiters: Dict[int, tuple] = {}
+        self._pending: List[_Job] = []  # held while every worker is being respawned
+
+    # ------------------------------------------------------------------
+    # lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self._supervisor is not None:
+            return
+        self._stopping = False
+        self._responses = self._ctx.Queue()
+        for worker_id in range(self.size):
+            self._spawn(worker_id)
+        self._supervisor = threading.Thread(target=self._supervise, name="inference-supervisor", daemon=True)
+        self._supervisor.start()
+        print(f"✅ Inference worker pool started ({self.size} processes, weights={self.weights})")
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            try:
+                worker.requests.put(None)
+            except Exception:
+                pass
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(1.0)
+            # the process is gone: its blocks can be freed
+            with self._lock:
+                jobs = list(worker.in_flight.values())
+                worker.in_flight.clear()
+            for job in jobs:
+                if job.abandoned:
+                    self._release(job)
+                self._fail(job, RuntimeError("Inference worker pool stopped"))
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for job in pending:
+            self._fail(job, RuntimeError("Inference worker pool stopped"))
+        if self._supervisor is not None:
+            self._supervisor.join(timeout)
+        self._supervisor = None
+        self._workers = {}
+        print("🔒 Inference worker pool stopped")
+
+    def _spawn(self, worker_id: int, failures: int = 0):
+        requests = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self.weights, self.version, requests, self._responses),
+            name=f"inference-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        worker = _Worker(worker_id, process, requests)
+        worker.failures = failures
+        with self._lock:
+            self._workers[worker_id] = worker
+
+    # ------------------------------------------------------------------
+    # dispatch
+    # ------------------------------------------------------------------
+
+    def _dispatch(self, job: _Job):
+        with self._lock:
+            if not self._workers:
+                raise RuntimeError("No inference workers available")
+            live = [w for w in self._workers.values() if w.respawn_at is None]
+            if not live:
+                # every worker is waiting to be respawned: hold the job until one is ready
+                self._pending.append(job)
+                return
+            # least-loaded worker, preferring ones that finished loading the model
+            worker = min(live, key=lambda w: (not w.ready, len(w.in_flight)))
+            job.worker_id = worker.worker_id
+            job.attempts += 1
+            worker.in_flight[job.job_id] = job
+        worker.requests.put(("job", job.job_id, job.descriptors, job.imgsz, job.conf))
+
+    async def predict(self, images: List, imgsz: int = 640, conf: float = 0.25) -> Tuple[List[np.ndarray], str]:
+        """
+        Run one batch on a worker; images are PIL images or RGB arrays.
+
+        Returns one yolo_service.DETECTION_DTYPE array per image and the
+        version of the model that produced them.
+        """
+        loop = asyncio.get_running_loop()
+        job = _Job(uuid.uuid4().hex, [], imgsz, conf, loop.create_future(), loop)
+        try:
+            for img in images:
+                arr = np.asarray(img)
+                shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+                job.blocks.append(shm)
+                # ultralytics expects numpy sources in BGR order
+                view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+                view[...] = arr[..., ::-1] if arr.ndim == 3 else arr
+                job.descriptors.append((shm.name, arr.shape, arr.dtype.str))
+                del view
+
+            self._dispatch(job)
+            dets, names, version = await job.future
+            yolo_service.register_class_names(names)
+            return dets, version
+        finally:
+            self._settle(job)
+
+    def _settle(self, job: _Job):
+        """Free the job's blocks, unless a worker may still have them mapped"""
+        with self._lock:
+            if job in self._pending:
+                self._pending.remove(job)
+            worker = self._workers.get(job.worker_id) if job.worker_id is not None else None
+            if worker is not None and job.job_id in worker.in_flight:
+                # cancelled or timed out mid-inference: the supervisor releases them
+                # once the worker answers or is found dead
+                job.abandoned = True
+                return
+        self._release(job)
+
+    def _release(self, job: _Job):
+        for shm in job.blocks:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        job.blocks = []
+
+    # ------------------------------------------------------------------
+    # hot-swap
+    # ------------------------------------------------------------------
+
+    async def swap(self, weights: str, version: str, warmup_runs: int = 3):
+        """
+        Reload every worker with new weights, one at a time.
+
+        Workers respawned during or after the swap start on the new weights.
+        If a worker fails to load them, the ones already swapped are rolled
+        back and the error is raised.
+        """
+        previous = (self.weights, self.version)
+        self.weights, self.version = weights, version
+        swapped = []
+        try:
+            for worker_id in sorted(self._workers):
+                await self._swap_worker(worker_id, weights, version, warmup_runs)
+                swapped.append(worker_id)
+        except Exception:
+            self.weights, self.version = previous
+            for worker_id in swapped:
+                try:
+                    await self._swap_worker(worker_id, *previous, warmup_runs=0)
+                except Exception as e:
+                    print(f"⚠️  Rollback of inference worker {worker_id} failed: {e}")
+            raise
+        print(f"✅ Inference worker pool swapped to {version}")
+
+    async def _swap_worker(self, worker_id: int, weights: str, version: str, warmup_runs: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            worker = self._workers.get(worker_id)
+            if worker is None:
+                return
+            # new batches go to the other workers while this one reloads
+            worker.ready = False
+            self._swap_waiters[worker_id] = (loop, future)
+        worker.requests.put(("swap", weights, version, warmup_runs))
+        try:
+            await future
+        finally:
+            self._swap_waiters.pop(worker_id, None)
+
+    def _finish_swap(self, worker_id: int, error: Exception = None):
+        waiter = self._swap_waiters.get(worker_id)
+        if waiter is None:
+            return
+        loop, future = waiter
+
+        def _set():
+            if future.done():
+                return
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+        loop.call_soon_threadsafe(_set)
+
+    # ------------------------------------------------------------------
+    # supervision
+    # ------------------------------------------------------------------
+
+    def _resolve(self, job: _Job, preds):
+        def _set():
+            if not job.future.done():
+                job.future.set_result(preds)
+        job.loop.call_soon_threadsafe(_set)
+
+    def _fail(self, job: _Job, exc: Exception):
+        def _set():
+            if not job.future.done():
+                job.future.set_exception(exc)
+        job.loop.call_soon_threadsafe(_set)
+
+    def _supervise(self):
+        while not self._stopping:
+            try:
+                kind, worker_id, job_id, payload = self._responses.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            if kind is not None:
+                with self._lock:
+                    worker = self._workers.get(worker_id)
+                    job = worker.in_flight.pop(job_id, None) if worker and job_id else None
+                    abandoned = job is not None and job.abandoned
+                if abandoned:
+                    # the worker is done with the blocks now
+                    self._release(job)
+                if kind == "ready" and worker is not None:
+                    worker.ready = True
+                    worker.failures = 0
+                    worker.load_error = None
+                    print(f"✅ Inference worker {worker_id} ready (pid {worker.process.pid})")
+                    with self._lock:
+                        pending, self._pending = self._pending, []
+                    for held in pending:
+                        if not held.future.done():
+                            self._dispatch(held)
+                elif kind == "load_failed" and worker is not None:
+                    # the process exits right after; _check_workers respawns it
+                    worker.load_error = payload
+                    print(f"❌ Inference worker {worker_id} failed to load {self.weights}: {payload}")
+                elif kind in ("swapped", "swap_failed") and worker is not None:
+                    worker.ready = True
+                    error = None if kind == "swapped" else RuntimeError(f"Inference worker {worker_id} failed to load new weights: {payload}")
+                    self._finish_swap(worker_id, error)
+                elif kind == "result" and job is not None:
+                    self._resolve(job, payload)
+                elif kind == "error" and job is not None:
+                    self._fail(job, RuntimeError(f"Inference worker {worker_id} failed: {payload}"))
+
+            self._check_workers()
+
+    def _check_workers(self):
+        if self._stopping:
+            return
+        now = time.monotonic()
+        with self._lock:
+            dead = [w for w in self._workers.values() if w.respawn_at is None and not w.process.is_alive()]
+            orphaned = {w.worker_id: list(w.in_flight.values()) for w in dead}
+            for w in dead:
+                w.in_flight.clear()
+                w.ready = False
+                w.failures += 1
+                # a one-off crash respawns at once; failures in a row (weights that won't load) back off
+                delay = 0.0 if w.failures == 1 else WORKER_RESPAWN_BACKOFF * 2 ** (w.failures - 2)
+                w.respawn_at = now + min(delay, WORKER_RESPAWN_MAX_DELAY)
+            given_up = [w for w in dead if w.failures > WORKER_RESPAWN_LIMIT]
+            for w in given_up:
+                del self._workers[w.worker_id]
+            stranded = []
+            if given_up and not self._workers:
+                stranded, self._pending = self._pending, []
+            due = [w for w in self._workers.values() if w.respawn_at is not None and w.respawn_at <= now]
+
+        for worker in dead:
+            if worker in given_up:
+                print(f"❌ Inference worker {worker.worker_id} failed {worker.failures} times in a row - giving up")
+            else:
+                print(f"⚠️  Inference worker {worker.worker_id} died (exit code {worker.process.exitcode}) - "
+                      f"respawning in {max(0.0, worker.respawn_at - now):.0f}s")
+            self._finish_swap(worker.worker_id, RuntimeError(f"Inference worker {worker.worker_id} died during model swap"))
+
+            for job in orphaned[worker.worker_id]:
+                if job.abandoned:
+                    # nobody is waiting and the dead process no longer maps the blocks
+                    self._release(job)
+                    continue
+                if job.attempts < WORKER_MAX_ATTEMPTS:
+                    try:
+                        self._dispatch(job)
+                        continue
+                    except Exception as e:
+                        self._fail(job, e)
+                        continue
+                self._fail(job, RuntimeError(f"Inference worker {worker.worker_id} crashed"))
+
+        for job in stranded:
+            self._fail(job, RuntimeError(f"No inference workers available: {given_up[-1].load_error or 'workers keep crashing'}"))
+
+        for worker in due:
+            worker_restarts.inc()
+            self._spawn(worker.worker_id, worker.failures)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "weights": self.weights,
+                "version": self.version,
+                "restarts": worker_restarts.value,
+                "workers": [
+                    {
+                        "worker_id": w.worker_id,
+                        "pid": w.process.pid,
+                        "alive": w.process.is_alive(),
+                        "ready": w.ready,
+                        "in_flight": len(w.in_flight),
+                        "failures": w.failures,
+                        "load_error": w.load_error,
+                    }
+                    for w in self._workers.values()
+                ],
+            }
+
+
+pool: Optional[WorkerPool] = None
+
+
+def start_pool(weights: str, version: str = None) -> Optional[WorkerPool]:
+    """Start the worker pool if INFERENCE_WORKERS > 0"""
+    global pool
+    if INFERENCE_WORKERS <= 0:
+        return None
+    if pool is None:
+        pool = WorkerPool(INFERENCE_WORKERS, weights, version)
+        pool.start()
+    return pool
+
+
+def stop_pool():
+    global pool
+    if pool is not None:
+        pool.stop()
+        pool = None
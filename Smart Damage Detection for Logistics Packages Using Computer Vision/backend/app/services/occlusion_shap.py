@@ -0,0 +1,238 @@
+# backend/app/services/occlusion_shap.py
+"""
+Occlusion-based SHAP explanations
+
+The image (RGB, downscaled to SHAP_IMGSZ) is split into a SHAP_GRID x SHAP_GRID
+grid of cells. A coalition of cells is evaluated by replacing every other
+cell with a blurred copy of the image and running the detector on the
+result; its value is how well the original damage boxes are still found
+(sum over boxes of the best conf x IoU among the new detections). The
+masked variants of one explanation go through the batch scheduler
+together, so they share batched inference with regular traffic.
+
+With the `shap` package, the cell attributions are KernelSHAP values
+estimated from at most SHAP_MAX_EVALS detector evaluations per
+explanation. Without it (or when the budget can't cover the grid) each
+cell is occluded once and its attribution is the drop in value. The grid
+is coarsened until it fits the budget either way.
+
+Results are cached by image hash, boxes and model version
+(SHAP_CACHE_SIZE entries), so re-explaining a duplicate upload or a
+retried job costs no inference. SHAP_MODE=boxes keeps the old box-based
+importance map.
+
+The masked variants share the scheduler queue with interactive uploads,
+so the inline path (/api/detect renders explanations before it returns)
+gets its own budget, SHAP_INLINE_MAX_EVALS, which defaults to 0: the box
+map inline, occlusion SHAP in deferred explanation jobs.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from services import metrics, pipeline
+from services.explainability_services import generate_shap_explanation, render_shap_values
+
+try:
+    import shap
+except ImportError:  # optional: plain occlusion is used instead
+    shap = None
+
+SHAP_MODE = os.getenv("SHAP_MODE", "occlusion").lower()  # occlusion | boxes
+SHAP_GRID = int(os.getenv("SHAP_GRID", 6))              # cells per side
+SHAP_MAX_EVALS = int(os.getenv("SHAP_MAX_EVALS", 64))   # detector evaluations per explanation (deferred jobs)
+SHAP_INLINE_MAX_EVALS = int(os.getenv("SHAP_INLINE_MAX_EVALS", 0))  # same, inside /api/detect; 0 = box map
+SHAP_IMGSZ = int(os.getenv("SHAP_IMGSZ", 320))           # inference size of the masked variants
+SHAP_CONF = float(os.getenv("SHAP_CONF", 0.05))          # keep weak detections: they carry the signal
+SHAP_CACHE_SIZE = int(os.getenv("SHAP_CACHE_SIZE", 128))
+
+explain_hist = metrics.histogram("shap_explanation_ms", metrics.LATENCY_MS_BUCKETS, "Wall time of one occlusion SHAP explanation")
+evals_hist = metrics.histogram("shap_evaluations", metrics.BATCH_SIZE_BUCKETS, "Detector evaluations spent on one explanation")
+cache_hits = metrics.counter("shap_cache_hits", "SHAP explanations served from the cache")
+cache_misses = metrics.counter("shap_cache_misses", "SHAP explanations computed")
+
+_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+
+def enabled(budget: int = SHAP_MAX_EVALS) -> bool:
+    return SHAP_MODE == "occlusion" and budget > 1
+
+
+def config_tag() -> str:
+    """Settings that change the inline SHAP image (part of the result-cache key)"""
+    if not enabled(SHAP_INLINE_MAX_EVALS):
+        return "shap=boxes"
+    return f"shap={grid_size(SHAP_INLINE_MAX_EVALS)}/{SHAP_INLINE_MAX_EVALS}/{SHAP_IMGSZ}/{SHAP_CONF}/{'kernel' if shap is not None else 'occlusion'}"
+
+
+def grid_size(budget: int = SHAP_MAX_EVALS) -> int:
+    """Largest grid <= SHAP_GRID whose cells fit the evaluation budget"""
+    # KernelSHAP: background + full image + at least features + 2 samples; occlusion: one extra
+    extra = 4 if shap is not None else 1
+    grid = max(1, SHAP_GRID)
+    while grid > 1 and grid * grid + extra > budget:
+        grid -= 1
+    return grid
+
+
+def _downscale(image_array: np.ndarray, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Image at SHAP_IMGSZ on the long side, boxes scaled with it"""
+    h, w = image_array.shape[:2]
+    scale = min(1.0, SHAP_IMGSZ / max(h, w))
+    if scale < 1.0:
+        image_array = cv2.resize(image_array, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    boxes = boxes[:, :4] * scale
+    return image_array, boxes
+
+
+def _cache_key(small: np.ndarray, boxes: np.ndarray, model_version: str, grid: int, budget: int) -> str:
+    digest = hashlib.blake2b(small.tobytes(), digest_size=16)
+    digest.update(np.round(boxes, 1).astype(np.float32).tobytes())
+    return f"{digest.hexdigest()}|{model_version}|{grid}|{budget}|{'kernel' if shap is not None else 'occlusion'}"
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def _value(targets: np.ndarray, dets: np.ndarray) -> float:
+    """How well the target boxes are still detected: sum of best conf x IoU per target"""
+    if len(dets) == 0:
+        return 0.0
+    return float((_box_iou(targets, dets["xyxy"]) * dets["conf"][None, :]).max(axis=1).sum())
+
+
+class _Evaluator:
+    """Builds masked variants for coalitions of grid cells and scores them"""
+
+    def __init__(self, small: np.ndarray, targets: np.ndarray, grid: int):
+        h, w = small.shape[:2]
+        self.small = small
+        self.targets = targets
+        self.grid = grid
+        # occluded cells show a blurred copy, so no artificial edges are introduced
+        k = max(3, (max(h, w) // grid) | 1)
+        self.baseline = cv2.GaussianBlur(small, (k, k), 0)
+        # cell index of every pixel
+        rows = np.minimum(np.arange(h) * grid // h, grid - 1)
+        cols = np.minimum(np.arange(w) * grid // w, grid - 1)
+        self.cells = rows[:, None] * grid + cols[None, :]
+        self.evaluations = 0
+
+    def images(self, coalitions: np.ndarray):
+        """One PIL image per coalition row (1 = keep the cell, 0 = occlude it)"""
+        for keep in coalitions:
+            mask = keep.astype(bool)[self.cells]
+            # RGB like the detect pass (a bare numpy array would be read as BGR)
+            yield Image.fromarray(np.where(mask[..., None], self.small, self.baseline))
+
+    async def values(self, scheduler, coalitions: np.ndarray) -> np.ndarray:
+        coalitions = np.atleast_2d(coalitions)
+        self.evaluations += len(coalitions)
+        imgs = await pipeline.run_cpu(lambda: list(self.images(coalitions)))
+        # one submission, so the variants share batches
+        dets = await scheduler.submit_many(imgs, imgsz=SHAP_IMGSZ, conf=SHAP_CONF)
+        return np.array([_value(self.targets, d) for d in dets], dtype=np.float32)
+
+
+def _kernel_shap(model_fn: Callable[[np.ndarray], np.ndarray], n_features: int, budget: int) -> np.ndarray:
+    """KernelSHAP of the all-cells-kept coalition against the all-occluded background (budget evaluations)"""
+    explainer = shap.KernelExplainer(model_fn, np.zeros((1, n_features)))
+    values = explainer.shap_values(np.ones((1, n_features)), nsamples=budget - 2, silent=True)
+    return np.asarray(values, dtype=np.float32).reshape(-1)[:n_features]
+
+
+async def explain(scheduler, image_array: np.ndarray, boxes: np.ndarray, model_version: str,
+                  budget: int = SHAP_MAX_EVALS) -> Optional[np.ndarray]:
+    """
+    Attribution per grid cell (grid x grid float32, positive = the cell
+    supports the detections) for the damage boxes [[x1, y1, x2, y2, conf], ...].
+    Returns None when there is nothing to explain.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 5)
+    if len(boxes) == 0:
+        return None
+    started = time.perf_counter()
+    small, targets = await pipeline.run_cpu(_downscale, image_array, boxes)
+    grid = grid_size(budget)
+    key = await pipeline.run_cpu(_cache_key, small, targets, model_version, grid, budget)
+    if key in _cache:
+        _cache.move_to_end(key)
+        cache_hits.inc()
+        return _cache[key]
+    cache_misses.inc()
+
+    evaluator = await pipeline.run_cpu(_Evaluator, small, targets, grid)
+    n_features = grid * grid
+    if shap is not None and n_features + 4 <= budget:
+        loop = asyncio.get_running_loop()
+
+        def model_fn(coalitions):
+            # KernelExplainer is synchronous; its evaluations still go through the scheduler
+            # bounded wait: a loop that stops mid-explanation must not leave this thread hanging
+            return asyncio.run_coroutine_threadsafe(evaluator.values(scheduler, coalitions), loop).result(timeout=300)
+
+        # own thread, not the CPU executor: the evaluations it waits for run there
+        values = await asyncio.to_thread(_kernel_shap, model_fn, n_features, budget)
+    else:
+        coalitions = np.ones((n_features + 1, n_features), dtype=np.float32)
+        coalitions[np.arange(n_features), np.arange(n_features)] = 0  # one cell occluded per row
+        scores = await evaluator.values(scheduler, coalitions)
+        values = scores[-1] - scores[:-1]
+
+    values = values.reshape(grid, grid)
+    _cache[key] = values
+    while len(_cache) > max(0, SHAP_CACHE_SIZE):
+        _cache.popitem(last=False)
+    evals_hist.observe(evaluator.evaluations)
+    explain_hist.observe((time.perf_counter() - started) * 1000)
+    print(f"🧮 Occlusion SHAP: {grid}x{grid} cells, {evaluator.evaluations} evaluations, {(time.perf_counter() - started) * 1000:.0f}ms")
+    return values
+
+
+async def render(image_array: np.ndarray, boxes: np.ndarray, model_version: str,
+                 budget: int = SHAP_MAX_EVALS) -> np.ndarray:
+    """
+    SHAP image for the damage boxes: occlusion values within `budget`
+    detector evaluations (SHAP_INLINE_MAX_EVALS inside /api/detect), else
+    the box-based map
+    """
+    if enabled(budget) and len(boxes):
+        from services.yolo_service import scheduler
+        try:
+            values = await explain(scheduler, image_array, boxes, model_version, budget)
+            if values is not None:
+                return await pipeline.run_cpu(render_shap_values, image_array, values)
+        except Exception as e:
+            print(f"⚠️  Occlusion SHAP failed, using the box map: {e}")
+    return await pipeline.run_cpu(generate_shap_explanation, image_array, boxes)
+
+
+def stats() -> dict:
+    return {
+        "mode": SHAP_MODE,
+        "kernel_shap": shap is not None,
+        "grid": grid_size(),
+        "max_evals": SHAP_MAX_EVALS,
+        "inline_max_evals": SHAP_INLINE_MAX_EVALS,
+        "imgsz": SHAP_IMGSZ,
+        "cached": len(_cache),
+        "cache_hits": cache_hits.value,
+        "cache_misses": cache_misses.value,
+    }
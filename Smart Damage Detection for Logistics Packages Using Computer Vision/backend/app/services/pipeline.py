@@ -0,0 +1,66 @@
+# backend/app/services/pipeline.py
+"""
+Bounded executors for the blocking stages of the detect pipeline
+
+CPU-bound work (image decode, inference, drawing, JPEG encoding) and
+blocking I/O (boto3 uploads/downloads) run on separately sized thread
+pools so the asyncio event loop only orchestrates and a slow upload can
+never starve decoding, inference or unrelated endpoints.
+"""
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+CPU_WORKERS = int(os.getenv("PIPELINE_CPU_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+IO_WORKERS = int(os.getenv("PIPELINE_IO_WORKERS", 16))
+
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+
+def start():
+    """Create the executors (idempotent)"""
+    global _cpu_executor, _io_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="detect-cpu")
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="detect-io")
+    print(f"✅ Pipeline executors ready (cpu={CPU_WORKERS}, io={IO_WORKERS})")
+
+
+def shutdown():
+    """Wait for running stages to finish and release the threads"""
+    global _cpu_executor, _io_executor
+    for executor in (_cpu_executor, _io_executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _cpu_executor = None
+    _io_executor = None
+    print("🔒 Pipeline executors stopped")
+
+
+def cpu_executor() -> ThreadPoolExecutor:
+    if _cpu_executor is None:
+        start()
+    return _cpu_executor
+
+
+def io_executor() -> ThreadPoolExecutor:
+    if _io_executor is None:
+        start()
+    return _io_executor
+
+
+async def run_cpu(fn: Callable, *args, **kwargs):
+    """Run a CPU-bound stage off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(cpu_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """Run a blocking I/O stage (S3, filesystem) off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor(), functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,168 @@
+# backend/app/services/result_cache.py
+"""
+Content-addressed cache of /api/detect results
+
+Entries are keyed on the SHA-256 of the uploaded bytes plus the model
+version and the inference settings (CONF_THRESH / IMG_SZ), so re-uploads
+and client retries of the same photo skip inference, explainability and
+S3 uploads. The in-memory tier is an LRU bounded by approximate payload
+size; an optional Postgres tier (RESULT_CACHE_PERSIST=1) survives restarts
+and is shared between API processes. Entries of both tiers expire after
+RESULT_CACHE_TTL_HOURS; expired Postgres rows are pruned at most every
+RESULT_CACHE_PRUNE_SECONDS.
+
+Only the detections and artifacts are cached, never the identity of the
+inspection (IDENTITY_FIELDS): a hit is a new parcel that happens to have
+a byte-identical photo, and app.record_cached_detection gives it its own
+package row and tracking code.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from services import metrics
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_PERSIST = os.getenv("RESULT_CACHE_PERSIST", "0") == "1"
+RESULT_CACHE_TTL_HOURS = float(os.getenv("RESULT_CACHE_TTL_HOURS", 24 * 7))
+RESULT_CACHE_PRUNE_SECONDS = int(os.getenv("RESULT_CACHE_PRUNE_SECONDS", 3600))
+
+# per-inspection fields of a detect response; filled in again on every hit
+IDENTITY_FIELDS = ('package_id', 'tracking_code', 'inspector', 'timestamp', 'explanations_url')
+
+cache_hits = metrics.counter("result_cache_hits", "Detect requests served from the in-memory result cache")
+cache_persistent_hits = metrics.counter("result_cache_persistent_hits", "Detect requests served from the Postgres result cache")
+cache_misses = metrics.counter("result_cache_misses", "Detect requests that missed every cache tier")
+cache_evictions = metrics.counter("result_cache_evictions", "Entries evicted from the in-memory result cache")
+cache_expired = metrics.counter("result_cache_expired", "In-memory result cache entries dropped after RESULT_CACHE_TTL_HOURS")
+cache_pruned = metrics.counter("result_cache_pruned", "Expired rows deleted from the Postgres result cache")
+
+_last_prune = 0.0
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def cache_key(digest: str, model_version: str, conf: float, imgsz: int) -> str:
+    """Combine the upload digest with everything that changes the result"""
+    return f"{digest}:{model_version}:conf={conf}:imgsz={imgsz}"
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by the approximate size of the stored values, with a TTL"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = RESULT_CACHE_TTL_HOURS * 3600):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > self.ttl_seconds:
+                del self._entries[key]
+                self._bytes -= entry[1]
+                cache_expired.inc()
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                cache_evictions.inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+memory_cache = LRUCache(RESULT_CACHE_MAX_BYTES)
+
+
+async def get(key: str) -> Optional[Dict]:
+    """Look a result up in memory, then (optionally) in Postgres"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+
+    payload = memory_cache.get(key)
+    if payload is not None:
+        cache_hits.inc()
+        return json.loads(payload)
+
+    if RESULT_CACHE_PERSIST and os.getenv("POSTGRES_DSN"):
+        from db import pg
+        try:
+            payload = await pg.get_cached_detection(key, RESULT_CACHE_TTL_HOURS)
+        except Exception as e:
+            print(f"⚠️  Result cache lookup failed: {e}")
+            payload = None
+        if payload is not None:
+            cache_persistent_hits.inc()
+            memory_cache.put(key, payload, len(payload))
+            return json.loads(payload)
+
+    cache_misses.inc()
+    return None
+
+
+async def put(key: str, result: Dict):
+    """Store a detect result (without its IDENTITY_FIELDS) in every enabled tier"""
+    global _last_prune
+    if not RESULT_CACHE_ENABLED:
+        return
+    payload = json.dumps({k: v for k, v in result.items() if k not in IDENTITY_FIELDS}, default=str)
+    memory_cache.put(key, payload, len(payload))
+
+    if RESULT_CACHE_PERSIST and os.getenv("POSTGRES_DSN"):
+        from db import pg
+        try:
+            await pg.put_cached_detection(key, payload)
+            if time.monotonic() - _last_prune > RESULT_CACHE_PRUNE_SECONDS:
+                _last_prune = time.monotonic()
+                removed = await pg.prune_detection_cache(RESULT_CACHE_TTL_HOURS)
+                cache_pruned.inc(removed)
+                if removed:
+                    print(f"🧹 Pruned {removed} expired result cache rows")
+        except Exception as e:
+            print(f"⚠️  Result cache write failed: {e}")
+
+
+def stats() -> Dict:
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "persistent": RESULT_CACHE_PERSIST,
+        "ttl_hours": RESULT_CACHE_TTL_HOURS,
+        "memory": memory_cache.stats(),
+        "hits": cache_hits.value,
+        "persistent_hits": cache_persistent_hits.value,
+        "misses": cache_misses.value,
+        "evictions": cache_evictions.value,
+        "expired": cache_expired.value,
+        "pruned": cache_pruned.value,
+    }
@@ -1,12 +1,46 @@
 # backend/app/services/storage.py
 import os
 import boto3
+import threading
+from botocore.config import Config
 from botocore.exceptions import BotoCoreError, ClientError
 import uuid
 from datetime import datetime
 
 S3_BUCKET = os.getenv("S3_BUCKET_NAME")  # Changed from S3_BUCKET to S3_BUCKET_NAME
 AWS_REGION = os.getenv("AWS_REGION", "eu-north-1")
+# concurrent uploads share one client; size its connection pool to match
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Shared boto3 S3 client.
+
+    Clients are thread-safe and keep a pool of warm connections, so every
+    upload/download reuses one instead of paying for a new client (and TLS
+    handshake) per call.
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    "s3",
+                    region_name=AWS_REGION,
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS),
+                )
+    return _s3_client
+
+
+def s3_url(key: str) -> str:
+    """s3:// URL of an object in the configured bucket"""
+    return f"s3://{S3_BUCKET}/{key}"
 
 
 def generate_s3_key(bucket_name: str, prefix: str, filename: str) -> str:
@@ -56,12 +90,7 @@ def upload_bytes_to_s3(key: str, data: bytes, content_type: str = "application/o
     if not S3_BUCKET:
         raise RuntimeError("S3_BUCKET_NAME not configured in environment variables")
     
-    s3 = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
+    s3 = get_s3_client()
     
     try:
         s3.put_object(
@@ -72,10 +101,10 @@ def upload_bytes_to_s3(key: str, data: bytes, content_type: str = "application/o
         )
         
         # Return S3 URL
-        s3_url = f"s3://{S3_BUCKET}/{key}"
-        print(f"✅ Uploaded to S3: {s3_url}")
+        url = s3_url(key)
+        print(f"✅ Uploaded to S3: {url}")
         
-        return s3_url
+        return url
         
     except (BotoCoreError, ClientError) as e:
         print(f"❌ S3 Upload Error: {e}")
@@ -130,12 +159,7 @@ def generate_presigned_url(s3_key: str, expiration: int = 3600) -> str:
     if not S3_BUCKET:
         raise RuntimeError("S3_BUCKET_NAME not configured")
     
-    s3 = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
+    s3 = get_s3_client()
     
     try:
         url = s3.generate_presigned_url(
@@ -162,12 +186,7 @@ def delete_from_s3(s3_key: str) -> bool:
     if not S3_BUCKET:
         raise RuntimeError("S3_BUCKET_NAME not configured")
     
-    s3 = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
+    s3 = get_s3_client()
     
     try:
         s3.delete_object(Bucket=S3_BUCKET, Key=s3_key)
@@ -189,12 +208,7 @@ def download_from_s3(bucket_name: str, s3_key: str) -> bytes:
     Returns:
         File data as bytes
     """
-    s3 = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
+    s3 = get_s3_client()
     
     try:
         response = s3.get_object(Bucket=bucket_name, Key=s3_key)
@@ -217,12 +231,7 @@ def list_s3_objects(prefix: str = "", max_keys: int = 1000) -> list:
     if not S3_BUCKET:
         raise RuntimeError("S3_BUCKET_NAME not configured")
     
-    s3 = boto3.client(
-        "s3",
-        region_name=AWS_REGION,
-        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    )
+    s3 = get_s3_client()
     
     try:
         response = s3.list_objects_v2(
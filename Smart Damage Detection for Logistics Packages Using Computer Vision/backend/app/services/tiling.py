@@ -0,0 +1,112 @@
+# backend/app/services/tiling.py
+"""
+Sliced (tiled) inference helpers for high-resolution package photos
+
+Large dock-camera images are cut into overlapping tiles that run through
+the detector as one batch, alongside one downscaled pass over the full
+image so package-sized damage (crushed, wet) is still seen whole. Tile
+boxes are shifted back to original-image coordinates and merged with a
+class-aware cross-tile NMS.
+"""
+
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "0") == "1"
+TILE_SIZE = int(os.getenv("TILE_SIZE", 1024))                   # tile edge in original pixels
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", 0.2))            # fraction of TILE_SIZE
+TILE_TRIGGER_PX = int(os.getenv("TILE_TRIGGER_PX", 4_000_000))  # tile images with more pixels than this
+TILE_MERGE_THRESH = float(os.getenv("TILE_MERGE_THRESH", 0.5))
+TILE_MERGE_METRIC = os.getenv("TILE_MERGE_METRIC", "ios")       # ios (intersection/smaller) | iou
+
+Window = Tuple[int, int, int, int]
+
+
+def should_tile(width: int, height: int) -> bool:
+    return TILED_INFERENCE and width * height > TILE_TRIGGER_PX
+
+
+def config_tag() -> str:
+    """Settings that change tiled results (part of the result-cache key)"""
+    if not TILED_INFERENCE:
+        return "tiles=off"
+    return f"tiles={TILE_SIZE}/{TILE_OVERLAP}/{TILE_TRIGGER_PX}/{TILE_MERGE_METRIC}{TILE_MERGE_THRESH}"
+
+
+def _starts(length: int, tile: int, stride: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)  # last tile flush with the edge
+    return starts
+
+
+def tile_windows(width: int, height: int, tile: int = None, overlap: float = None) -> List[Window]:
+    """Overlapping (x1, y1, x2, y2) windows covering the image"""
+    tile = tile or TILE_SIZE
+    overlap = TILE_OVERLAP if overlap is None else overlap
+    stride = max(1, int(tile * (1 - overlap)))
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in _starts(height, tile, stride)
+        for x in _starts(width, tile, stride)
+    ]
+
+
+def nms(dets: np.ndarray, threshold: float = None, metric: str = None) -> np.ndarray:
+    """
+    Class-aware greedy NMS over a yolo_service DETECTION_DTYPE array.
+
+    metric='ios' suppresses by intersection over the smaller box, which also
+    merges the partial box a tile edge cuts off a larger detection.
+    """
+    threshold = TILE_MERGE_THRESH if threshold is None else threshold
+    metric = metric or TILE_MERGE_METRIC
+    if len(dets) == 0:
+        return dets
+
+    order = np.argsort(-dets["conf"], kind="stable")
+    boxes = dets["xyxy"][order].astype(np.float64)
+    classes = dets["cls"][order]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        keep.append(order[i])
+        rest = np.flatnonzero(~suppressed[i + 1:] & (classes[i + 1:] == classes[i])) + i + 1
+        if len(rest) == 0:
+            continue
+        iw = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        ih = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        inter = iw * ih
+        if metric == "ios":
+            denom = np.minimum(areas[i], areas[rest])
+        else:
+            denom = areas[i] + areas[rest] - inter
+        overlap = np.divide(inter, denom, out=np.zeros_like(inter), where=denom > 0)
+        suppressed[rest[overlap > threshold]] = True
+
+    # highest confidence first, like ultralytics output
+    return dets[np.array(keep)]
+
+
+def merge_tile_detections(per_tile: List[np.ndarray], windows: List[Window], full_image: np.ndarray = None) -> np.ndarray:
+    """Shift tile detections to image coordinates and merge with cross-tile NMS"""
+    shifted = []
+    for dets, (x0, y0, _, _) in zip(per_tile, windows):
+        if len(dets) == 0:
+            continue
+        dets = dets.copy()
+        dets["xyxy"] += np.array([x0, y0, x0, y0], dtype=np.float32)
+        shifted.append(dets)
+    if full_image is not None and len(full_image):
+        shifted.append(full_image)
+    if not shifted:
+        # nothing found anywhere: empty array of the same dtype
+        return (full_image if full_image is not None else per_tile[0])[:0]
+    return nms(np.concatenate(shifted))
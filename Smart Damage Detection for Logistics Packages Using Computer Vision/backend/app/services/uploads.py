@@ -0,0 +1,101 @@
+# backend/app/services/uploads.py
+"""
+Concurrent S3 artifact uploads for one detect request
+
+Each artifact (original, crops, annotated, GradCAM, SHAP) is handed to an
+UploadBatch as soon as its bytes exist. The upload starts immediately on
+the pipeline I/O executor, bounded by a per-request and a process-wide
+semaphore, so a request's S3 round trips overlap each other and the
+remaining CPU work. Keys are generated up front, which lets
+UPLOAD_MODE=background return the response before the uploads finish and
+backfill the database once they complete.
+"""
+
+import os
+import time
+import asyncio
+from typing import Coroutine, Dict, Optional, Tuple
+
+from services import metrics, pipeline, storage
+
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "wait").lower()  # wait | background
+UPLOAD_PER_REQUEST = int(os.getenv("UPLOAD_PER_REQUEST", 4))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv("UPLOAD_MAX_CONCURRENCY", pipeline.IO_WORKERS))
+
+upload_latency_hist = metrics.histogram("s3_upload_latency_ms", metrics.LATENCY_MS_BUCKETS, "Wall time of one artifact upload, including slot waits")
+upload_failures = metrics.counter("s3_upload_failures", "Artifact uploads that raised")
+
+_global_slots: Optional[asyncio.Semaphore] = None
+_background: set = set()
+
+Uploaded = Tuple[Optional[str], Optional[str]]  # (s3 url, key); (None, None) if the upload failed
+
+
+def background_enabled() -> bool:
+    return UPLOAD_MODE == "background"
+
+
+def _shared_slots() -> asyncio.Semaphore:
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(UPLOAD_MAX_CONCURRENCY)
+    return _global_slots
+
+
+class UploadBatch:
+    """All artifact uploads of one request"""
+
+    def __init__(self, per_request: int = None):
+        self._slots = asyncio.Semaphore(per_request or UPLOAD_PER_REQUEST)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.keys: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}  # upload wall time (ms) per finished artifact
+
+    def add(self, name: str, prefix: str, filename: str, data: bytes, content_type: str = "image/jpeg") -> str:
+        """Start uploading an artifact; returns its S3 key right away"""
+        key = storage.generate_s3_key(storage.S3_BUCKET, prefix, filename)
+        self.keys[name] = key
+        self._tasks[name] = asyncio.create_task(self._upload(name, key, data, content_type))
+        return key
+
+    async def _upload(self, name: str, key: str, data: bytes, content_type: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            async with self._slots, _shared_slots():
+                return await pipeline.run_io(storage.upload_bytes_to_s3, key, data, content_type)
+        except Exception as e:
+            upload_failures.inc()
+            print(f"⚠️  {name} upload failed: {e}")
+            return None
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.timings[name] = round(elapsed, 2)
+            upload_latency_hist.observe(elapsed)
+
+    def planned(self, name: str) -> Uploaded:
+        """(url, key) the artifact will have once its upload succeeds"""
+        key = self.keys.get(name)
+        return (storage.s3_url(key), key) if key else (None, None)
+
+    async def wait(self) -> Dict[str, Uploaded]:
+        """Wait for every upload; failed ones map to (None, None)"""
+        urls = await asyncio.gather(*self._tasks.values())
+        return {
+            name: (url, self.keys[name]) if url else (None, None)
+            for name, url in zip(self._tasks, urls)
+        }
+
+
+def run_in_background(coro: Coroutine) -> asyncio.Task:
+    """Keep a reference to a fire-and-forget task so drain() can wait for it"""
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+async def drain():
+    """Wait for background uploads/backfills (application shutdown)"""
+    if _background:
+        print(f"⏳ Waiting for {len(_background)} background upload job(s)...")
+        await asyncio.gather(*list(_background), return_exceptions=True)
@@ -0,0 +1,216 @@
+# backend/app/services/write_behind.py
+"""
+Write-behind buffer for inspection records
+
+With WRITE_BEHIND_ENABLED=1, /api/detect doesn't open its own
+transaction: the inspection record goes into an in-memory buffer and one
+flusher task writes everything that accumulated every WRITE_BEHIND_FLUSH_MS
+ms (or as soon as WRITE_BEHIND_BATCH records are waiting) with COPY into
+packages, inspection_images and predictions, in a single transaction.
+
+Row ids are reserved from the SERIAL sequences in blocks of
+WRITE_BEHIND_ID_BLOCK, so a request still gets its package/image/
+prediction ids immediately. Work that needs the rows to exist (explanation
+jobs, S3 key backfill) waits on the record's `persisted` future.
+
+At most WRITE_BEHIND_MAX_PENDING records are buffered; further requests
+wait until a flush frees space (back-pressure). stop() flushes whatever is
+left, and it runs in the application shutdown before the pool is closed.
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from services import metrics
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "0") == "1"
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", 200))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", 200))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 2000))
+WRITE_BEHIND_ID_BLOCK = int(os.getenv("WRITE_BEHIND_ID_BLOCK", 256))
+
+# table -> id column
+ID_COLUMNS = {
+    "packages": "package_id",
+    "inspection_images": "image_id",
+    "predictions": "id",
+}
+
+pending_gauge = metrics.gauge("write_behind_pending", "Inspection records buffered but not yet written")
+flush_hist = metrics.histogram("write_behind_flush_ms", metrics.LATENCY_MS_BUCKETS, "Time to COPY one flush into Postgres")
+records_flushed = metrics.counter("write_behind_records_flushed", "Inspection records written by the buffer")
+records_failed = metrics.counter("write_behind_records_failed", "Inspection records the buffer could not write")
+backpressure_waits = metrics.counter("write_behind_backpressure_waits", "Requests that waited for buffer space")
+
+
+def enabled() -> bool:
+    return WRITE_BEHIND_ENABLED and bool(os.getenv("POSTGRES_DSN"))
+
+
+class WriteBehindBuffer:
+    """Bounded record buffer with one background flusher"""
+
+    def __init__(self, flush_ms: int = WRITE_BEHIND_FLUSH_MS, batch: int = WRITE_BEHIND_BATCH,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING, id_block: int = WRITE_BEHIND_ID_BLOCK):
+        self.flush_ms = max(1, flush_ms)
+        self.batch = max(1, batch)
+        self.max_pending = max(self.batch, max_pending)
+        self.id_block = max(1, id_block)
+        self._pending: Deque[Tuple[Dict, Dict, asyncio.Future]] = deque()
+        self._unwritten = 0  # buffered + being flushed
+        self._ids: Dict[str, Deque[int]] = {table: deque() for table in ID_COLUMNS}
+        self._id_lock: Optional[asyncio.Lock] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._id_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._space = asyncio.Condition()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        print(f"✅ Write-behind buffer started (flush every {self.flush_ms}ms or {self.batch} records, max {self.max_pending})")
+
+    async def stop(self):
+        """Stop the flusher and write every buffered record"""
+        if not self.running:
+            return
+        # let the flusher finish its current batch instead of cancelling it mid-COPY
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self._pending:
+            print(f"⏳ Flushing {len(self._pending)} buffered inspection(s)...")
+        await self.flush()
+        print("🔒 Write-behind buffer stopped")
+
+    async def _take_ids(self, table: str, count: int) -> List[int]:
+        from db import pg
+        ids = self._ids[table]
+        async with self._id_lock:
+            if len(ids) < count:
+                ids.extend(await pg.reserve_ids(table, ID_COLUMNS[table], max(count, self.id_block)))
+            return [ids.popleft() for _ in range(count)]
+
+    async def add(self, record: Dict) -> Tuple[Dict, asyncio.Future]:
+        """
+        Buffer one pg.save_inspection record.
+
+        Returns ({package_id, image_id, prediction_ids}, persisted future);
+        the future resolves once the rows are committed and raises if they
+        could not be written. Waits while the buffer is full.
+        """
+        async with self._space:
+            if self._unwritten >= self.max_pending:
+                backpressure_waits.inc()
+                self._wakeup.set()
+                await self._space.wait_for(lambda: self._unwritten < self.max_pending)
+            self._unwritten += 1
+
+        try:
+            ids = {
+                'package_id': (await self._take_ids('packages', 1))[0],
+                'image_id': (await self._take_ids('inspection_images', 1))[0],
+                'prediction_ids': await self._take_ids('predictions', len(record['predictions'])),
+            }
+        except Exception:
+            await self._release(1)
+            raise
+
+        persisted = asyncio.get_running_loop().create_future()
+        self._pending.append((ids, record, persisted))
+        pending_gauge.set(len(self._pending))
+        if len(self._pending) >= self.batch:
+            self._wakeup.set()
+        return ids, persisted
+
+    async def _release(self, count: int):
+        async with self._space:
+            self._unwritten -= count
+            self._space.notify_all()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Write-behind flush error: {e}")
+
+    async def flush(self):
+        """Write everything buffered so far, WRITE_BEHIND_BATCH records per transaction"""
+        async with self._flush_lock:
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch, len(self._pending)))]
+                pending_gauge.set(len(self._pending))
+                try:
+                    await self._write(batch)
+                finally:
+                    await self._release(len(batch))
+
+    async def _write(self, batch: List[Tuple[Dict, Dict, asyncio.Future]]):
+        from db import pg
+        started = time.perf_counter()
+        try:
+            await pg.copy_inspections([(ids, record) for ids, record, _ in batch])
+            outcomes = [None] * len(batch)
+        except Exception as e:
+            # one bad record (e.g. a duplicate tracking code) must not sink the rest
+            print(f"⚠️  Write-behind COPY of {len(batch)} record(s) failed, retrying one by one: {e}")
+            outcomes = []
+            for ids, record, _ in batch:
+                try:
+                    await pg.copy_inspections([(ids, record)])
+                    outcomes.append(None)
+                except Exception as item_error:
+                    print(f"❌ Could not write inspection {record['package'][0]}: {item_error}")
+                    outcomes.append(item_error)
+        flush_hist.observe((time.perf_counter() - started) * 1000)
+
+        for (_, _, persisted), error in zip(batch, outcomes):
+            if persisted.done():
+                continue
+            if error is None:
+                records_flushed.inc()
+                persisted.set_result(True)
+            else:
+                records_failed.inc()
+                persisted.set_exception(error)
+                persisted.exception()  # retrieved: callers may not await it
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": enabled(),
+            "running": self.running,
+            "flush_ms": self.flush_ms,
+            "batch": self.batch,
+            "max_pending": self.max_pending,
+            "pending": len(self._pending),
+            "unwritten": self._unwritten,
+            "flushed": records_flushed.value,
+            "failed": records_failed.value,
+            "backpressure_waits": backpressure_waits.value,
+        }
+
+
+buffer = WriteBehindBuffer()
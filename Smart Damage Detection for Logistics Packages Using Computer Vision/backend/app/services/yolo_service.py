@@ -1,65 +1,658 @@
 # backend/app/services/yolo_service.py
 import os
-from typing import List, Dict
+import time
+import asyncio
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 from PIL import Image
 from ultralytics import YOLO
 
+from services import metrics, tiling
+
 YOLO_WEIGHTS = os.getenv("YOLO_WEIGHTS", "models/best.pt")
+YOLO_BACKEND = os.getenv("YOLO_BACKEND", "torch").lower()  # torch | onnx | openvino
+YOLO_PRECISION = os.getenv("YOLO_PRECISION", "fp32").lower()  # fp32 | int8
+# Roboflow dataset whose valid/ split calibrates the INT8 model
+INT8_CALIBRATION_DATA = os.getenv(
+    "INT8_CALIBRATION_DATA", "../../Damage-Detection-for-Packages-1/data.yaml"
+)
 detector = None
+# (model, version) pair read once per batch so a hot-swap never splits a batch
+_active: Tuple[object, Optional[str]] = (None, None)
+# version of the model that served the current request's last inference
+_request_model_version: contextvars.ContextVar = contextvars.ContextVar("request_model_version", default=None)
+
+# Compact per-image detection record; dicts are only built where the API needs them
+DETECTION_DTYPE = np.dtype([
+    ("xyxy", np.float32, (4,)),
+    ("conf", np.float32),
+    ("cls", np.int32),
+])
+_class_names: Dict[int, str] = {}
+
+# export format and on-disk artifact for each non-torch backend
+BACKEND_EXPORTS = {
+    "onnx": ("onnx", ".onnx"),
+    "openvino": ("openvino", "_openvino_model"),
+}
+
+# EigenCAM from the detection forward pass (torch backend, in-process only)
+EIGENCAM_ENABLED = os.getenv("EIGENCAM_ENABLED", "1") == "1"
+EIGENCAM_LAYER = os.getenv("EIGENCAM_LAYER", "auto")  # index into the model's layer list, or auto (SPPF)
+# set by capture_activations(); read when a request is queued
+_capture_activations: contextvars.ContextVar = contextvars.ContextVar("capture_activations", default=False)
+_request_activation: contextvars.ContextVar = contextvars.ContextVar("request_activation", default=None)
+# forward hooks write here; only while a batch that asked for it is running on this thread
+_cam_local = threading.local()
+
+# Micro-batching settings
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+
+batch_size_hist = metrics.histogram(
+    "inference_batch_size", metrics.BATCH_SIZE_BUCKETS,
+    "Images per detector.predict call made by the batch scheduler"
+)
+queue_wait_hist = metrics.histogram(
+    "inference_queue_wait_ms", metrics.LATENCY_MS_BUCKETS,
+    "Time a request waited in the batch queue before inference started"
+)
+batch_latency_hist = metrics.histogram(
+    "inference_batch_latency_ms", metrics.LATENCY_MS_BUCKETS,
+    "Wall time of one batched detector.predict call"
+)
+eigencam_hist = metrics.histogram(
+    "eigencam_ms", metrics.LATENCY_MS_BUCKETS,
+    "Time to turn one image's captured activations into an EigenCAM map"
+)
+
+def calibration_data_yaml(data_yaml: str = None) -> str:
+    """
+    Write a dataset yaml that points train/val at the valid/ split.
+
+    The Roboflow data.yaml uses '../valid/images' style paths that ultralytics
+    resolves outside the dataset folder, so calibration gets absolute paths.
+    """
+    import yaml
+
+    data_yaml = os.path.abspath(data_yaml or INT8_CALIBRATION_DATA)
+    dataset_dir = os.path.dirname(data_yaml)
+    with open(data_yaml) as f:
+        data = yaml.safe_load(f)
+
+    valid_images = os.path.join(dataset_dir, "valid", "images")
+    calib = {
+        "path": dataset_dir,
+        "train": valid_images,
+        "val": valid_images,
+        "nc": data["nc"],
+        "names": data["names"],
+    }
+    fd, path = tempfile.mkstemp(prefix="int8_calibration_", suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        yaml.safe_dump(calib, f)
+    return path
+
+def serving_backend(backend: str = None, precision: str = None) -> Tuple[str, str]:
+    """(backend, precision) that actually serve the model; int8 always runs on OpenVINO"""
+    backend = (backend or YOLO_BACKEND).lower()
+    precision = (precision or YOLO_PRECISION).lower()
+    if precision not in ("fp32", "int8"):
+        raise ValueError(f"Unknown YOLO_PRECISION '{precision}' (expected fp32 or int8)")
+    if precision == "int8":
+        backend = "openvino"
+    return backend, precision
+
+def resolve_weights(weights: str = None, backend: str = None, precision: str = None) -> str:
+    """
+    Return the model path to load for a backend.
+
+    For onnx/openvino the .pt weights are exported once next to the original
+    file (best.onnx, best_openvino_model/) and reused on later starts.
+    precision='int8' always uses OpenVINO with post-training quantization
+    (NNCF) calibrated on INT8_CALIBRATION_DATA (best_int8_openvino_model/).
+    """
+    weights = weights or YOLO_WEIGHTS
+    backend, precision = serving_backend(backend, precision)
+    if backend == "torch" or not weights.endswith(".pt"):
+        return weights
+    if backend not in BACKEND_EXPORTS:
+        raise ValueError(f"Unknown YOLO_BACKEND '{backend}' (expected torch, onnx or openvino)")
+
+    export_format, suffix = BACKEND_EXPORTS[backend]
+    if precision == "int8":
+        suffix = "_int8" + suffix
+    target = weights[:-len(".pt")] + suffix
+    if os.path.exists(target):
+        return target
+
+    print(f"Exporting {weights} to {export_format} {precision} (one-time)...")
+    export_args = {
+        "format": export_format,
+        "imgsz": int(os.getenv("IMG_SZ", 640)),
+        # dynamic axes so the batch scheduler can send batches of any size
+        "dynamic": True,
+    }
+    calib_yaml = None
+    if precision == "int8":
+        calib_yaml = calibration_data_yaml()
+        export_args.update(int8=True, data=calib_yaml)
+    try:
+        exported = YOLO(weights).export(**export_args)
+    finally:
+        if calib_yaml:
+            os.remove(calib_yaml)
+    print(f"Exported model: {exported}")
+    return str(exported)
+
+def weights_version(weights: str = None, backend: str = None, precision: str = None) -> str:
+    """Identifier of a weights file plus the backend/precision serving it"""
+    weights = weights or YOLO_WEIGHTS
+    try:
+        st = os.stat(weights)
+        stamp = f"{st.st_size}-{int(st.st_mtime)}"
+    except OSError:
+        stamp = "missing"
+    backend, precision = serving_backend(backend, precision)
+    return f"{os.path.basename(weights)}@{stamp}:{backend}:{precision}"
+
+def model_version() -> str:
+    """Identifier of the weights/backend/precision currently producing predictions"""
+    return _active[1] or weights_version()
+
+def request_model_version() -> str:
+    """Version of the model that ran this request's most recent inference"""
+    return _request_model_version.get() or model_version()
+
+def load_detector(weights: str = None):
+    """Load (and export if needed) a detector without installing it"""
+    path = resolve_weights(weights)
+    backend, precision = serving_backend()
+    print(f"Loading YOLO model from: {path} (backend={backend}, precision={precision})")
+    return YOLO(path, task="detect")
 
-def init_model():
-    global detector
+def warm_up(model, runs: int = 3, imgsz: int = None):
+    """Run a few blank inferences so the first real request doesn't pay for lazy init"""
+    imgsz = imgsz or int(os.getenv("IMG_SZ", 640))
+    blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(max(0, runs)):
+        model.predict([blank], imgsz=imgsz, device='cpu', verbose=False)
+
+@dataclass
+class ActivationMap:
+    """
+    EigenCAM of one image: first principal component of the hooked layer's
+    activations, ReLU'd and scaled to [0, 1], on the layer's grid.
+    input_hw is the letterboxed network input the grid covers.
+    """
+    cam: np.ndarray
+    input_hw: Tuple[int, int]
+    layer: str
+
+def _cam_layer(model):
+    """(index, module) of the layer whose activations feed EigenCAM, or (None, None)"""
+    layers = getattr(getattr(model, "model", None), "model", None)  # DetectionModel.model (nn.Sequential)
+    if layers is None or not hasattr(layers, "__getitem__") or not hasattr(layers, "__len__"):
+        return None, None  # exported (onnx/openvino) model: no torch modules to hook
+    if EIGENCAM_LAYER != "auto":
+        index = int(EIGENCAM_LAYER) % len(layers)
+        return index, layers[index]
+    for index in range(len(layers) - 1, -1, -1):
+        if type(layers[index]).__name__ == "SPPF":  # end of the backbone
+            return index, layers[index]
+    index = len(layers) - 2  # module before the Detect head
+    return index, layers[index]
+
+def _store_input_shape(module, args):
+    if getattr(_cam_local, "wanted", False):
+        _cam_local.input_hw = tuple(args[0].shape[-2:])
+
+def _store_activations(module, inputs, output):
+    if getattr(_cam_local, "wanted", False):
+        _cam_local.activations = output.detach()
+
+def attach_cam_hooks(model):
+    """Register the EigenCAM forward hooks once on a torch detector (no-op otherwise)"""
+    if not EIGENCAM_ENABLED or getattr(model, "_cam_layer", None) is not None:
+        return
+    index, layer = _cam_layer(model)
+    if layer is None:
+        return
+    try:
+        model.model.register_forward_pre_hook(_store_input_shape)
+        layer.register_forward_hook(_store_activations)
+        model._cam_layer = f"{index}:{type(layer).__name__}"
+        print(f"🔥 EigenCAM hooked on layer {model._cam_layer}")
+    except Exception as e:
+        print(f"⚠️  EigenCAM hooks unavailable, falling back to box heatmaps: {e}")
+
+def eigencam(activations, input_hw: Tuple[int, int], layer: str) -> ActivationMap:
+    """EigenCAM of one image's (C, h, w) activations"""
+    started = time.perf_counter()
+    acts = activations.float().cpu().numpy()
+    c, h, w = acts.shape
+    flat = acts.reshape(c, h * w).T  # (pixels, channels)
+    centered = flat - flat.mean(axis=0)
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    projection = centered @ vt[0]
+    # the component's sign is arbitrary; orient it along the activation strength
+    if np.dot(projection, flat.sum(axis=1)) < 0:
+        projection = -projection
+    cam = np.maximum(projection.reshape(h, w), 0).astype(np.float32)
+    peak = cam.max()
+    if peak > 0:
+        cam /= peak
+    eigencam_hist.observe((time.perf_counter() - started) * 1000)
+    return ActivationMap(cam, input_hw, layer)
+
+@contextmanager
+def capture_activations(enabled: bool = True):
+    """
+    Ask for an EigenCAM map with this request's inferences; read it with
+    request_activation() afterwards. Requests outside this block never
+    keep activations.
+    """
+    token = _capture_activations.set(enabled and EIGENCAM_ENABLED)
+    try:
+        yield
+    finally:
+        _capture_activations.reset(token)
+
+def config_tag() -> str:
+    """EigenCAM settings (part of the result-cache key: they change the GradCAM artifact)"""
+    return f"cam={EIGENCAM_LAYER}" if EIGENCAM_ENABLED else "cam=off"
+
+def request_activation() -> Optional[ActivationMap]:
+    """EigenCAM of this request's last inference (None if not captured/available)"""
+    return _request_activation.get()
+
+def install_model(model, weights: str, version: str = None) -> str:
+    """
+    Atomically make ``model`` the active detector.
+
+    Batches that already read the previous (model, version) pair finish on
+    the old model; everything dispatched afterwards uses the new one.
+    """
+    global detector, _active, YOLO_WEIGHTS
+    version = version or weights_version(weights)
+    names = getattr(getattr(model, "model", None), "names", None)
+    attach_cam_hooks(model)
+    _active = (model, version)
+    detector = model
+    YOLO_WEIGHTS = weights
+    _class_names.clear()
+    register_class_names(dict(names) if names else None)
+    return version
+
+def set_serving_version(weights: str, version: str):
+    """Record the version served by out-of-process workers (no local model)"""
+    global _active, YOLO_WEIGHTS
+    _active = (_active[0], version)
+    YOLO_WEIGHTS = weights
+    _class_names.clear()
+
+def init_model(precision: str = None):
+    """
+    Load the detector once.
+
+    precision: 'fp32' (default, YOLO_BACKEND) or 'int8' (quantized OpenVINO
+    model). Defaults to YOLO_PRECISION; see scripts/quantization_report.py for
+    the accuracy/latency trade-off.
+    """
+    global YOLO_PRECISION
     if detector is not None:
         return
+    if precision:
+        YOLO_PRECISION = precision.lower()
     try:
-        print("Loading YOLO model from:", YOLO_WEIGHTS)
-        detector = YOLO(YOLO_WEIGHTS)
+        install_model(load_detector(), YOLO_WEIGHTS)
         print("YOLO loaded. classes:", getattr(detector.model, "names", None))
     except Exception as e:
         print("Failed to load YOLO model:", e)
-        detector = None
 
-def predict_pil_image(img: Image.Image, imgsz: int = 640, conf: float = 0.25) -> List[Dict]:
+def class_names() -> Dict[int, str]:
+    """Class id -> name map of the loaded model (or the last worker results)"""
+    names = getattr(getattr(_active[0], "model", None), "names", None)
+    return dict(names) if names else _class_names
+
+def register_class_names(names: Optional[Dict[int, str]]):
+    """Remember class names reported by Results / worker processes"""
+    if names:
+        _class_names.update(names)
+
+def empty_detections() -> np.ndarray:
+    return np.empty(0, dtype=DETECTION_DTYPE)
+
+def _result_to_array(r) -> np.ndarray:
+    """Convert one ultralytics Results object in a single tensor-to-NumPy step"""
+    boxes = getattr(r, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+    # boxes.data rows are [x1, y1, x2, y2, conf, cls]
+    data = boxes.data.cpu().numpy()
+    dets = np.empty(len(data), dtype=DETECTION_DTYPE)
+    dets["xyxy"] = data[:, :4]
+    dets["conf"] = data[:, 4]
+    dets["cls"] = data[:, 5]
+    return dets
+
+def detections_to_dicts(dets: np.ndarray, names: Optional[Dict[int, str]] = None) -> List[Dict]:
     """
     Returns a list of dicts:
       { id, class_id, class_name, score, bbox: [x1,y1,x2,y2] }
     """
-    global detector
-    if detector is None:
+    names = names if names is not None else class_names()
+    boxes = dets["xyxy"].tolist()
+    scores = dets["conf"].tolist()
+    cls_ids = dets["cls"].tolist()
+    return [
+        {
+            "id": f"{i}",
+            "class_id": cls_id,
+            "class_name": names.get(cls_id, str(cls_id)),
+            "score": score,
+            "bbox": bbox,
+        }
+        for i, (bbox, score, cls_id) in enumerate(zip(boxes, scores, cls_ids))
+    ]
+
+def detections_to_boxes(dets: np.ndarray) -> np.ndarray:
+    """(N, 5) float array [x1, y1, x2, y2, conf] as used by the explainability services"""
+    return np.column_stack([dets["xyxy"], dets["conf"]]) if len(dets) else np.empty((0, 5), np.float32)
+
+def predict_batch(imgs: List, imgsz: int = 640, conf: float = 0.25) -> Tuple[List[np.ndarray], Optional[str]]:
+    """
+    Run one detector.predict over a batch of images.
+
+    Images are PIL images (RGB) or numpy arrays (BGR, as ultralytics expects).
+    Returns one DETECTION_DTYPE structured array per input image, in input
+    order, and the version of the model that produced them.
+    """
+    out, version, _ = predict_batch_with_cams(imgs, imgsz, conf)
+    return out, version
+
+def predict_batch_with_cams(imgs: List, imgsz: int = 640, conf: float = 0.25,
+                            cam_for: Optional[List[bool]] = None) -> Tuple[List[np.ndarray], Optional[str], List[Optional[ActivationMap]]]:
+    """
+    predict_batch that also returns an EigenCAM map for every image whose
+    cam_for flag is set (None for the others). The hooked layer's output
+    is only held for batches with at least one flag, and only until the
+    maps are computed.
+    """
+    model, version = _active
+    cams: List[Optional[ActivationMap]] = [None] * len(imgs)
+    if model is None:
         # no model loaded
         print("predict called but detector is None")
-        return []
-
-    # ultralytics returns a Results object or list of Results
-    results = detector.predict(img, imgsz=imgsz, conf=conf, device='cpu')  # use cpu unless gpu available
-
-    out = []
-    for r in results:
-        boxes = getattr(r, "boxes", None)
-        if boxes is None:
-            continue
-        for i, b in enumerate(boxes):
-            # extract xyxy, conf, cls robustly
-            try:
-                xyxy = b.xyxy.tolist()[0] if hasattr(b.xyxy, "tolist") else [float(x) for x in b.xyxy]
-            except Exception:
-                # fallback if xyxy is a tensor or list
-                xyxy = [float(x) for x in getattr(b, "xyxy", [0,0,0,0])]
+        return [empty_detections() for _ in imgs], version, cams
+    if not imgs:
+        return [], version, cams
+
+    wanted = bool(cam_for) and any(cam_for) and getattr(model, "_cam_layer", None) is not None
+    _cam_local.wanted = wanted
+    try:
+        # a list source makes ultralytics run the images as a single batch
+        results = model.predict(list(imgs), imgsz=imgsz, conf=conf, device='cpu', verbose=False)  # use cpu unless gpu available
+        activations = getattr(_cam_local, "activations", None) if wanted else None
+        if activations is not None and len(activations) == len(imgs):
+            for i, flag in enumerate(cam_for):
+                if flag:
+                    cams[i] = eigencam(activations[i], _cam_local.input_hw, model._cam_layer)
+    finally:
+        _cam_local.wanted = False
+        _cam_local.activations = None
+    if results and not class_names():
+        register_class_names(getattr(results[0], "names", None))
+
+    out = [_result_to_array(r) for r in results]
+    print(f"predict_batch -> batch of {len(imgs)}, found {sum(len(d) for d in out)} preds")
+    return out, version, cams
+
+def predict_arrays(imgs: List, imgsz: int = 640, conf: float = 0.25) -> List[np.ndarray]:
+    """predict_batch without the model version"""
+    return predict_batch(imgs, imgsz=imgsz, conf=conf)[0]
+
+def predict_pil_images(imgs: List, imgsz: int = 640, conf: float = 0.25) -> List[List[Dict]]:
+    """Batch predict returning prediction dicts (see detections_to_dicts)"""
+    return [detections_to_dicts(d) for d in predict_arrays(imgs, imgsz=imgsz, conf=conf)]
+
+def predict_pil_image(img: Image.Image, imgsz: int = 640, conf: float = 0.25) -> List[Dict]:
+    """
+    Returns a list of dicts:
+      { id, class_id, class_name, score, bbox: [x1,y1,x2,y2] }
+    """
+    return predict_pil_images([img], imgsz=imgsz, conf=conf)[0]
+
+# ============================================================================
+# MICRO-BATCHING SCHEDULER
+# ============================================================================
+
+@dataclass
+class _PendingRequest:
+    img: Image.Image
+    imgsz: int
+    conf: float
+    future: asyncio.Future
+    capture: bool = False
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+class BatchScheduler:
+    """
+    Collects concurrent predict requests into batches.
+
+    A batch is closed when it reaches ``max_batch_size`` or when the oldest
+    request has waited ``max_wait_ms``. Requests with different imgsz/conf
+    settings are split into separate predict calls.
+
+    Batches run in-process on ``executor`` one at a time, or on a
+    ``model_workers.WorkerPool`` with one batch in flight per worker.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = None
+        self._worker_pool = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def queue_depth(self) -> int:
+        """Requests waiting to be put into a batch"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self, executor=None, worker_pool=None):
+        """
+        Start the batching loop.
+
+        Inference runs on ``worker_pool`` if given, otherwise on ``executor``
+        (the default thread pool if None).
+        """
+        if self.running:
+            return
+        self._executor = executor
+        self._worker_pool = worker_pool
+        self._slots = asyncio.Semaphore(worker_pool.size if worker_pool else 1)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        print(f"✅ Batch scheduler started (max_batch={self.max_batch_size}, max_wait={self.max_wait_ms}ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        # fail anything still waiting so callers don't hang
+        while self._queue is not None and not self._queue.empty():
+            pending = self._queue.get_nowait()
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("Batch scheduler stopped"))
+        print("🔒 Batch scheduler stopped")
+
+    async def submit(self, img: Image.Image, imgsz: int = 640, conf: float = 0.25) -> np.ndarray:
+        """Queue one image and wait for its detections (DETECTION_DTYPE array)"""
+        if not self.running:
+            # scheduler not started (e.g. scripts) - predict directly
+            results, version, cams = await asyncio.to_thread(
+                predict_batch_with_cams, [img], imgsz, conf, [_capture_activations.get()]
+            )
+            _request_model_version.set(version)
+            _request_activation.set(cams[0])
+            return results[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingRequest(img, imgsz, conf, future, _capture_activations.get()))
+        preds, version, activation = await future
+        _request_model_version.set(version)
+        _request_activation.set(activation)
+        return preds
+
+    async def submit_many(self, imgs: List, imgsz: int = 640, conf: float = 0.25) -> List[np.ndarray]:
+        """Queue several images at once so they land in the same batch(es)"""
+        if not self.running:
+            results, version = await asyncio.to_thread(predict_batch, list(imgs), imgsz, conf)
+            _request_model_version.set(version)
+            return results
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for img in imgs:
+            future = loop.create_future()
+            futures.append(future)
+            self._queue.put_nowait(_PendingRequest(img, imgsz, conf, future))
+        done = await asyncio.gather(*futures)
+        # a swap can land between batches; report the version that served the last one
+        _request_model_version.set(done[-1][1] if done else None)
+        # tiles don't map onto one image; no EigenCAM for multi-image submissions
+        _request_activation.set(None)
+        return [preds for preds, _, _ in done]
+
+    async def submit_tiled(self, img: Image.Image, imgsz: int = 640, conf: float = 0.25) -> np.ndarray:
+        """
+        Sliced inference for large images.
+
+        Overlapping tiles plus one full-image pass run as one batch; tile boxes
+        are mapped back to original coordinates and merged with cross-tile NMS.
+        """
+        windows = tiling.tile_windows(*img.size)
+        crops = [img.crop(window) for window in windows]
+        *per_tile, full = await self.submit_many(crops + [img], imgsz=imgsz, conf=conf)
+        merged = tiling.merge_tile_detections(per_tile, windows, full_image=full)
+        print(f"submit_tiled -> {len(windows)} tiles, {len(merged)} preds after merge")
+        return merged
+
+    async def _collect_batch(self) -> List[_PendingRequest]:
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            # take whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
             try:
-                score = float(b.conf.tolist()[0]) if hasattr(b.conf, "tolist") else float(b.conf)
-            except Exception:
-                score = float(getattr(b, "conf", 0.0))
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # wait for a free slot first so requests keep accumulating while busy
+            await self._slots.acquire()
             try:
-                cls_id = int(b.cls.tolist()[0]) if hasattr(b.cls, "tolist") else int(b.cls)
-            except Exception:
-                cls_id = int(getattr(b, "cls", 0))
-            class_name = detector.model.names[cls_id] if getattr(detector, "model", None) and hasattr(detector.model, "names") and cls_id in detector.model.names else str(cls_id)
-            out.append({
-                "id": f"{i}",
-                "class_id": cls_id,
-                "class_name": class_name,
-                "score": score,
-                "bbox": [xyxy[0], xyxy[1], xyxy[2], xyxy[3]],
-            })
-    print(f"predict_pil_image -> found {len(out)} preds")
-    return out
+                batch = await self._collect_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._execute(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _predict(self, imgs: List, imgsz: int, conf: float,
+                       cam_for: List[bool]) -> Tuple[List[np.ndarray], Optional[str], List[Optional[ActivationMap]]]:
+        if self._worker_pool is not None:
+            # activations stay in the worker process; callers fall back to box heatmaps
+            results, version = await self._worker_pool.predict(imgs, imgsz=imgsz, conf=conf)
+            return results, version, [None] * len(imgs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, predict_batch_with_cams, imgs, imgsz, conf, cam_for)
+
+    async def swap_model(self, weights: str, warmup_runs: int = 3) -> str:
+        """
+        Load new weights, warm them up and install them without pausing traffic.
+
+        In-process, the new model is built on a background thread while the
+        old one keeps serving, then swapped in with one assignment; batches
+        already running finish on the old model. With a worker pool the
+        weights are exported here once and rolled through the workers.
+        Returns the new model version.
+        """
+        if self._worker_pool is not None:
+            path = await asyncio.to_thread(resolve_weights, weights)
+            version = weights_version(weights)
+            await self._worker_pool.swap(path, version, warmup_runs)
+            set_serving_version(weights, version)
+            return version
+
+        def _load():
+            model = load_detector(weights)
+            warm_up(model, warmup_runs)
+            return model
+
+        model = await asyncio.to_thread(_load)
+        return install_model(model, weights)
+
+    async def _execute(self, batch: List[_PendingRequest]):
+        try:
+            groups: Dict[tuple, List[_PendingRequest]] = {}
+            for pending in batch:
+                groups.setdefault((pending.imgsz, pending.conf), []).append(pending)
+
+            for (imgsz, conf), items in groups.items():
+                started = time.perf_counter()
+                for pending in items:
+                    queue_wait_hist.observe((started - pending.enqueued_at) * 1000)
+                batch_size_hist.observe(len(items))
+
+                try:
+                    results, version, cams = await self._predict(
+                        [p.img for p in items], imgsz, conf, [p.capture for p in items]
+                    )
+                except Exception as e:
+                    print(f"❌ Batch inference failed: {e}")
+                    for pending in items:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                    continue
+                finally:
+                    batch_latency_hist.observe((time.perf_counter() - started) * 1000)
+
+                for pending, preds, cam in zip(items, results, cams):
+                    if not pending.future.done():
+                        pending.future.set_result((preds, version, cam))
+        finally:
+            self._slots.release()
+
+scheduler = BatchScheduler()
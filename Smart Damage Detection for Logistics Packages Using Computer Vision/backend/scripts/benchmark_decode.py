@@ -0,0 +1,88 @@
+# scripts/benchmark_decode.py
+"""
+Decode time and peak memory for large uploads: the old full-resolution
+Pillow chain vs the reduced-resolution decode (services/decoding.py).
+
+Each variant runs in a fresh spawned process so its peak RSS (ru_maxrss)
+isn't polluted by the other; the reported memory is the peak increase
+over the process baseline after the upload bytes are loaded.
+
+Without --image a synthetic 12MP (4000x3000) JPEG is generated.
+
+Usage (from backend):
+    python scripts/benchmark_decode.py --image path/to/12mp.jpg --runs 10
+"""
+import argparse
+import io
+import multiprocessing as mp
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+APP_DIR = str(Path(__file__).resolve().parents[1] / "app")
+
+
+def legacy_decode(data):
+    """pil_from_bytes + np.array, as detect() did before"""
+    import numpy as np
+    from PIL import Image, ImageOps
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+    return img, np.array(img), 1, img.size
+
+
+def measure(variant, data, runs, min_side, queue):
+    sys.path.insert(0, APP_DIR)
+    import os
+    os.environ["DECODE_MIN_SIDE"] = str(min_side)
+    from services import decoding
+    decode = legacy_decode if variant == "legacy" else decoding.decode
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        img, array, factor, _ = decode(data)
+        times.append((time.perf_counter() - t0) * 1000)
+        del img, array
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    queue.put((statistics.median(times), peak / 1024, factor, decode(data)[0].size))
+
+
+def synthetic_jpeg(width=4000, height=3000):
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BICUBIC)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=92)
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Large JPEG (default: synthetic 12MP)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--min-sides", type=int, nargs="+", default=[1280, 640])
+    args = parser.parse_args()
+
+    data = Path(args.image).read_bytes() if args.image else synthetic_jpeg()
+    print(f"{len(data) / 1e6:.1f} MB upload, median of {args.runs} decodes\n")
+    print(f"{'variant':<22}{'decoded size':>16}{'factor':>8}{'ms':>10}{'peak MB':>10}")
+
+    ctx = mp.get_context("spawn")
+    variants = [("legacy", 0)] + [("reduced", side) for side in args.min_sides]
+    for variant, side in variants:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=measure, args=(variant, data, args.runs, side, queue))
+        proc.start()
+        ms, peak_mb, factor, size = queue.get()
+        proc.join()
+        label = variant if variant == "legacy" else f"reduced (>= {side}px)"
+        print(f"{label:<22}{f'{size[0]}x{size[1]}':>16}{factor:>8}{ms:>10.1f}{peak_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# scripts/benchmark_encoding.py
+"""
+CPU time of artifact encoding per detect request, before vs after the
+single encoding stage (services/encoding.py).
+
+A request renders three full-size images (annotated, GradCAM, SHAP) and
+one crop per damage box. The old path encoded each full-size image twice
+(base64 data URL at q90 + S3 upload at q95) and each crop once at q95;
+the new path encodes every artifact once and base64s that same buffer
+for inline responses.
+
+Usage (from backend):
+    python scripts/benchmark_encoding.py --image path/to/package.jpg --boxes 3 --runs 20
+"""
+import argparse
+import base64
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+
+def legacy_request(rendered, crops):
+    """Old detect(): image_to_base64 (q90) + encode_jpeg (q95) per image"""
+    out = 0
+    for img in rendered:
+        _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        out += len(f"data:image/jpeg;base64,{base64.b64encode(buf).decode()}")
+        _, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        out += len(buf)
+    for crop in crops:
+        _, buf = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        out += len(buf)
+    return out
+
+
+def single_stage_request(encoding, rendered, crops, inline):
+    """New detect(): one encode per artifact, buffer shared with the data URL"""
+    out = 0
+    for kind, img in zip(("annotated", "gradcam", "shap"), rendered):
+        enc = encoding.encode(kind, img)
+        out += len(enc.data)
+        if inline:
+            out += len(enc.data_url())
+    for crop in crops:
+        out += len(encoding.encode("crop", crop).data)
+    return out
+
+
+def measure(fn, runs):
+    fn()  # warm-up
+    cpu = []
+    for _ in range(runs):
+        t0 = time.process_time()
+        size = fn()
+        cpu.append((time.process_time() - t0) * 1000)
+    return float(np.median(cpu)), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Package photo (default: synthetic 1920x1440)")
+    parser.add_argument("--boxes", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.image:
+        img = cv2.imread(args.image)
+    else:
+        rng = np.random.default_rng(0)
+        img = cv2.GaussianBlur(rng.integers(0, 255, (1440, 1920, 3), dtype=np.uint8), (9, 9), 0)
+    h, w = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    rendered = [
+        img.copy(),
+        cv2.addWeighted(img, 0.6, cv2.applyColorMap(gray, cv2.COLORMAP_JET), 0.4, 0),
+        cv2.addWeighted(img, 0.5, cv2.applyColorMap(gray, cv2.COLORMAP_HOT), 0.5, 0),
+    ]
+    crops = [img[h // 4:h // 4 + h // 5, (i * w) // (args.boxes + 1):(i * w) // (args.boxes + 1) + w // 6]
+             for i in range(args.boxes)]
+    print(f"{w}x{h} image, {args.boxes} crops, median of {args.runs} runs\n")
+    print(f"{'variant':<34}{'cpu ms/request':>16}{'bytes':>14}")
+
+    cpu, size = measure(lambda: legacy_request(rendered, crops), args.runs)
+    print(f"{'before (2x jpeg per image)':<34}{cpu:>16.1f}{size:>14,}")
+
+    for fmt, quality in (("jpeg", 90), ("webp", 80)):
+        os.environ["ARTIFACT_FORMAT"], os.environ["ARTIFACT_QUALITY"] = fmt, str(quality)
+        # re-read the env settings
+        encoding = importlib.reload(importlib.import_module("services.encoding"))
+        for inline in (True, False):
+            label = f"after {fmt} q{quality} ({'inline' if inline else 'url'})"
+            cpu, size = measure(lambda: single_stage_request(encoding, rendered, crops, inline), args.runs)
+            print(f"{label:<34}{cpu:>16.1f}{size:>14,}")
+
+
+if __name__ == "__main__":
+    main()
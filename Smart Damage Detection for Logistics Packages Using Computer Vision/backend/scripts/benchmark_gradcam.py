@@ -0,0 +1,92 @@
+# scripts/benchmark_gradcam.py
+"""
+GradCAM heatmap time vs image size and box count: the old full-image
+np.ogrid Gaussian per box against the windowed, downsampled version in
+services/explainability_services.py.
+
+Also reports how far the new overlay is from the old one (mean / max
+absolute difference per channel value, and the share of values more
+than 8 levels apart), so a change of GRADCAM_GRID_MAX or
+GRADCAM_WINDOW_SIGMAS can be checked for visual drift.
+
+Usage (from backend):
+    python scripts/benchmark_gradcam.py --sizes 640x480 1920x1440 4000x3000 --boxes 1 5 20 --runs 5
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from services import explainability_services as explain  # noqa: E402
+
+
+def legacy_gradcam(image_array, boxes):
+    """generate_gradcam_heatmap before vectorization (without the legend)"""
+    h, w = image_array.shape[:2]
+    heatmap = np.zeros((h, w), dtype=np.float32)
+    for x1, y1, x2, y2, conf in boxes:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cy, cx = (y1 + y2) // 2, (x1 + x2) // 2
+        sigma_x = max((x2 - x1) / 4, 1)
+        sigma_y = max((y2 - y1) / 4, 1)
+        y_coords, x_coords = np.ogrid[0:h, 0:w]
+        gaussian = np.exp(
+            -((x_coords - cx)**2 / (2 * sigma_x**2) +
+              (y_coords - cy)**2 / (2 * sigma_y**2))
+        )
+        heatmap += gaussian * conf
+    if heatmap.max() > 0:
+        heatmap = (heatmap - heatmap.min()) / (heatmap.max() - heatmap.min())
+    heatmap_colored = cv2.applyColorMap((heatmap * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    return explain.add_gradcam_legend(cv2.addWeighted(image_array, 0.6, heatmap_colored, 0.4, 0))
+
+
+def random_boxes(rng, w, h, count):
+    boxes = []
+    for _ in range(count):
+        bw, bh = rng.integers(w // 20, w // 4), rng.integers(h // 20, h // 4)
+        x1, y1 = rng.integers(0, w - bw), rng.integers(0, h - bh)
+        boxes.append([x1, y1, x1 + bw, y1 + bh, rng.uniform(0.3, 0.95)])
+    return np.array(boxes, dtype=np.float32)
+
+
+def median_ms(fn, runs):
+    fn()  # warm-up
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1920x1440", "4000x3000"])
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"grid max {explain.GRADCAM_GRID_MAX}, window {explain.GRADCAM_WINDOW_SIGMAS} sigma, median of {args.runs} runs\n")
+    print(f"{'image':>10}{'boxes':>7}{'before ms':>11}{'after ms':>10}{'speedup':>9}{'mean diff':>11}{'max diff':>10}{'>8 lvl':>9}")
+    for size in args.sizes:
+        w, h = (int(v) for v in size.split("x"))
+        image = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (9, 9), 0)
+        for count in args.boxes:
+            boxes = random_boxes(rng, w, h, count)
+            before = median_ms(lambda: legacy_gradcam(image, boxes), args.runs)
+            after = median_ms(lambda: explain.generate_gradcam_heatmap(image, boxes), args.runs)
+            diff = np.abs(legacy_gradcam(image, boxes).astype(np.int16)
+                          - explain.generate_gradcam_heatmap(image, boxes).astype(np.int16))
+            print(f"{size:>10}{count:>7}{before:>11.1f}{after:>10.1f}{before / after:>8.1f}x"
+                  f"{diff.mean():>11.2f}{diff.max():>10}{(diff > 8).mean() * 100:>8.2f}%")
+
+
+if __name__ == "__main__":
+    main()
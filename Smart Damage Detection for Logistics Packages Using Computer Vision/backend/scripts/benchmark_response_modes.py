@@ -0,0 +1,108 @@
+# scripts/benchmark_response_modes.py
+"""
+Bytes on the wire and latency of the /api/detect image modes.
+
+For each image_mode (inline, url, multipart) the same image is posted
+--requests times. A few random bytes are appended after the JPEG end
+marker on every request so the result cache never answers. Reported per
+mode:
+
+  detect bytes  size of the /api/detect response body
+  image bytes   url mode only: the three images fetched afterwards
+  detect ms     time to the complete /api/detect response
+  ready ms      time until the client has the JSON and every image
+
+Usage:
+    python scripts/benchmark_response_modes.py --image path/to/package.jpg \
+        --url http://localhost:8000 --requests 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+
+IMAGE_FIELDS = ("annotated_image_url", "gradcam_url", "shap_url")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+
+async def login(client, username, password):
+    r = await client.post("/api/auth/login", json={"username": username, "password": password})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def one_request(client, headers, image_bytes, filename, mode):
+    payload = image_bytes + os.urandom(8)  # defeats the result cache
+    t0 = time.perf_counter()
+    r = await client.post(
+        "/api/detect",
+        headers=headers,
+        params={"image_mode": mode},
+        files={"file": (filename, payload, "image/jpeg")},
+    )
+    r.raise_for_status()
+    detect_ms = (time.perf_counter() - t0) * 1000
+    detect_bytes = len(r.content)
+
+    image_bytes_fetched = 0
+    if mode == "url":
+        body = r.json()
+        urls = [body[f] for f in IMAGE_FIELDS if body.get(f)]
+        fetched = await asyncio.gather(*(client.get(u) for u in urls))
+        for resp in fetched:
+            resp.raise_for_status()
+            image_bytes_fetched += len(resp.content)
+    ready_ms = (time.perf_counter() - t0) * 1000
+    return detect_bytes, image_bytes_fetched, detect_ms, ready_ms
+
+
+async def run(args):
+    image_bytes = Path(args.image).read_bytes()
+    async with httpx.AsyncClient(base_url=args.url, timeout=180, follow_redirects=True) as client:
+        token = await login(client, args.username, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # warm-up so model load / first-call costs don't land on one mode
+        await one_request(client, headers, image_bytes, Path(args.image).name, "inline")
+
+        print(f"{'mode':<11}{'detect bytes':>14}{'image bytes':>13}{'total bytes':>13}"
+              f"{'detect p50':>12}{'detect p95':>12}{'ready p50':>11}")
+        baseline = None
+        for mode in args.modes:
+            samples = [
+                await one_request(client, headers, image_bytes, Path(args.image).name, mode)
+                for _ in range(args.requests)
+            ]
+            detect_b = statistics.mean(s[0] for s in samples)
+            image_b = statistics.mean(s[1] for s in samples)
+            detect_ms = [s[2] for s in samples]
+            ready_ms = [s[3] for s in samples]
+            total_b = detect_b + image_b
+            baseline = baseline or total_b
+            print(f"{mode:<11}{detect_b:>14,.0f}{image_b:>13,.0f}{total_b:>13,.0f}"
+                  f"{percentile(detect_ms, 0.5):>10.1f}ms{percentile(detect_ms, 0.95):>10.1f}ms"
+                  f"{percentile(ready_ms, 0.5):>9.1f}ms   ({total_b / baseline:.2f}x bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=["inline", "url", "multipart"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# scripts/benchmark_shap.py
+"""
+SHAP-style importance map time for 1, 10 and 50 boxes: the old per-row
+fade loop and per-row legend rectangles against the vectorized fade and
+cached legend bar in services/explainability_services.py.
+
+The outputs are compared too; the two versions should agree to within
+one level per channel value (float32 summation order only).
+
+Usage (from backend):
+    python scripts/benchmark_shap.py --size 1920x1440 --boxes 1 10 50 --runs 10
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from services import explainability_services as explain  # noqa: E402
+
+
+def legacy_shap_legend(image, importance_map):
+    """add_shap_legend before the cached bar: one rectangle per row"""
+    h, w = image.shape[:2]
+    bar_width, bar_height = 30, 200
+    bar_x, bar_y = w - bar_width - 20, 60
+    if bar_x < 0 or bar_y + bar_height > h:
+        return image
+    cv2.putText(image, 'SHAP - Feature Importance', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    gradient = np.linspace(1, 0, bar_height).astype(np.float32)
+    for i in range(bar_height):
+        v = gradient[i]
+        cv2.rectangle(image, (bar_x, bar_y + i), (bar_x + bar_width, bar_y + i + 1),
+                      (int((1 - v) * 100), 0, int(v * 255)), -1)
+    cv2.rectangle(image, (bar_x, bar_y), (bar_x + bar_width, bar_y + bar_height), (255, 255, 255), 2)
+    for text, y in (('High', bar_y + 10), ('Impact', bar_y + 25), ('Low', bar_y + bar_height - 5)):
+        cv2.putText(image, text, (bar_x + bar_width + 5, y), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    stats_y = min(bar_y + bar_height + 30, h - 30)
+    cv2.putText(image, f'Avg: {np.mean(importance_map):.2f}', (bar_x - 50, stats_y), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    cv2.putText(image, f'Max: {np.max(importance_map):.2f}', (bar_x - 50, stats_y + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    return image
+
+
+def legacy_shap(image_array, boxes):
+    """generate_shap_explanation before vectorization -> (image, importance map)"""
+    h, w = image_array.shape[:2]
+    importance_map = np.zeros((h, w), dtype=np.float32)
+    for x1, y1, x2, y2, conf in boxes:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        importance_map[y1:y2, x1:x2] += conf
+        border_size = 20
+        for i in range(border_size):
+            fade = 1.0 - (i / border_size)
+            importance_map[max(0, y1 - i), x1:x2] += conf * fade * 0.3
+            importance_map[min(h - 1, y2 + i), x1:x2] += conf * fade * 0.3
+            importance_map[y1:y2, max(0, x1 - i)] += conf * fade * 0.3
+            importance_map[y1:y2, min(w - 1, x2 + i)] += conf * fade * 0.3
+    if importance_map.max() > 0:
+        importance_map = importance_map / importance_map.max()
+    colored_map = np.zeros_like(image_array, dtype=np.uint8)
+    colored_map[:, :, 2] = (importance_map * 255).astype(np.uint8)
+    colored_map[:, :, 0] = ((1 - importance_map) * 100).astype(np.uint8)
+    blended = cv2.addWeighted(image_array, 0.5, colored_map, 0.5, 0)
+    return legacy_shap_legend(blended, importance_map), importance_map
+
+
+def random_boxes(rng, w, h, count):
+    boxes = []
+    for _ in range(count):
+        bw, bh = rng.integers(w // 30, w // 5), rng.integers(h // 30, h // 5)
+        x1, y1 = rng.integers(0, w - bw), rng.integers(0, h - bh)
+        boxes.append([x1, y1, x1 + bw, y1 + bh, rng.uniform(0.3, 0.95)])
+    return np.array(boxes, dtype=np.float32)
+
+
+def median_ms(fn, runs):
+    fn()  # warm-up
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="1920x1440")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    w, h = (int(v) for v in args.size.split("x"))
+    image = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (9, 9), 0)
+    print(f"{w}x{h} image, median of {args.runs} runs\n")
+    print(f"{'boxes':>6}{'before ms':>11}{'after ms':>10}{'speedup':>9}{'max map diff':>14}{'max pixel diff':>16}")
+    for count in args.boxes:
+        boxes = random_boxes(rng, w, h, count)
+        before = median_ms(lambda: legacy_shap(image, boxes), args.runs)
+        after = median_ms(lambda: explain.generate_shap_explanation(image, boxes), args.runs)
+        legacy_image, legacy_map = legacy_shap(image, boxes)
+        pixel_diff = np.abs(legacy_image.astype(np.int16) - explain.generate_shap_explanation(image, boxes).astype(np.int16)).max()
+        new_map = np.zeros((h, w), dtype=np.float32)
+        for x1, y1, x2, y2, conf in boxes:
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            new_map[y1:y2, x1:x2] += conf
+            explain._add_edge_fade(new_map, x1, y1, x2, y2, conf)
+        new_map /= new_map.max()
+        print(f"{count:>6}{before:>11.1f}{after:>10.1f}{before / after:>8.1f}x{np.abs(legacy_map - new_map).max():>14.2e}{pixel_diff:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# scripts/benchmark_tiling.py
+"""
+Recall vs. latency of tiled inference on large images.
+
+Each labelled image is upscaled by --scale (default 4x, ~12MP from the
+640px dataset images) to mimic dock-camera photos, then run once through
+plain imgsz inference and once through tiled inference for every tile
+size in --tile-sizes. Recall is measured against the YOLO labels at
+IoU >= --iou.
+
+Usage (from backend/app):
+    python ../scripts/benchmark_tiling.py \
+        --split "../../Damage-Detection-for-Packages-1/test" --tile-sizes 768 1024 1536
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from services import tiling, yolo_service  # noqa: E402
+
+
+def load_labels(label_path, width, height):
+    boxes = []
+    if not label_path.exists():
+        return np.empty((0, 5))
+    for line in label_path.read_text().splitlines():
+        parts = line.split()
+        if len(parts) != 5:
+            continue
+        cls, xc, yc, bw, bh = map(float, parts)
+        boxes.append([cls,
+                      (xc - bw / 2) * width, (yc - bh / 2) * height,
+                      (xc + bw / 2) * width, (yc + bh / 2) * height])
+    return np.array(boxes) if boxes else np.empty((0, 5))
+
+
+def matched(gt, dets, iou_thresh):
+    hits = 0
+    for cls, x1, y1, x2, y2 in gt:
+        cand = dets[dets["cls"] == int(cls)]["xyxy"]
+        if len(cand) == 0:
+            continue
+        iw = np.clip(np.minimum(x2, cand[:, 2]) - np.maximum(x1, cand[:, 0]), 0, None)
+        ih = np.clip(np.minimum(y2, cand[:, 3]) - np.maximum(y1, cand[:, 1]), 0, None)
+        inter = iw * ih
+        union = (x2 - x1) * (y2 - y1) + (cand[:, 2] - cand[:, 0]) * (cand[:, 3] - cand[:, 1]) - inter
+        if (inter / np.maximum(union, 1e-9)).max() >= iou_thresh:
+            hits += 1
+    return hits
+
+
+async def run(args):
+    yolo_service.init_model()
+    # not started: each submit runs its images as one direct predict batch
+    scheduler = yolo_service.BatchScheduler()
+
+    split = Path(args.split)
+    samples = []
+    for img_path in sorted((split / "images").iterdir()):
+        img = Image.open(img_path).convert("RGB")
+        big = img.resize((img.width * args.scale, img.height * args.scale), Image.BICUBIC)
+        gt = load_labels(split / "labels" / (img_path.stem + ".txt"), big.width, big.height)
+        samples.append((big, gt))
+    total_gt = sum(len(gt) for _, gt in samples)
+    print(f"{len(samples)} images at {samples[0][0].size if samples else '-'} px, {total_gt} labelled boxes\n")
+
+    modes = [("plain", None)] + [(f"tiled {t}px", t) for t in args.tile_sizes]
+    print(f"{'mode':<16}{'recall':>10}{'ms/image':>12}{'tiles/image':>14}")
+    for name, tile in modes:
+        hits, elapsed, tiles = 0, 0.0, 0
+        for big, gt in samples:
+            t0 = time.perf_counter()
+            if tile is None:
+                dets = await scheduler.submit(big, imgsz=args.imgsz, conf=args.conf)
+            else:
+                tiling.TILE_SIZE = tile
+                tiles += len(tiling.tile_windows(*big.size))
+                dets = await scheduler.submit_tiled(big, imgsz=args.imgsz, conf=args.conf)
+            elapsed += time.perf_counter() - t0
+            hits += matched(gt, dets, args.iou)
+        recall = hits / total_gt if total_gt else float("nan")
+        print(f"{name:<16}{recall:>10.3f}{elapsed * 1000 / len(samples):>12.1f}{tiles / len(samples):>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--split", required=True, help="Dataset split folder with images/ and labels/")
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--tile-sizes", type=int, nargs="+", default=[768, 1024, 1536])
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# scripts/check_backend_parity.py
+"""
+Parity check between the torch backend and an exported backend.
+
+Runs both backends over a folder of images through yolo_service's own
+post-processing and checks that every torch detection has a match in the
+other backend with the same class, IoU >= --min-iou and a score within
+--score-tol. Exits non-zero on any mismatch, and also when the torch
+reference finds no boxes at all (nothing would have been compared).
+
+Usage (from backend/app):
+    python ../scripts/check_backend_parity.py --backend onnx \
+        --images "../../Damage-Detection-for-Packages-1/valid/images"
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from ultralytics import YOLO  # noqa: E402
+from services import yolo_service  # noqa: E402
+
+
+def iou(a, b):
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def run_backend(backend, weights, images, imgsz, conf):
+    path = yolo_service.resolve_weights(weights, backend)
+    # predict_batch reads the installed (model, version) pair, not yolo_service.detector
+    version = yolo_service.install_model(YOLO(path, task="detect"), weights, yolo_service.weights_version(weights, backend))
+    print(f"Loaded {path} ({version})")
+    preds, elapsed = [], 0.0
+    for img in images:
+        t0 = time.perf_counter()
+        preds.append(yolo_service.predict_pil_image(img, imgsz=imgsz, conf=conf))
+        elapsed += time.perf_counter() - t0
+    return preds, elapsed * 1000 / max(1, len(images))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=yolo_service.YOLO_WEIGHTS)
+    parser.add_argument("--backend", default="onnx", choices=sorted(yolo_service.BACKEND_EXPORTS))
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--min-iou", type=float, default=0.95)
+    parser.add_argument("--score-tol", type=float, default=0.02)
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in {".jpg", ".jpeg", ".png"})
+    images = [Image.open(p).convert("RGB") for p in paths]
+    if not images:
+        print(f"❌ No images found in {args.images}")
+        sys.exit(1)
+    print(f"Comparing torch vs {args.backend} on {len(images)} images")
+
+    torch_preds, torch_ms = run_backend("torch", args.weights, images, args.imgsz, args.conf)
+    other_preds, other_ms = run_backend(args.backend, args.weights, images, args.imgsz, args.conf)
+    reference_boxes = sum(len(ref) for ref in torch_preds)
+    if reference_boxes == 0:
+        print(f"❌ torch found no boxes on {len(images)} images at conf {args.conf}: nothing to compare "
+              "(model not loaded, wrong weights or --conf too high)")
+        sys.exit(1)
+
+    failures = 0
+    for path, ref, cand in zip(paths, torch_preds, other_preds):
+        if ref and cand and set(ref[0]) != set(cand[0]):
+            print(f"❌ {path.name}: result dict keys differ")
+            failures += 1
+        if len(ref) != len(cand):
+            print(f"❌ {path.name}: {len(ref)} torch detections vs {len(cand)} {args.backend}")
+            failures += 1
+            continue
+        for r in ref:
+            match = max(
+                (c for c in cand if c["class_id"] == r["class_id"]),
+                key=lambda c: iou(r["bbox"], c["bbox"]),
+                default=None,
+            )
+            if match is None or iou(r["bbox"], match["bbox"]) < args.min_iou:
+                print(f"❌ {path.name}: no matching {r['class_name']} box for {r['bbox']}")
+                failures += 1
+            elif abs(r["score"] - match["score"]) > args.score_tol:
+                print(f"❌ {path.name}: {r['class_name']} score {r['score']:.4f} vs {match['score']:.4f}")
+                failures += 1
+            elif match["class_name"] != r["class_name"]:
+                print(f"❌ {path.name}: class name {r['class_name']} vs {match['class_name']}")
+                failures += 1
+
+    print(f"\n{reference_boxes} torch boxes compared")
+    print(f"torch: {torch_ms:.1f} ms/image   {args.backend}: {other_ms:.1f} ms/image")
+    if failures:
+        print(f"❌ Parity check failed: {failures} mismatches")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
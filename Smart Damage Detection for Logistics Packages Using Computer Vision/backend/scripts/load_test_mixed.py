@@ -0,0 +1,117 @@
+# scripts/load_test_mixed.py
+"""
+Mixed dashboard + detect load test.
+
+Measures /api/dashboard/stats and /api/health latency twice: once on an
+idle server and once while N concurrent clients hammer /api/detect. With
+the blocking detect stages on the pipeline executors, dashboard latency
+should stay flat between the two phases.
+
+Usage:
+    python scripts/load_test_mixed.py --image path/to/package.jpg \
+        --url http://localhost:8000 --detect-clients 8 --duration 30
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+
+def report(name, samples):
+    if not samples:
+        print(f"{name:<28} no samples")
+        return
+    print(f"{name:<28} n={len(samples):<5} "
+          f"p50={percentile(samples, 0.50):7.1f}ms "
+          f"p95={percentile(samples, 0.95):7.1f}ms "
+          f"p99={percentile(samples, 0.99):7.1f}ms "
+          f"mean={statistics.mean(samples):7.1f}ms")
+
+
+async def login(client, username, password):
+    r = await client.post("/api/auth/login", json={"username": username, "password": password})
+    r.raise_for_status()
+    return r.json()["access_token"]
+
+
+async def poll_light_endpoints(client, headers, stop_at, results):
+    while time.perf_counter() < stop_at:
+        for path in ("/api/dashboard/stats", "/api/health"):
+            t0 = time.perf_counter()
+            r = await client.get(path, headers=headers)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if r.status_code == 200:
+                results.setdefault(path, []).append(elapsed)
+        await asyncio.sleep(0.05)
+
+
+async def detect_client(client, headers, image_bytes, filename, stop_at, results):
+    while time.perf_counter() < stop_at:
+        t0 = time.perf_counter()
+        r = await client.post(
+            "/api/detect",
+            headers=headers,
+            files={"file": (filename, image_bytes, "image/jpeg")},
+        )
+        elapsed = (time.perf_counter() - t0) * 1000
+        if r.status_code == 200:
+            results.setdefault("/api/detect", []).append(elapsed)
+        else:
+            results.setdefault("detect_errors", []).append(r.status_code)
+
+
+async def run_phase(args, token, image_bytes, detect_clients):
+    headers = {"Authorization": f"Bearer {token}"}
+    results = {}
+    stop_at = time.perf_counter() + args.duration
+    async with httpx.AsyncClient(base_url=args.url, timeout=120) as client:
+        tasks = [poll_light_endpoints(client, headers, stop_at, results)]
+        for _ in range(detect_clients):
+            tasks.append(detect_client(client, headers, image_bytes, Path(args.image).name, stop_at, results))
+        await asyncio.gather(*tasks)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--image", required=True)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--detect-clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    image_bytes = Path(args.image).read_bytes()
+    async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+        token = await login(client, args.username, args.password)
+
+    print(f"Phase 1: idle baseline ({args.duration:.0f}s)")
+    idle = await run_phase(args, token, image_bytes, 0)
+    print(f"Phase 2: {args.detect_clients} concurrent detect clients ({args.duration:.0f}s)")
+    loaded = await run_phase(args, token, image_bytes, args.detect_clients)
+
+    print("\n" + "=" * 80)
+    for path in ("/api/dashboard/stats", "/api/health"):
+        report(f"{path} idle", idle.get(path, []))
+        report(f"{path} under load", loaded.get(path, []))
+    report("/api/detect", loaded.get("/api/detect", []))
+    errors = loaded.get("detect_errors", [])
+    if errors:
+        print(f"detect errors: {len(errors)} (status codes: {sorted(set(errors))})")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+# scripts/quantization_report.py
+"""
+INT8 vs FP32 accuracy-regression and CPU latency report.
+
+Exports the INT8 OpenVINO model (calibrated on the valid/ split, see
+yolo_service.resolve_weights) if it does not exist yet, validates both
+models on the same split and prints per-class mAP50 / mAP50-95 plus mean
+CPU latency per image. Use it to decide whether YOLO_PRECISION=int8 is
+worth its accuracy cost on an edge station.
+
+Usage (from backend/app):
+    python ../scripts/quantization_report.py \
+        --data "../../Damage-Detection-for-Packages-1/data.yaml" --out int8_report.md
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+from ultralytics import YOLO  # noqa: E402
+from services import yolo_service  # noqa: E402
+
+CLASSES = ["crushed", "dented", "torn", "undamaged", "wet"]
+
+
+def per_class_map(model, data_yaml, imgsz):
+    metrics = model.val(data=data_yaml, split="val", imgsz=imgsz, batch=1, device="cpu", plots=False, verbose=False)
+    names = metrics.names
+    out = {}
+    for i, cls_idx in enumerate(metrics.box.ap_class_index):
+        out[names[int(cls_idx)]] = (float(metrics.box.ap50[i]), float(metrics.box.maps[int(cls_idx)]))
+    out["all"] = (float(metrics.box.map50), float(metrics.box.map))
+    return out
+
+
+def mean_latency_ms(model, images, imgsz, warmup=2, repeats=3):
+    for img in images[:warmup]:
+        model.predict(img, imgsz=imgsz, device="cpu", verbose=False)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        for img in images:
+            model.predict(img, imgsz=imgsz, device="cpu", verbose=False)
+    return (time.perf_counter() - t0) * 1000 / max(1, repeats * len(images))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default=yolo_service.YOLO_WEIGHTS)
+    parser.add_argument("--data", default=yolo_service.INT8_CALIBRATION_DATA)
+    parser.add_argument("--imgsz", type=int, default=int(os.getenv("IMG_SZ", 640)))
+    parser.add_argument("--out", help="Write the markdown report to this file")
+    args = parser.parse_args()
+
+    yolo_service.INT8_CALIBRATION_DATA = args.data
+    data_yaml = yolo_service.calibration_data_yaml(args.data)
+    try:
+        fp32_path = args.weights
+        int8_path = yolo_service.resolve_weights(args.weights, precision="int8")
+        fp32 = YOLO(fp32_path, task="detect")
+        int8 = YOLO(int8_path, task="detect")
+
+        print("Validating FP32...")
+        fp32_map = per_class_map(fp32, data_yaml, args.imgsz)
+        print("Validating INT8...")
+        int8_map = per_class_map(int8, data_yaml, args.imgsz)
+
+        valid_dir = Path(args.data).resolve().parent / "valid" / "images"
+        images = [Image.open(p).convert("RGB") for p in sorted(valid_dir.iterdir())
+                  if p.suffix.lower() in {".jpg", ".jpeg", ".png"}]
+        fp32_ms = mean_latency_ms(fp32, images, args.imgsz)
+        int8_ms = mean_latency_ms(int8, images, args.imgsz)
+    finally:
+        os.remove(data_yaml)
+
+    lines = [
+        "# INT8 quantization report",
+        "",
+        f"- FP32 weights: `{fp32_path}`",
+        f"- INT8 model: `{int8_path}`",
+        f"- Calibration / validation images: {len(images)} (`{valid_dir}`)",
+        f"- imgsz: {args.imgsz}",
+        "",
+        "| class | FP32 mAP50 | INT8 mAP50 | FP32 mAP50-95 | INT8 mAP50-95 | Δ mAP50-95 |",
+        "|---|---|---|---|---|---|",
+    ]
+    for name in CLASSES + ["all"]:
+        f50, f5095 = fp32_map.get(name, (float("nan"), float("nan")))
+        i50, i5095 = int8_map.get(name, (float("nan"), float("nan")))
+        lines.append(f"| {name} | {f50:.3f} | {i50:.3f} | {f5095:.3f} | {i5095:.3f} | {i5095 - f5095:+.3f} |")
+    lines += [
+        "",
+        "| model | CPU latency (ms/image) | speed-up |",
+        "|---|---|---|",
+        f"| FP32 (torch) | {fp32_ms:.1f} | 1.00x |",
+        f"| INT8 (OpenVINO) | {int8_ms:.1f} | {fp32_ms / int8_ms:.2f}x |",
+    ]
+    report = "\n".join(lines)
+    print("\n" + report)
+    if args.out:
+        Path(args.out).write_text(report + "\n")
+        print(f"\nReport written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
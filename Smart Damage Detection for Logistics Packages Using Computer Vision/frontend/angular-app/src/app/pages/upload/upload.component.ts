@@ -4,6 +4,7 @@ import { HttpClient, HttpClientModule, HttpHeaders } from '@angular/common/http'
 import { firstValueFrom } from 'rxjs';
 import { Dashboard3DBackgroundComponent } from '../dashboard/dashboard-3d-background.component';
 import { AuthService } from '../../services/auth.service';
+import { DetectService } from '../../services/detect.service';
 
 interface DetectedDamage {
   id: number;
@@ -21,6 +22,7 @@ interface DetectionResponse {
   annotated_image_url: string;
   gradcam_url?: string;
   shap_url?: string;
+  explanation_status?: string | null;
   total_damages: number;
   severity_counts: {
     severe: number;
@@ -2475,6 +2477,7 @@ primaryExplanation: { what: string; why: string; cause: string; recommendation:
   constructor(
     private http: HttpClient,
     private authService: AuthService,
+    private detectService: DetectService,
     @Inject(PLATFORM_ID) private platformId: Object
   ) {
     this.isBrowser = isPlatformBrowser(this.platformId);
@@ -2552,9 +2555,6 @@ console.log('✅ Starting detection process...');
     this.hasDetections = false;
     this.errorMessage = null;
 
-    const formData = new FormData();
-    formData.append('file', this.selectedFile);
-
     const progressInterval = setInterval(() => {
       if (this.processingProgress < 90) {
         this.processingProgress += 10;
@@ -2573,18 +2573,14 @@ console.log('✅ Starting detection process...');
     });
 
     console.log('🚀 Sending POST to:', `${this.apiUrl}/detect`);
-    console.log('📦 FormData contains:', this.selectedFile.name);
+    console.log('📦 Uploading:', this.selectedFile.name);
     
     const startTime = Date.now();
     
-    // Make the request
-    const response$ = this.http.post<DetectionResponse>(
-      `${this.apiUrl}/detect`, 
-      formData, 
-      { headers }
-    );
+    // Make the request - images come back as short-lived signed URLs, not base64
+    const response$ = this.detectService.detect(this.selectedFile, undefined, 'url', headers);
     
-    this.detectionResult = await firstValueFrom(response$);
+    this.detectionResult = await firstValueFrom(response$) as DetectionResponse;
     
     // DEBUG: Log the full response
     console.log('🔍 FULL DETECTION RESULT:', this.detectionResult);
@@ -2595,6 +2591,16 @@ console.log('✅ Starting detection process...');
     this.primaryDamage = this.getPrimaryDamage();
     this.primaryExplanation = this.getOperatorExplanation(this.primaryDamage?.class_name || '');
 
+    // Deferred GradCAM/SHAP: show the explainability tab once the job is done
+    if (this.detectionResult.explanation_status === 'queued') {
+      const trackingCode = this.detectionResult.tracking_code;
+      this.detectService.pollExplanations(this.detectionResult as any, headers).subscribe(updated => {
+        if (this.detectionResult?.tracking_code === trackingCode) {
+          this.detectionResult = { ...this.detectionResult, gradcam_url: updated.gradcam_url, shap_url: updated.shap_url, explanation_status: 'done' };
+        }
+      });
+    }
+
     console.log('Primary damage (cached):', this.primaryDamage);
     console.log('Primary explanation (cached):', this.primaryExplanation);
     
@@ -5,8 +5,15 @@
  */
 
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { HttpClient, HttpHeaders } from '@angular/common/http';
+import { Observable, filter, map, switchMap, take, takeWhile, timer } from 'rxjs';
+
+/**
+ * How the backend returns annotated / GradCAM / SHAP images:
+ * 'url' gives short-lived signed /api/artifacts links (small JSON),
+ * 'inline' embeds base64 data URLs (legacy, ~1/3 larger).
+ */
+export type ImageMode = 'inline' | 'url';
 
 export interface Detection {
   id: number;
@@ -31,6 +38,7 @@ export interface DetectionResponse {
     moderate: number;
     minor: number;
   };
+  // data URL (inline mode) or signed artifact URL (url mode)
   annotated_image_url: string;
   original_s3_url?: string;
   annotated_s3_url?: string;
@@ -38,6 +46,9 @@ export interface DetectionResponse {
   gradcam_s3_url?: string;
   shap_url?: string;
   shap_s3_url?: string;
+  // EXPLAIN_MODE=deferred: GradCAM/SHAP arrive later (see pollExplanations)
+  explanation_status?: string | null;
+  explanations_url?: string | null;
   image_width: number;
   image_height: number;
   inference_time_ms: number;
@@ -49,11 +60,12 @@ export interface DetectionResponse {
   providedIn: 'root'
 })
 export class DetectService {
-  private apiUrl = 'http://localhost:8000/api';
+  private apiOrigin = 'http://localhost:8000';
+  private apiUrl = `${this.apiOrigin}/api`;
 
   constructor(private http: HttpClient) {}
 
-  detect(file: File, trackingCode?: string): Observable<DetectionResponse> {
+  detect(file: File, trackingCode?: string, imageMode: ImageMode = 'url', headers?: HttpHeaders): Observable<DetectionResponse> {
     const formData = new FormData();
     formData.append('file', file);
     
@@ -63,7 +75,40 @@ export class DetectService {
     
     console.log('🔍 Uploading image for detection...');
     
-    return this.http.post<DetectionResponse>(`${this.apiUrl}/detect`, formData);
+    return this.http.post<DetectionResponse>(`${this.apiUrl}/detect`, formData, {
+      headers,
+      params: { image_mode: imageMode }
+    }).pipe(map(response => this.resolveImageUrls(response)));
+  }
+
+  /**
+   * Signed artifact URLs are server-relative (/api/artifacts/...);
+   * make them absolute so they can be bound to <img [src]> directly.
+   */
+  resolveImageUrls(response: DetectionResponse): DetectionResponse {
+    const resolve = (url?: string) => (url && url.startsWith('/') ? `${this.apiOrigin}${url}` : url);
+    return {
+      ...response,
+      annotated_image_url: resolve(response.annotated_image_url) || '',
+      gradcam_url: resolve(response.gradcam_url),
+      shap_url: resolve(response.shap_url)
+    };
+  }
+
+  /**
+   * Deferred explanations: poll /api/packages/{tracking_code}/explanations
+   * until the job finishes and emit the response with gradcam_url/shap_url
+   * filled in (nothing is emitted if the job fails or takes too long).
+   */
+  pollExplanations(response: DetectionResponse, headers?: HttpHeaders,
+                   intervalMs = 2000, maxAttempts = 60): Observable<DetectionResponse> {
+    return timer(intervalMs, intervalMs).pipe(
+      take(maxAttempts),
+      switchMap(() => this.http.get<any>(`${this.apiUrl}/packages/${response.tracking_code}/explanations`, { headers })),
+      takeWhile(job => job.status === 'queued' || job.status === 'running', true),
+      filter(job => job.status === 'done'),
+      map(job => this.resolveImageUrls({ ...response, explanation_status: 'done', gradcam_url: job.gradcam_url, shap_url: job.shap_url }))
+    );
   }
 
   getPackageDetails(trackingCode: string): Observable<any> {